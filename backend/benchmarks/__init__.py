@@ -0,0 +1 @@
+"""Benchmarks for the DQA backend (run from the backend directory)"""
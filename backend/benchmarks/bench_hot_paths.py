@@ -0,0 +1,140 @@
+"""Micro-benchmarks for the functions on every request's path
+
+Covers the gateway proxy (against an in-process upstream), client
+construction, the circuit breaker, log formatting, trace header parsing, and
+the user-service queries against a seeded database.
+
+    python -m benchmarks.bench_hot_paths --users 10k --output benchmarks/results/hot-10k.json
+    python -m benchmarks.bench_hot_paths --users 10k --baseline benchmarks/results/hot-10k.json
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import func
+
+from benchmarks.common import abench, add_report_arguments, bench, environment, finish_report, print_table
+from benchmarks.seed import parse_size, users_db
+from benchmarks.stack import InProcessStack
+from shared.logging_config import JSONFormatter
+from shared.tracing import mount_transport, parse_traceparent, traced_client
+from shared.utils import CircuitBreaker
+
+def echo_upstream() -> FastAPI:
+    """Minimal upstream so proxy timings exclude any service work"""
+    app = FastAPI()
+
+    @app.get("/users/{user_id}")
+    async def get_user(user_id: int):
+        return {"id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com"}
+
+    return app
+
+def bench_pure() -> Dict[str, Dict[str, float]]:
+    results = {}
+    breaker = CircuitBreaker()
+
+    def breaker_call():
+        if breaker.can_execute():
+            breaker.on_success()
+
+    results["CircuitBreaker can_execute+on_success"] = bench(breaker_call, 100_000)
+
+    record = logging.LogRecord("main-api", logging.INFO, __file__, 1, "GET /api/users/1", None, None)
+    record.request_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+    formatter = JSONFormatter()
+    results["JSONFormatter.format"] = bench(lambda: formatter.format(record), 20_000)
+
+    header = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    results["parse_traceparent"] = bench(lambda: parse_traceparent(header), 100_000)
+    return results
+
+async def bench_proxy(stack: InProcessStack) -> Dict[str, Dict[str, float]]:
+    gateway = stack.modules["gateway"]
+    results = {}
+
+    async def build_client():
+        await traced_client().aclose()
+
+    results["traced_client() construction"] = await abench(build_client, 20, 3)
+    results["RouteTable.match"] = bench(lambda: gateway.ROUTE_TABLE.match("GET", "/api/users/search/alice"), 100_000)
+
+    mount_transport("http://localhost:8001", httpx.ASGITransport(app=echo_upstream()))
+    shared_client = gateway.app.state.http_client
+    # Transport mounts are read when a client is built
+    gateway.app.state.http_client = traced_client()
+    try:
+        async with stack.client() as client:
+            results["gateway proxy GET /api/users/1 (echo upstream)"] = await abench(
+                lambda: client.get("/api/users/1"), 200, 3
+            )
+        async with traced_client() as client:
+            results["reused client GET (echo upstream)"] = await abench(
+                lambda: client.get("http://localhost:8001/users/1"), 200, 3
+            )
+    finally:
+        await gateway.app.state.http_client.aclose()
+        gateway.app.state.http_client = shared_client
+        mount_transport("http://localhost:8001", stack.transports["user"])
+    return results
+
+def bench_queries(user_service, user_count: int) -> Dict[str, Dict[str, float]]:
+    UserDB = user_service.UserDB
+    db = user_service.SessionLocal()
+    results = {}
+    try:
+        middle = user_count // 2
+        username = f"user{middle}"
+        results["query user by id"] = bench(lambda: db.query(UserDB).filter(UserDB.id == middle).first(), 2000, 3)
+        results["query user by username"] = bench(
+            lambda: db.query(UserDB).filter(UserDB.username == username).first(), 2000, 3
+        )
+        results["query first page (limit 100)"] = bench(lambda: db.query(UserDB).offset(0).limit(100).all(), 200, 3)
+        results["query last page (offset n-100)"] = bench(
+            lambda: db.query(UserDB).offset(user_count - 100).limit(100).all(), 20, 3
+        )
+        results["query user stats (count)"] = bench(
+            lambda: db.query(func.count(UserDB.id), func.count(UserDB.id).filter(UserDB.is_active.is_(True))).one(),
+            20, 3
+        )
+        results["query search contains"] = bench(
+            lambda: db.query(UserDB).filter(UserDB.full_name.contains("User 12345")).all(), 5, 3
+        )
+    finally:
+        db.close()
+    return results
+
+async def run(args: argparse.Namespace) -> Dict:
+    user_count = parse_size(args.users)
+    sections: Dict[str, Dict[str, Dict[str, float]]] = {"pure functions": bench_pure()}
+    async with InProcessStack(users_db(args.users)) as stack:
+        sections["gateway proxy"] = await bench_proxy(stack)
+        sections[f"user-service queries ({user_count:,} users)"] = bench_queries(stack.modules["user"], user_count)
+
+    results = {}
+    for title, section in sections.items():
+        print_table(title, section)
+        results.update(section)
+    return {
+        "benchmark": "hot_paths",
+        "environment": environment(),
+        "config": {"users": user_count},
+        "results": results,
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", default="10k", help="seeded users: 10k, 1m, 10m or a row count")
+    add_report_arguments(parser)
+    args = parser.parse_args()
+    return finish_report(args, asyncio.run(run(args)))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Micro-benchmark for the structured logging path
+
+Compares the original JSONFormatter (stdlib json, utcnow per record, fixed
+extras) with the current formatter on each available JSON backend, and shows
+the cost of a record that is sampled out before formatting.
+
+    python -m benchmarks.bench_logging
+"""
+import io
+import json
+import logging
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.common import bench, print_table
+from shared.logging_config import JSONFormatter, SamplingFilter, get_json_dumps
+
+class LegacyJSONFormatter(logging.Formatter):
+    """The formatter as it was before the fast path, kept as a baseline"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        log_entry = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno
+        }
+        for field in ("user_id", "request_id", "service"):
+            if hasattr(record, field):
+                log_entry[field] = getattr(record, field)
+        return json.dumps(log_entry)
+
+def make_record() -> logging.LogRecord:
+    record = logging.LogRecord("data-service", logging.INFO, __file__, 42, "%s %s", ("GET", "/analytics"), None)
+    record.user_id = "42"
+    record.request_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+    record.service = "data-service"
+    record.event_type = "http_request"
+    return record
+
+def main():
+    record = make_record()
+    results = {"legacy (json)": bench(lambda: LegacyJSONFormatter().format(record))}
+    legacy = LegacyJSONFormatter()
+    results["legacy (json, reused)"] = bench(lambda: legacy.format(record))
+
+    for backend in ("json", "msgspec", "orjson"):
+        try:
+            get_json_dumps(backend)
+        except ImportError:
+            print(f"  (skipping {backend}: not installed)")
+            continue
+        formatter = JSONFormatter(backend)
+        results[f"fast ({backend})"] = bench(lambda: formatter.format(record))
+
+    # Full logger call: sampled out at 1% vs. formatted and written
+    for label, rates in (("logger.info, written", None), ("logger.info, sampled 1%", {"http_request": 0.01})):
+        logger = logging.getLogger(f"bench.{label}")
+        logger.handlers[:] = []
+        logger.filters[:] = []
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = logging.StreamHandler(io.StringIO())
+        handler.setFormatter(JSONFormatter())
+        logger.addHandler(handler)
+        if rates:
+            logger.addFilter(SamplingFilter(rates))
+        extra = {"user_id": "42", "service": "data-service", "event_type": "http_request"}
+        results[label] = bench(lambda: logger.info("GET /analytics", extra=extra))
+        handler.stream.seek(0)
+        handler.stream.truncate()
+
+    print_table("JSON log formatting (per record)", results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Micro-benchmark for JSON response serialisation
+
+Times the three ways a large list response can be produced:
+
+- ``default``: FastAPI's ``response_model`` path (validate, dump to Python in
+  JSON mode, ``jsonable_encoder``, stdlib ``json.dumps``)
+- ``FastJSONResponse``: the same dict path, rendered with orjson/msgspec
+- ``model_response``: validate and dump straight to bytes with pydantic-core
+
+It also times the gateway re-encoding an upstream body (``json.loads`` plus
+``json.dumps``) against forwarding the bytes unchanged.
+
+    python -m benchmarks.bench_serialization [rows]
+"""
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from benchmarks.common import bench, print_table
+from shared.responses import FastJSONResponse, RawJSONResponse, model_response, type_adapter
+
+# Mirrors of the service response models
+class AnalyticsData(BaseModel):
+    metric_name: str
+    value: float
+    timestamp: datetime
+    category: str
+
+class UserResponse(BaseModel):
+    username: str
+    email: str
+    full_name: str
+    is_active: bool = True
+    id: int
+    created_at: datetime
+    updated_at: datetime
+
+class UserRow:
+    """Stand-in for a SQLAlchemy ``UserDB`` row"""
+
+    def __init__(self, i: int, now: datetime):
+        self.id = i
+        self.username = f"user{i}"
+        self.email = f"user{i}@example.com"
+        self.full_name = f"User Number {i}"
+        self.is_active = i % 7 != 0
+        self.created_at = now - timedelta(days=i % 365)
+        self.updated_at = now
+
+def make_analytics(rows: int) -> List[AnalyticsData]:
+    rng = random.Random(0)
+    now = datetime(2024, 1, 1)
+    return [
+        AnalyticsData(
+            metric_name=f"metric_{i % 12}",
+            value=round(rng.uniform(10, 100), 2),
+            timestamp=now - timedelta(seconds=i),
+            category=("user_activity", "system_performance", "business_metrics", "security")[i % 4]
+        )
+        for i in range(rows)
+    ]
+
+def default_path(content, response_type) -> bytes:
+    # What FastAPI's serialize_response + JSONResponse do for response_model routes
+    adapter = type_adapter(response_type)
+    value = adapter.validate_python(content, from_attributes=True)
+    encoded = jsonable_encoder(adapter.dump_python(value, mode="json"))
+    return json.dumps(encoded, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def fast_dict_path(content, response_type) -> bytes:
+    adapter = type_adapter(response_type)
+    value = adapter.validate_python(content, from_attributes=True)
+    return FastJSONResponse(jsonable_encoder(adapter.dump_python(value, mode="json"))).body
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    number, repeat = 5, 5
+    now = datetime(2024, 1, 1)
+    payloads = {
+        "List[AnalyticsData]": (make_analytics(rows), List[AnalyticsData]),
+        "List[UserResponse]": ([UserRow(i, now) for i in range(rows)], List[UserResponse]),
+    }
+
+    for name, (content, response_type) in payloads.items():
+        body = model_response(content, response_type).body
+        assert json.loads(body) == json.loads(default_path(content, response_type))
+        results = {
+            "default (jsonable_encoder + json)": bench(lambda: default_path(content, response_type), number, repeat),
+            "FastJSONResponse (dict path)": bench(lambda: fast_dict_path(content, response_type), number, repeat),
+            "model_response (direct to bytes)": bench(lambda: model_response(content, response_type), number, repeat),
+        }
+        print_table(f"{name}, {rows} rows ({len(body) / 1e6:.1f} MB)", results)
+
+        gateway = {
+            "re-encode (json.loads + json.dumps)": bench(lambda: json.dumps(json.loads(body)).encode("utf-8"), number, repeat),
+            "forward bytes (RawJSONResponse)": bench(lambda: RawJSONResponse(body), number, repeat),
+        }
+        print_table(f"Gateway relay of {name}", gateway)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""User-service throughput under each SQLite engine profile
+
+Starts the user service with ``python -m shared.server`` and several
+prefork workers sharing one copy of a seeded database. A fixed, seeded mix
+of reads and writes is then sent over real sockets, once per
+``SQLITE_PROFILE``. Worker processes contend for the database file exactly
+as in a deployment, so lock errors ("database is locked" becomes a 500) and
+fsync-per-commit costs show up here. The in-process stack cannot show them
+because it runs a single event loop.
+
+With the ``default`` profile and one worker, more than 15 concurrent
+requests exhaust the 5 + 10 connection pool and stall for the 30 s pool
+timeout, so keep ``--requests`` small when measuring that case.
+
+    python -m benchmarks.bench_sqlite --users 10k --requests 4000 --output benchmarks/results/sqlite-10k.json
+    python -m benchmarks.bench_sqlite --users 10k --baseline benchmarks/results/sqlite-10k.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import httpx
+
+from benchmarks.common import add_report_arguments, environment, finish_report, latency_summary
+from benchmarks.seed import parse_size, users_db
+from benchmarks.stack import BACKEND_DIR, SERVICES
+
+PROFILES = ("default", "tuned")
+
+# Operation -> weight; the mix is part of the benchmark definition, change it deliberately
+OPERATION_MIX = {
+    "read": 60,
+    "list": 10,
+    "create": 15,
+    "update": 15,
+}
+
+def build_request(operation: str, rng: random.Random, user_count: int, serial: int) -> Tuple[str, str, dict]:
+    if operation == "read":
+        return "GET", f"/users/{rng.randint(1, user_count)}", {}
+    if operation == "list":
+        return "GET", "/users", {"params": {"skip": rng.randrange(0, max(user_count - 100, 1), 100), "limit": 100}}
+    if operation == "create":
+        name = f"bench-{os.getpid()}-{serial}"
+        return "POST", "/users", {"json": {"username": name, "email": f"{name}@example.com", "full_name": "Bench User"}}
+    if operation == "update":
+        return "PUT", f"/users/{rng.randint(1, user_count)}", {"json": {"full_name": f"Bench {serial}"}}
+    raise ValueError(f"Unknown operation '{operation}'")
+
+def start_server(profile: str, workdir: str, port: int, workers: int) -> subprocess.Popen:
+    directory = SERVICES["user"][0]
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([str(directory), str(BACKEND_DIR)]),
+        "SQLITE_PROFILE": profile,
+        "TRACING_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "shared.server", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers)],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+def stop_server(server: subprocess.Popen):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+async def wait_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and server.poll() is None:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("user service did not become ready")
+
+async def drive(base_url: str, server: subprocess.Popen, args: argparse.Namespace, user_count: int) -> Dict:
+    rng = random.Random(args.seed)
+    operations = rng.choices(list(OPERATION_MIX), weights=list(OPERATION_MIX.values()), k=args.requests)
+    plan = [(operation, build_request(operation, rng, user_count, serial)) for serial, operation in enumerate(operations)]
+    latencies: Dict[str, List[float]] = {operation: [] for operation in OPERATION_MIX}
+    errors: Dict[str, int] = {operation: 0 for operation in OPERATION_MIX}
+    position = 0
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal position
+        while position < len(plan):
+            operation, (method, path, kwargs) = plan[position]
+            position += 1
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                failed = response.status_code >= 500
+            except httpx.HTTPError:
+                failed = True
+            latencies[operation].append(time.perf_counter() - start)
+            errors[operation] += failed
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+        await wait_ready(client, server)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    results = {operation: {**latency_summary(samples), "errors": errors[operation]}
+               for operation, samples in latencies.items() if samples}
+    every = [sample for samples in latencies.values() for sample in samples]
+    results["all"] = {
+        **latency_summary(every),
+        "errors": sum(errors.values()),
+        "throughput_rps": round(len(every) / elapsed, 2),
+    }
+    return results
+
+def run(args: argparse.Namespace) -> Dict:
+    user_count = parse_size(args.users)
+    fixture = users_db(args.users)
+    results = {}
+    for profile in args.profiles:
+        with tempfile.TemporaryDirectory(prefix="dqa-sqlite-") as workdir:
+            # A fresh copy per profile: WAL mode is persistent once set
+            shutil.copyfile(fixture, Path(workdir) / "users.db")
+            server = start_server(profile, workdir, args.port, args.workers)
+            try:
+                profile_results = asyncio.run(drive(f"http://127.0.0.1:{args.port}", server, args, user_count))
+            finally:
+                stop_server(server)
+        for operation, summary in profile_results.items():
+            results[f"{profile} {operation}"] = summary
+    return {
+        "benchmark": "sqlite",
+        "environment": environment(),
+        "config": {"users": user_count, "requests": args.requests, "concurrency": args.concurrency,
+                   "workers": args.workers, "seed": args.seed, "mix": OPERATION_MIX},
+        "results": results,
+    }
+
+def print_report(report: Dict):
+    config = report["config"]
+    print(f"\nUser service, {config['requests']} requests, concurrency {config['concurrency']}, "
+          f"{config['workers']} workers, {config['users']} users")
+    print(f"  {'profile / operation':<18} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7} {'req/s':>9}")
+    for name, result in report["results"].items():
+        rps = f"{result['throughput_rps']:>9.1f}" if "throughput_rps" in result else ""
+        print(f"  {name:<18} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['errors']:>7} {rps}")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", default="10k", help="seeded database size (10k, 1m, ...)")
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4, help="prefork workers sharing the database")
+    parser.add_argument("--profiles", nargs="+", choices=PROFILES, default=list(PROFILES))
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--seed", type=int, default=1234)
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    return finish_report(args, report)
+
+if __name__ == "__main__":
+    sys.exit(main())
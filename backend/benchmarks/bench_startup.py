@@ -0,0 +1,92 @@
+"""Cold-start time of each service, from process spawn to ready
+
+Every run starts a fresh interpreter that imports the service's ``main``,
+runs its lifespan startup and prints ``app.state.startup`` (see
+``shared/startup.py``). The parent records the wall time until that line
+arrives, so interpreter start-up is included.
+
+    python -m benchmarks.bench_startup --runs 5 --output benchmarks/results/startup.json
+    python -m benchmarks.bench_startup --baseline benchmarks/results/startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.common import add_report_arguments, environment, finish_report, latency_summary
+from benchmarks.stack import BACKEND_DIR, SERVICES
+
+# Runs in the child: import the service, run its startup, report, shut down
+CHILD = """
+import asyncio, json, sys
+sys.path.insert(0, sys.argv[1])
+import main
+
+async def start():
+    async with main.app.router.lifespan_context(main.app):
+        print("READY " + json.dumps(main.app.state.startup), flush=True)
+
+asyncio.run(start())
+"""
+
+def start_once(directory: Path, workdir: str) -> Dict:
+    env = {**os.environ, "PYTHONPATH": str(BACKEND_DIR)}
+    start = time.perf_counter()
+    child = subprocess.Popen(
+        [sys.executable, "-c", CHILD, str(directory)], cwd=workdir, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    try:
+        for line in child.stdout:
+            if line.startswith("READY "):
+                return {"wall": time.perf_counter() - start, **json.loads(line[len("READY "):])}
+    finally:
+        child.wait()
+    raise RuntimeError(f"{directory.name} exited with {child.returncode} before it was ready")
+
+def run(args: argparse.Namespace) -> Dict:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="dqa-startup-") as workdir:
+        for name, (directory, _) in SERVICES.items():
+            runs: List[Dict] = [start_once(directory, workdir) for _ in range(args.runs)]
+            phases: Dict[str, List[float]] = {}
+            for entry in runs:
+                for phase, ms in entry["phases_ms"].items():
+                    phases.setdefault(phase, []).append(ms)
+            results[name] = {
+                **latency_summary([entry["wall"] for entry in runs]),
+                "phases_median_ms": {phase: sorted(values)[len(values) // 2] for phase, values in phases.items()},
+            }
+    return {
+        "benchmark": "startup",
+        "environment": environment(),
+        "config": {"runs": args.runs},
+        "results": results,
+    }
+
+def print_report(report: Dict):
+    print(f"\nCold start, {report['config']['runs']} runs per service (spawn to ready)")
+    print(f"  {'service':<8} {'p50 ms':>9} {'p99 ms':>9}  phases (median)")
+    for name, result in report["results"].items():
+        phases = ", ".join(f"{phase} {ms:.0f}" for phase, ms in result["phases_median_ms"].items())
+        print(f"  {name:<8} {result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f}  {phases}")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per service")
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    return finish_report(args, report)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Timing, reporting and baseline comparison helpers shared by the benchmarks"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+
+# Metrics compared against a baseline; means, p90 and max are reported but too noisy to gate on
+GATED_METRICS = ("p50_ms", "p99_ms", "throughput_rps", "median_us")
+
+def bench(fn: Callable[[], object], number: int = 10000, repeat: int = 5) -> Dict[str, float]:
+    """Time ``fn`` and return the best and median per-call cost in microseconds"""
+    fn()  # warm up caches and lazy imports
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number * 1e6)
+    timings.sort()
+    return {"best_us": round(timings[0], 3), "median_us": round(timings[len(timings) // 2], 3)}
+
+def print_table(title: str, results: Dict[str, Dict[str, float]]):
+    """Print benchmark results as an aligned table"""
+    print(f"\n{title}")
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        print(f"  {name:<{width}}  best {result['best_us']:>9.3f} us   median {result['median_us']:>9.3f} us")
+
+async def abench(fn: Callable[[], Awaitable[object]], number: int = 1000, repeat: int = 5) -> Dict[str, float]:
+    """``bench`` for coroutine functions, run on the current event loop"""
+    await fn()
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        timings.append((time.perf_counter() - start) / number * 1e6)
+    timings.sort()
+    return {"best_us": round(timings[0], 3), "median_us": round(timings[len(timings) // 2], 3)}
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """Count, mean and p50/p90/p99/max in milliseconds for latencies in seconds"""
+    values = sorted(samples)
+    summary = {"count": len(values), "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0}
+    for name, q in (("p50_ms", 0.50), ("p90_ms", 0.90), ("p99_ms", 0.99)):
+        summary[name] = round(percentile(values, q) * 1000, 3)
+    summary["max_ms"] = round(values[-1] * 1000, 3) if values else 0.0
+    return summary
+
+def environment() -> Dict[str, Any]:
+    """Where the numbers came from, stored next to them"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+def write_results(path: str, report: Dict[str, Any]):
+    """Save a report (``{"benchmark", "environment", "results", ...}``) as JSON"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.10) -> List[Dict[str, Any]]:
+    """Compare the gated metrics of two reports
+
+    Latencies (p50, p99, micro-benchmark median) regress when they grow by
+    more than ``threshold``; throughput regresses when it drops by more.
+    Returns one row per gated metric present in both reports.
+    """
+    rows = []
+    for name, metrics in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        for metric, value in metrics.items():
+            old = base.get(metric)
+            if metric not in GATED_METRICS or not old:
+                continue
+            higher_is_better = metric.endswith("_rps")
+            change = (value - old) / old
+            regressed = change < -threshold if higher_is_better else change > threshold
+            rows.append({"name": name, "metric": metric, "baseline": old, "current": value,
+                         "change": round(change, 4), "regressed": regressed})
+    return rows
+
+def print_comparison(rows: List[Dict[str, Any]]) -> bool:
+    """Print a comparison and return True when anything regressed"""
+    if not rows:
+        print("\nNo comparable metrics in the baseline")
+        return False
+    print("\nComparison with baseline")
+    width = max(len(f"{row['name']} {row['metric']}") for row in rows)
+    for row in rows:
+        label = f"{row['name']} {row['metric']}"
+        flag = "  REGRESSION" if row["regressed"] else ""
+        print(f"  {label:<{width}}  {row['baseline']:>10.3f} -> {row['current']:>10.3f}  ({row['change']:+.1%}){flag}")
+    return any(row["regressed"] for row in rows)
+
+def add_report_arguments(parser: argparse.ArgumentParser):
+    """``--output``, ``--baseline`` and ``--threshold`` options shared by the runners"""
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--baseline", help="compare against a previously saved results file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative slowdown (default 0.10)")
+
+def finish_report(args: argparse.Namespace, report: Dict[str, Any]) -> int:
+    """Write and compare a report as requested on the command line; returns the exit code"""
+    if args.output:
+        write_results(args.output, report)
+        print(f"\nResults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if print_comparison(compare_results(baseline, report, args.threshold)):
+            return 1
+    return 0
@@ -0,0 +1,162 @@
+"""In-process load generator for the whole backend
+
+Drives the gateway (and through it the auth, user and data services) with a
+fixed, seeded mix of scenarios against a seeded user database, then reports
+per-scenario p50/p90/p99 latency and overall throughput.
+
+    python -m benchmarks.load --users 10k --requests 2000 --concurrency 8 \\
+        --output benchmarks/results/load-10k.json
+    python -m benchmarks.load --users 10k --baseline benchmarks/results/load-10k.json
+
+Everything runs on one event loop with no sockets, so the numbers measure
+the services' own CPU cost. They are comparable between commits on the same
+machine but are not a capacity estimate for a real deployment. Login is
+dominated by bcrypt and weighted low for that reason.
+
+With ``SQLITE_PROFILE=default``, above 15 concurrent users the user
+service's SQLAlchemy pool (5 + 10 overflow) runs dry. Checkout then blocks
+the event loop until the 30 s pool timeout, which shows up as ~30 s p90
+latencies rather than a slow ramp. The tuned profile's read pool grows on
+demand instead.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import httpx
+
+from benchmarks.common import add_report_arguments, environment, finish_report, latency_summary
+from benchmarks.seed import parse_size, users_db
+from benchmarks.stack import InProcessStack
+
+# Scenario -> weight; the mix is part of the benchmark definition, change it deliberately
+SCENARIO_MIX = {
+    "login": 5,
+    "user_read": 45,
+    "user_list": 10,
+    "analytics": 25,
+    "reports": 15,
+}
+
+Request = Tuple[str, str, dict]
+
+def build_request(scenario: str, rng: random.Random, user_count: int) -> Request:
+    """(method, path, httpx kwargs) for one scenario instance"""
+    if scenario == "login":
+        return "POST", "/api/auth/login", {"json": {"username": "admin", "password": "admin123"}}
+    if scenario == "user_read":
+        return "GET", f"/api/users/{rng.randint(1, user_count)}", {}
+    if scenario == "user_list":
+        skip = rng.randrange(0, max(user_count - 100, 1), 100)
+        return "GET", "/api/users", {"params": {"skip": skip, "limit": 100}}
+    if scenario == "analytics":
+        return "GET", "/api/data/analytics", {"params": {"limit": 50}}
+    if scenario == "reports":
+        return "GET", "/api/data/reports", {}
+    raise ValueError(f"Unknown scenario '{scenario}'")
+
+def build_schedule(total: int, user_count: int, seed: int) -> List[Tuple[str, Request]]:
+    """The exact request sequence for a run, reproducible from ``seed``"""
+    rng = random.Random(seed)
+    names = list(SCENARIO_MIX)
+    weights = [SCENARIO_MIX[name] for name in names]
+    schedule = []
+    for scenario in rng.choices(names, weights=weights, k=total):
+        schedule.append((scenario, build_request(scenario, rng, user_count)))
+    return schedule
+
+async def run_schedule(client: httpx.AsyncClient, schedule: List[Tuple[str, Request]], concurrency: int,
+                       record: Callable[[str, float, bool], None]):
+    """Closed-loop run: ``concurrency`` workers take the next request as soon as they finish one"""
+    position = 0
+
+    async def worker():
+        nonlocal position
+        while position < len(schedule):
+            scenario, (method, path, kwargs) = schedule[position]
+            position += 1
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            record(scenario, time.perf_counter() - start, ok)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+async def run(args: argparse.Namespace) -> Dict:
+    user_count = parse_size(args.users)
+    database = users_db(args.users)
+    samples: Dict[str, List[float]] = {name: [] for name in SCENARIO_MIX}
+    errors: Dict[str, int] = {name: 0 for name in SCENARIO_MIX}
+
+    def record(scenario: str, elapsed: float, ok: bool):
+        samples[scenario].append(elapsed)
+        if not ok:
+            errors[scenario] += 1
+
+    async with InProcessStack(database) as stack:
+        async with stack.client(timeout=60.0) as client:
+            warmup = build_schedule(args.warmup, user_count, args.seed + 1)
+            await run_schedule(client, warmup, args.concurrency, lambda *_: None)
+
+            schedule = build_schedule(args.requests, user_count, args.seed)
+            start = time.perf_counter()
+            await run_schedule(client, schedule, args.concurrency, record)
+            wall = time.perf_counter() - start
+
+    results = {}
+    for scenario, values in samples.items():
+        results[scenario] = {**latency_summary(values), "errors": errors[scenario]}
+    everything = [value for values in samples.values() for value in values]
+    results["total"] = {
+        **latency_summary(everything),
+        "errors": sum(errors.values()),
+        "throughput_rps": round(len(everything) / wall, 2),
+    }
+    return {
+        "benchmark": "load",
+        "environment": environment(),
+        "config": {
+            "users": user_count,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "mix": SCENARIO_MIX,
+        },
+        "results": results,
+    }
+
+def print_report(report: Dict):
+    config = report["config"]
+    print(f"\nLoad test: {config['requests']} requests, concurrency {config['concurrency']}, {config['users']:,} users")
+    print(f"  {'scenario':<10} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+    for name, result in report["results"].items():
+        print(f"  {name:<10} {result['count']:>6} {result['errors']:>6} "
+              f"{result['p50_ms']:>9.2f} {result['p90_ms']:>9.2f} {result['p99_ms']:>9.2f}")
+    print(f"  throughput {report['results']['total']['throughput_rps']:.1f} req/s")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", default="10k", help="seeded users: 10k, 1m, 10m or a row count")
+    parser.add_argument("--requests", type=int, default=2000, help="measured requests")
+    parser.add_argument("--warmup", type=int, default=100, help="unmeasured requests before the run")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent virtual users")
+    parser.add_argument("--seed", type=int, default=42, help="seed for the request schedule")
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    return finish_report(args, report)
+
+if __name__ == "__main__":
+    sys.exit(main())
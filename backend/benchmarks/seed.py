@@ -0,0 +1,109 @@
+"""Deterministic SQLite fixtures for the user service
+
+Seeded databases are cached under ``benchmarks/.data`` (one file per size) so
+large fixtures are only built once. Row ``1`` is ``admin`` and row ``2`` is
+``user1``, matching the demo credentials in the auth service, so logins
+resolve against the seeded users.
+
+    python -m benchmarks.seed 1m
+"""
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, Tuple
+
+DATA_DIR = Path(__file__).resolve().parent / ".data"
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+INSERT_BATCH = 50_000
+SEED = 1234
+
+# Mirrors UserDB in microservices/user-service/main.py
+USERS_DDL = """
+CREATE TABLE users (
+    id INTEGER NOT NULL,
+    username VARCHAR NOT NULL,
+    email VARCHAR NOT NULL,
+    full_name VARCHAR NOT NULL,
+    is_active BOOLEAN,
+    created_at DATETIME,
+    updated_at DATETIME,
+    PRIMARY KEY (id)
+)
+"""
+USERS_INDEXES = (
+    "CREATE INDEX ix_users_id ON users (id)",
+    "CREATE UNIQUE INDEX ix_users_username ON users (username)",
+    "CREATE UNIQUE INDEX ix_users_email ON users (email)",
+)
+
+def parse_size(size: str) -> int:
+    """Accept ``10k``/``1m``/``10m`` or a plain row count"""
+    size = size.lower()
+    if size in SIZES:
+        return SIZES[size]
+    return int(size.replace("_", ""))
+
+def username_for(user_id: int) -> str:
+    return "admin" if user_id == 1 else f"user{user_id - 1}"
+
+def iter_users(count: int) -> Iterator[Tuple]:
+    rng = random.Random(SEED)
+    epoch = datetime(2024, 1, 1)
+    for user_id in range(1, count + 1):
+        username = username_for(user_id)
+        created = epoch + timedelta(seconds=rng.randrange(365 * 86400))
+        updated = created + timedelta(seconds=rng.randrange(30 * 86400))
+        yield (
+            user_id,
+            username,
+            f"{username}@example.com",
+            f"User {user_id}",
+            rng.random() > 0.1,
+            created.isoformat(sep=" "),
+            updated.isoformat(sep=" "),
+        )
+
+def seed_users(path: Path, count: int):
+    """Write ``count`` users to a new SQLite database at ``path``"""
+    tmp = path.with_suffix(".tmp")
+    if tmp.exists():
+        tmp.unlink()
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(USERS_DDL)
+        rows = iter_users(count)
+        while True:
+            batch = [row for _, row in zip(range(INSERT_BATCH), rows)]
+            if not batch:
+                break
+            conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+        # Building the indexes after the load is much faster than maintaining them per row
+        for statement in USERS_INDEXES:
+            conn.execute(statement)
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+
+def users_db(size: str) -> Path:
+    """Path of the seeded database for ``size``, building it on first use"""
+    count = parse_size(size)
+    DATA_DIR.mkdir(exist_ok=True)
+    path = DATA_DIR / f"users-{count}.db"
+    if not path.exists():
+        start = time.perf_counter()
+        print(f"Seeding {count:,} users into {path} ...", file=sys.stderr)
+        seed_users(path, count)
+        print(f"Seeded in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return path
+
+if __name__ == "__main__":
+    for size in sys.argv[1:] or ["10k"]:
+        print(users_db(size))
@@ -0,0 +1,114 @@
+"""Run the gateway and all three services in one process
+
+Each service module is imported under its own name, and every traced httpx
+client is pointed at the in-process apps through ``httpx.ASGITransport``
+mounts, so a request to the gateway goes through the same proxy, tracing and
+serialisation code as in production, minus the network.
+
+The user service opens ``./users.db`` relative to the working directory, so
+the stack runs from a scratch directory holding a link to a seeded database.
+"""
+import importlib.util
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import AsyncExitStack
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, Optional
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from shared.tracing import mount_transport
+
+SERVICES = {
+    # name: (directory, URL the other services use to reach it)
+    "user": (BACKEND_DIR / "microservices" / "user-service", "http://localhost:8001"),
+    "auth": (BACKEND_DIR / "microservices" / "auth-service", "http://localhost:8002"),
+    "data": (BACKEND_DIR / "microservices" / "data-service", "http://localhost:8003"),
+    "gateway": (BACKEND_DIR / "main-api", "http://localhost:8000"),
+}
+
+def load_service(name: str, directory: Path) -> ModuleType:
+    """Import ``directory/main.py`` as ``<name>_service_main``"""
+    if str(directory) not in sys.path:
+        # Service-local helper modules (export, rollups, ...) are imported by bare name
+        sys.path.insert(0, str(directory))
+    module_name = f"{name}_service_main"
+    spec = importlib.util.spec_from_file_location(module_name, directory / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+class InProcessStack:
+    """The whole backend, wired together with ASGI transports
+
+    ``users_db`` is linked into a scratch working directory as ``users.db``;
+    pass ``copy_db=True`` when the workload writes, to keep the fixture intact.
+    """
+
+    def __init__(self, users_db: Path, copy_db: bool = False, quiet_logs: bool = True):
+        self.users_db = Path(users_db)
+        self.copy_db = copy_db
+        self.quiet_logs = quiet_logs
+        self.modules: Dict[str, ModuleType] = {}
+        self.transports: Dict[str, httpx.ASGITransport] = {}
+        self._workdir: Optional[str] = None
+        self._previous_cwd: Optional[str] = None
+        self._devnull = None
+        self._lifespans: Optional[AsyncExitStack] = None
+
+    async def __aenter__(self) -> "InProcessStack":
+        self._workdir = tempfile.mkdtemp(prefix="dqa-bench-")
+        target = Path(self._workdir) / "users.db"
+        if self.copy_db:
+            shutil.copyfile(self.users_db, target)
+        else:
+            os.symlink(self.users_db, target)
+        self._previous_cwd = os.getcwd()
+        os.chdir(self._workdir)
+
+        for name, (directory, url) in SERVICES.items():
+            module = self.modules[name] = load_service(name, directory)
+            self.transports[name] = httpx.ASGITransport(app=module.app)
+            mount_transport(url, self.transports[name])
+        if self.quiet_logs:
+            # Keep the formatting cost of service logs, but not the console output
+            self._devnull = open(os.devnull, "w")
+            for handler in logging.getLogger().handlers:
+                if isinstance(handler, logging.StreamHandler):
+                    handler.setStream(self._devnull)
+
+        self._lifespans = AsyncExitStack()
+        for module in self.modules.values():
+            await self._lifespans.enter_async_context(module.app.router.lifespan_context(module.app))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._lifespans.aclose()
+        for _, url in SERVICES.values():
+            mount_transport(url, None)
+        os.chdir(self._previous_cwd)
+        if self._devnull is not None:
+            for handler in logging.getLogger().handlers:
+                if isinstance(handler, logging.StreamHandler) and handler.stream is self._devnull:
+                    handler.setStream(sys.stderr)
+            self._devnull.close()
+        shutil.rmtree(self._workdir, ignore_errors=True)
+
+    @property
+    def gateway(self):
+        return self.modules["gateway"].app
+
+    def client(self, **kwargs) -> httpx.AsyncClient:
+        """Client that talks to the in-process gateway"""
+        return httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=self.gateway), base_url=SERVICES["gateway"][1], **kwargs
+        )
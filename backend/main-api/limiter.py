@@ -0,0 +1,207 @@
+"""Adaptive per-upstream concurrency limits for the gateway
+
+Each upstream service gets a ``ConcurrencyLimiter``. A request takes a
+slot before it is proxied and gives it back when the upstream answers,
+and the limit adapts to the latency observed:
+
+- ``GradientLimit`` (default, after Netflix's Gradient2) compares recent
+  latency with a slow long-term average. While the two agree the limit
+  grows by about sqrt(limit) per update. When latency rises the limit
+  shrinks in proportion, down to half per update. Timeouts and upstream
+  503s count as drops and halve it.
+- ``AIMDLimit`` adds one slot per response while the limiter is in use and
+  multiplies by ``backoff`` on a drop.
+
+Neither grows the limit while less than half of it is in use, so an idle
+upstream keeps its last good limit.
+
+Requests over the limit wait in a priority queue (``critical`` before
+``normal`` before ``bulk``, then FIFO) until a slot frees up, their queue
+time runs out, or the queue fills up. A full queue evicts its least
+important waiter to admit a more important request, and otherwise rejects
+the newcomer. Rejected, evicted and timed-out requests get
+``Overloaded``, which the gateway turns into a 503 with ``Retry-After``.
+A slow upstream therefore costs the gateway a bounded queue instead of an
+ever-growing pile of requests that all time out together.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+from shared.metrics import count_shed, record_limiter
+
+PRIORITIES = {"critical": 0, "normal": 1, "bulk": 2}
+LIMIT_ALGORITHMS = ("gradient", "aimd")
+MAX_RETRY_AFTER = 30
+
+class Overloaded(Exception):
+    """The upstream's limiter could not admit the request"""
+
+    def __init__(self, upstream: str, reason: str, retry_after: int):
+        super().__init__(f"{upstream} is overloaded ({reason})")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AIMDLimit:
+    """Additive increase, multiplicative decrease"""
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, backoff: float = 0.9):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+
+    def update(self, rtt: float, inflight: int, dropped: bool):
+        if dropped:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif inflight * 2 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1)
+
+class GradientLimit:
+    """Latency-gradient limit: recent RTT against a long-term RTT average"""
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, tolerance: float = 1.5,
+                 smoothing: float = 0.2, long_window: int = 600):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.long_factor = 2.0 / (long_window + 1)
+        self.long_rtt: Optional[float] = None
+
+    def update(self, rtt: float, inflight: int, dropped: bool):
+        if self.long_rtt is None:
+            self.long_rtt = rtt
+        self.long_rtt += (rtt - self.long_rtt) * self.long_factor
+        if self.long_rtt / max(rtt, 1e-9) > 2:
+            # Latency fell a long way (e.g. the upstream recovered): let the baseline catch up
+            self.long_rtt *= 0.95
+        if not dropped and inflight * 2 < self.limit:
+            return  # not using the limit, so latency says nothing about it
+
+        gradient = 0.5 if dropped else max(0.5, min(1.0, self.tolerance * self.long_rtt / max(rtt, 1e-9)))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, limit))
+
+def create_limit(algorithm: str, initial: int, min_limit: int, max_limit: int):
+    if algorithm == "gradient":
+        return GradientLimit(initial, min_limit, max_limit)
+    if algorithm == "aimd":
+        return AIMDLimit(initial, min_limit, max_limit)
+    raise ValueError(f"Limiter algorithm must be one of {LIMIT_ALGORITHMS}, got {algorithm!r}")
+
+class Permit:
+    """A held slot; call ``release()`` exactly once, setting ``dropped`` on overload signs"""
+
+    __slots__ = ("limiter", "started", "dropped")
+
+    def __init__(self, limiter: "ConcurrencyLimiter"):
+        self.limiter = limiter
+        self.started = time.perf_counter()
+        self.dropped = False
+
+    def release(self):
+        self.limiter.release(time.perf_counter() - self.started, self.dropped)
+
+class ConcurrencyLimiter:
+    """Adaptive slot count plus a bounded priority queue for one upstream"""
+
+    def __init__(self, upstream: str, limit, queue_size: int = 100):
+        self.upstream = upstream
+        self.algorithm = limit
+        self.queue_size = queue_size
+        self.inflight = 0
+        self.waiting = 0
+        self.rtt = 0.0  # moving average, for Retry-After estimates
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    @property
+    def limit(self) -> int:
+        return max(1, int(self.algorithm.limit))
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained"""
+        estimate = self.rtt * (self.waiting + 1) / self.limit
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(estimate)))
+
+    async def acquire(self, priority: str = "normal", timeout: float = 1.0) -> Permit:
+        """Wait up to ``timeout`` seconds for a slot; raises ``Overloaded``"""
+        rank = PRIORITIES[priority]
+        if self.inflight < self.limit and not self.waiting:
+            self.inflight += 1
+            self._record()
+            return Permit(self)
+
+        if self.waiting >= self.queue_size:
+            self._make_room(rank, priority)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (rank, next(self._order), future))
+        self.waiting += 1
+        self._record()
+        try:
+            done, _ = await asyncio.wait({future}, timeout=max(timeout, 0.0))
+        except asyncio.CancelledError:
+            self._abandon(future)
+            raise
+        if not done:
+            self._abandon(future)
+            count_shed(self.upstream, priority, "timeout")
+            raise Overloaded(self.upstream, "queue timeout", self.retry_after())
+        future.result()  # raises Overloaded when evicted
+        return Permit(self)
+
+    def release(self, rtt: float, dropped: bool = False):
+        self.rtt = rtt if not self.rtt else self.rtt + (rtt - self.rtt) * 0.1
+        self.algorithm.update(rtt, self.inflight, dropped)
+        self.inflight -= 1
+        self._grant()
+        self._record()
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "limit": self.limit,
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "rtt_ms": round(self.rtt * 1000, 2),
+        }
+
+    def _grant(self):
+        # Hand free slots straight to the most important waiters
+        while self.inflight < self.limit and self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue  # evicted or abandoned
+            self.waiting -= 1
+            self.inflight += 1
+            future.set_result(None)
+
+    def _make_room(self, rank: int, priority: str):
+        live = [entry for entry in self._queue if not entry[2].done()]
+        worst = max(live, key=lambda entry: (entry[0], entry[1]), default=None)
+        if worst is None or worst[0] <= rank:
+            count_shed(self.upstream, priority, "queue_full")
+            raise Overloaded(self.upstream, "queue full", self.retry_after())
+        evicted = next(name for name, value in PRIORITIES.items() if value == worst[0])
+        worst[2].set_exception(Overloaded(self.upstream, f"evicted for {priority} traffic", self.retry_after()))
+        self.waiting -= 1
+        count_shed(self.upstream, evicted, "evicted")
+
+    def _abandon(self, future: asyncio.Future):
+        if future.done() and not future.cancelled() and future.exception() is None:
+            # The slot was granted as we gave up: pass it on
+            self.inflight -= 1
+            self._grant()
+        elif not future.done():
+            future.cancel()
+            self.waiting -= 1
+        self._record()
+
+    def _record(self):
+        record_limiter(self.upstream, self.limit, self.inflight, self.waiting)
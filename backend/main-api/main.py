@@ -1,21 +1,71 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from contextlib import asynccontextmanager
 import httpx
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import logging
+import time
+from urllib.parse import unquote
+
+import sys
+from pathlib import Path
+
+# The shared package lives in the backend root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from shared.config import get_settings
+from shared.logging_config import setup_logging
+from shared.tracing import setup_tracing, traced_client
+from shared.profiling import setup_profiling
+from shared.metrics import instrument_app, set_route_label, track_upstream
+from shared.responses import FastJSONResponse, RawJSONResponse
+from shared.compression import setup_compression
+from shared.startup import StartupReport
+from shared.revocation import RevocationFollower, bearer_jti
+
+from routing import RouteRule, RouteTable
+from limiter import ConcurrencyLimiter, Overloaded, Permit, create_limit
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+settings = get_settings()
+setup_logging(
+    "main-api",
+    settings.log_level,
+    async_mode=settings.log_async,
+    queue_size=settings.log_queue_size,
+    overflow_policy=settings.log_overflow_policy,
+    sample_rates=settings.log_sample_rates,
+    json_backend=settings.log_json_backend,
+    log_format=settings.log_format
+)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup = StartupReport("main-api")
+    # One pooled client for all proxying: connections are kept alive and reused
+    app.state.http_client = traced_client()
+    # Logged-out tokens are refused here, before any upstream sees them
+    app.state.revocations = RevocationFollower(
+        SERVICE_URLS["auth"], settings.revocation_refresh_seconds, service_token=settings.service_token
+    )
+    app.state.revocations.start()
+    app.state.startup = startup.ready()
+    yield
+    await app.state.revocations.stop()
+    await app.state.http_client.aclose()
+
 app = FastAPI(
     title="DQA Main API Gateway",
     description="Main API Gateway for DQA Backend Services",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -27,6 +77,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_app(app, "main-api", enabled=settings.enable_metrics)
+setup_tracing(app, "main-api", settings)
+setup_profiling(app, "main-api", settings)
+setup_compression(app, settings)
+
 # Service URLs - Configure these based on your deployment
 SERVICE_URLS = {
     "user": "http://localhost:8001",
@@ -34,6 +89,42 @@ SERVICE_URLS = {
     "data": "http://localhost:8003"
 }
 
+# Routes proxied by the catch-all /api handler; the longest matching prefix wins
+GATEWAY_ROUTES = [
+    RouteRule("/api/users", "user", "/users", methods={"GET", "POST", "PUT", "DELETE"}),
+    RouteRule("/api/auth", "auth", methods={"GET", "POST"}, cache="no-store", priority="critical"),
+    RouteRule("/api/data", "data", methods={"GET", "POST"}),
+    RouteRule("/api/data/export", "data", "/export", stream=True, priority="bulk"),
+    RouteRule("/api/data/realtime/stream", "data", "/realtime/stream", stream=True),
+]
+# Upstream paths only services call each other on; the catch-all proxy never forwards them
+INTERNAL_PATHS = {"auth": ("/revocations",)}
+ROUTE_TABLE = RouteTable(GATEWAY_ROUTES + [RouteRule.from_dict(rule) for rule in settings.gateway_routes])
+PROXY_METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+
+# One adaptive concurrency limiter per upstream; requests over the limit queue, then are shed
+UPSTREAM_LIMITERS: Dict[str, ConcurrencyLimiter] = {
+    service: ConcurrencyLimiter(
+        service,
+        create_limit(settings.gateway_limiter_algorithm, settings.gateway_limit_initial,
+                     settings.gateway_limit_min, settings.gateway_limit_max),
+        queue_size=settings.gateway_queue_size
+    )
+    for service in SERVICE_URLS
+} if settings.gateway_limiter_enabled else {}
+
+# Headers passed through the proxy; everything else (Host, hop-by-hop, Accept-Encoding) stays local
+# (except for streams, which are relayed still encoded: see proxy_stream)
+FORWARDED_REQUEST_HEADERS = ("Accept", "Accept-Language", "Authorization", "Content-Type", "Range", "If-Range",
+                             "Last-Event-ID", "X-Read-After")
+FORWARDED_RESPONSE_HEADERS = ("Content-Disposition", "Content-Range", "Accept-Ranges", "Location",
+                              "WWW-Authenticate", "Retry-After", "X-Read-After")
+STREAM_RESPONSE_HEADERS = ("Content-Encoding", "Vary")
+
+# Conditional GET: client validators go upstream, upstream validators come back
+CONDITIONAL_REQUEST_HEADERS = ("If-None-Match", "If-Modified-Since")
+VALIDATOR_RESPONSE_HEADERS = ("ETag", "Last-Modified", "Cache-Control")
+
 class ServiceResponse(BaseModel):
     service: str
     status: str
@@ -55,7 +146,7 @@ async def services_health():
     """Check health of all microservices"""
     health_status = {}
     
-    async with httpx.AsyncClient() as client:
+    async with traced_client() as client:
         for service_name, service_url in SERVICE_URLS.items():
             try:
                 response = await client.get(f"{service_url}/health", timeout=5.0)
@@ -73,73 +164,200 @@ async def services_health():
     
     return {"services": health_status}
 
-# User Service Proxy Routes
-@app.get("/api/users/{user_id}")
-async def get_user(user_id: int):
-    """Get user by ID - proxy to user service"""
-    return await proxy_request("user", f"/users/{user_id}")
-
-@app.post("/api/users")
-async def create_user(user_data: Dict[str, Any]):
-    """Create user - proxy to user service"""
-    return await proxy_request("user", "/users", method="POST", json_data=user_data)
-
-# Auth Service Proxy Routes
-@app.post("/api/auth/login")
-async def login(credentials: Dict[str, Any]):
-    """Login - proxy to auth service"""
-    return await proxy_request("auth", "/login", method="POST", json_data=credentials)
-
-@app.post("/api/auth/logout")
-async def logout():
-    """Logout - proxy to auth service"""
-    return await proxy_request("auth", "/logout", method="POST")
-
-# Data Service Proxy Routes
-@app.get("/api/data/analytics")
-async def get_analytics():
-    """Get analytics data - proxy to data service"""
-    return await proxy_request("data", "/analytics")
-
-@app.get("/api/data/reports")
-async def get_reports():
-    """Get reports - proxy to data service"""
-    return await proxy_request("data", "/reports")
-
-async def proxy_request(service: str, path: str, method: str = "GET", json_data: Dict[str, Any] = None):
-    """Helper function to proxy requests to microservices"""
-    if service not in SERVICE_URLS:
-        raise HTTPException(status_code=404, detail=f"Service '{service}' not found")
-    
-    service_url = SERVICE_URLS[service]
-    full_url = f"{service_url}{path}"
+@app.get("/health/limits")
+async def upstream_limits():
+    """Adaptive concurrency limit, in-flight and queued requests per upstream"""
+    return {
+        "enabled": settings.gateway_limiter_enabled,
+        "algorithm": settings.gateway_limiter_algorithm,
+        "upstreams": {service: limiter.status() for service, limiter in UPSTREAM_LIMITERS.items()}
+    }
+
+@app.api_route("/api/{path:path}", methods=list(PROXY_METHODS), include_in_schema=False)
+async def proxy(request: Request):
+    """Forward any /api request to the service named by its route rule"""
+    # The undecoded path keeps escapes such as %2F intact for the upstream
+    path = request.scope.get("raw_path", b"").decode("latin-1").split("?", 1)[0] or request.url.path
+    try:
+        match = ROUTE_TABLE.match(request.method, path)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid path")
+    if match is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if match.rule is None:
+        raise HTTPException(status_code=405, detail="Method Not Allowed",
+                            headers={"Allow": ", ".join(sorted(match.allowed))})
+    if is_internal_path(match.rule.service, match.upstream_path):
+        raise HTTPException(status_code=404, detail="Not Found")
+    set_route_label(request.scope, match.rule.prefix)
+    jti = bearer_jti(request.headers.get("Authorization"))
+    if jti is not None and await request.app.state.revocations.is_revoked(jti):
+        raise HTTPException(status_code=401, detail="Token has been revoked", headers={"WWW-Authenticate": "Bearer"})
+    if match.rule.stream:
+        return await proxy_stream(match.rule, match.upstream_path, request)
+    return await proxy_request(match.rule, match.upstream_path, request)
+
+def is_internal_path(service: str, upstream_path: str) -> bool:
+    path = unquote(upstream_path)  # the upstream decodes %-escapes before routing
+    return any(path == prefix or path.startswith(prefix + "/") for prefix in INTERNAL_PATHS.get(service, ()))
+
+def forwarded_request_headers(rule: RouteRule, request: Request) -> Dict[str, str]:
+    names = FORWARDED_REQUEST_HEADERS
+    if rule.cache == "conditional":
+        names += CONDITIONAL_REQUEST_HEADERS
+    return {name: request.headers[name] for name in names if name in request.headers}
+
+def forwarded_response_headers(rule: RouteRule, response: httpx.Response) -> Dict[str, str]:
+    names = FORWARDED_RESPONSE_HEADERS
+    if rule.cache == "conditional":
+        names += VALIDATOR_RESPONSE_HEADERS
+    headers = {name: response.headers[name] for name in names if name in response.headers}
+    if "Location" in headers:
+        location = gateway_location(rule, response)
+        if location is None:
+            del headers["Location"]
+        else:
+            headers["Location"] = location
+    if rule.cache == "no-store":
+        headers["Cache-Control"] = "no-store"
+    return headers
+
+def gateway_location(rule: RouteRule, response: httpx.Response) -> Optional[str]:
+    """An upstream ``Location`` as seen from the gateway (see ``RouteTable.gateway_location``)"""
+    return ROUTE_TABLE.gateway_location(SERVICE_URLS, str(response.request.url), response.headers["Location"])
+
+@asynccontextmanager
+async def upstream_slot(rule: RouteRule):
+    """Hold a concurrency slot on the rule's upstream (yields None when limiting is off)
+
+    Waits at most ``gateway_queue_timeout`` seconds (and never past the route
+    timeout), then sheds the request with 503 and ``Retry-After``. An
+    exception inside the block tells the limiter the upstream is struggling.
+    """
+    limiter = UPSTREAM_LIMITERS.get(rule.service)
+    if limiter is None:
+        yield None
+        return
+    try:
+        permit = await limiter.acquire(rule.priority, min(settings.gateway_queue_timeout, rule.timeout))
+    except Overloaded as e:
+        logger.warning(f"Shedding {rule.priority} request for {rule.service} service: {e.reason}")
+        raise HTTPException(status_code=503, detail=f"{rule.service} service is overloaded, retry later",
+                            headers={"Retry-After": str(e.retry_after)})
+    try:
+        yield permit
+    except Exception:
+        permit.dropped = True
+        raise
+    finally:
+        permit.release()
+
+def time_left(rule: RouteRule, started: float) -> float:
+    """The route timeout minus time already spent queueing"""
+    return max(rule.timeout - (time.perf_counter() - started), 0.001)
+
+def note_upstream_status(permit: Optional[Permit], status_code: int):
+    # An upstream 503 is an overload signal like a timeout
+    if permit is not None and status_code == 503:
+        permit.dropped = True
+
+async def proxy_request(rule: RouteRule, path: str, request: Request):
+    """Proxy a request to its microservice and relay the response
+
+    The query string, body and an allowlist of headers go upstream. The
+    upstream status, body and response headers (plus validators for
+    ``cache="conditional"`` routes) come back unchanged, including errors
+    and ``304 Not Modified``.
+    """
+    client: httpx.AsyncClient = request.app.state.http_client
+    service = rule.service
+    body = await request.body()
+    started = time.perf_counter()
     
     try:
-        async with httpx.AsyncClient() as client:
-            if method == "GET":
-                response = await client.get(full_url, timeout=10.0)
-            elif method == "POST":
-                response = await client.post(full_url, json=json_data, timeout=10.0)
-            elif method == "PUT":
-                response = await client.put(full_url, json=json_data, timeout=10.0)
-            elif method == "DELETE":
-                response = await client.delete(full_url, timeout=10.0)
-            else:
-                raise HTTPException(status_code=405, detail=f"Method {method} not allowed")
-            
-            if response.status_code >= 400:
-                raise HTTPException(status_code=response.status_code, detail=response.text)
-            
-            return response.json()
-            
+        async with upstream_slot(rule) as permit:
+            with track_upstream(service, request.method) as call:
+                response = await client.request(
+                    request.method,
+                    f"{SERVICE_URLS[service]}{path}",
+                    params=request.query_params,
+                    content=body or None,
+                    headers=forwarded_request_headers(rule, request),
+                    timeout=time_left(rule, started)
+                )
+                call.status = response.status_code
+            note_upstream_status(permit, response.status_code)
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail=f"Timeout calling {service} service")
     except httpx.ConnectError:
         raise HTTPException(status_code=503, detail=f"Cannot connect to {service} service")
-    except Exception as e:
+    except httpx.HTTPError as e:
         logger.error(f"Error proxying to {service}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"Bad response from {service} service")
+    
+    headers = forwarded_response_headers(rule, response)
+    if response.status_code == 304:
+        return Response(status_code=304, headers=headers)
+    
+    # Forward the upstream body as-is instead of decoding and re-encoding it
+    headers["Content-Type"] = response.headers.get("Content-Type", "application/json")
+    return RawJSONResponse(response.content, status_code=response.status_code, headers=headers)
+
+async def proxy_stream(rule: RouteRule, path: str, request: Request):
+    """Relay a streaming response (e.g. Server-Sent Events or an export) chunk by chunk
+
+    Upstream bytes are forwarded as soon as they arrive; nothing is buffered
+    or decoded, and the upstream response is closed when the client leaves.
+    Because bytes pass through encoded, the client's ``Accept-Encoding`` goes
+    upstream and the upstream ``Content-Encoding`` comes back with them.
+    The concurrency slot is held only until the upstream answers: a stream
+    may stay open for hours and must not count against the limit.
+    """
+    client: httpx.AsyncClient = request.app.state.http_client
+    service = rule.service
+    headers = forwarded_request_headers(rule, request)
+    headers.setdefault("Accept", "text/event-stream")
+    # Replaces the client library's default, which would let the upstream pick an encoding the client never offered
+    headers["Accept-Encoding"] = request.headers.get("Accept-Encoding", "identity")
+    body = await request.body()
+    started = time.perf_counter()
+    
+    try:
+        async with upstream_slot(rule) as permit:
+            upstream_request = client.build_request(
+                request.method, f"{SERVICE_URLS[service]}{path}", params=request.query_params, headers=headers,
+                content=body or None, timeout=httpx.Timeout(time_left(rule, started), read=None)
+            )
+            with track_upstream(service, request.method) as call:
+                response = await client.send(upstream_request, stream=True)
+                call.status = response.status_code
+            note_upstream_status(permit, response.status_code)
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail=f"Timeout calling {service} service")
+    except httpx.ConnectError:
+        raise HTTPException(status_code=503, detail=f"Cannot connect to {service} service")
+    except httpx.HTTPError as e:
+        logger.error(f"Error proxying stream to {service}: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"Bad response from {service} service")
+    
+    headers = forwarded_response_headers(rule, response)
+    # Passed as a header rather than media_type so a charset is not appended twice
+    headers["Content-Type"] = response.headers.get("Content-Type", "application/json")
+    for name in STREAM_RESPONSE_HEADERS:
+        if name in response.headers:
+            headers[name] = response.headers[name]
+    if response.status_code >= 400:
+        content = await response.aread()
+        await response.aclose()
+        return RawJSONResponse(content, status_code=response.status_code, headers=headers)
+    
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **headers},
+        background=BackgroundTask(response.aclose)
+    )
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    from shared.server import serve
+    serve("main:app", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""Declarative gateway routes and their compiled prefix matcher
+
+A ``RouteRule`` maps a gateway path prefix to a service and an upstream
+prefix. It lists the methods it accepts and says how to proxy them: the
+per-route timeout, whether conditional-GET validators pass through
+(``cache="conditional"``) or responses are marked ``no-store``, and whether
+the response is relayed as a stream. ``priority`` decides who waits and who
+is shed first when an upstream is overloaded (see ``limiter.py``).
+
+``RouteTable`` compiles the rules into a trie over path segments. A lookup
+walks the request path once and returns the longest matching prefix, so
+matching costs O(path length) however many routes there are. Prefixes match
+whole segments: ``/api/users`` matches ``/api/users/7`` but not
+``/api/usersX``.
+
+Paths are normalised before matching: empty segments and a trailing slash
+are dropped, so ``/api/users/`` goes upstream as ``/users``. Dot segments
+(``.``, ``..``, also percent-encoded) are rejected. Otherwise
+``/api/data/../users`` would match one rule while the upstream resolves it
+to another path.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+from urllib.parse import unquote, urljoin, urlsplit, urlunsplit
+
+CACHE_POLICIES = ("conditional", "no-store")
+PRIORITY_CLASSES = ("critical", "normal", "bulk")
+
+@dataclass(frozen=True)
+class RouteRule:
+    prefix: str
+    service: str
+    upstream_prefix: str = ""
+    methods: FrozenSet[str] = frozenset({"GET"})
+    timeout: float = 10.0  # seconds; for streams this bounds connecting, not reading
+    cache: str = "conditional"
+    stream: bool = False
+    priority: str = "normal"  # critical, normal or bulk
+
+    def __post_init__(self):
+        if not self.prefix.startswith("/"):
+            raise ValueError(f"Route prefix must start with '/': {self.prefix!r}")
+        if self.cache not in CACHE_POLICIES:
+            raise ValueError(f"cache must be one of {CACHE_POLICIES}, got {self.cache!r}")
+        if self.priority not in PRIORITY_CLASSES:
+            raise ValueError(f"priority must be one of {PRIORITY_CLASSES}, got {self.priority!r}")
+        object.__setattr__(self, "prefix", self.prefix.rstrip("/") or "/")
+        object.__setattr__(self, "upstream_prefix", self.upstream_prefix.rstrip("/"))
+        object.__setattr__(self, "methods", frozenset(method.upper() for method in self.methods))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RouteRule":
+        """Build a rule from settings, e.g. ``{"prefix": "/api/reports", "service": "data", ...}``"""
+        data = dict(data)
+        if "methods" in data:
+            data["methods"] = frozenset(data["methods"])
+        return cls(**data)
+
+    @property
+    def segments(self) -> List[str]:
+        return [] if self.prefix == "/" else self.prefix[1:].split("/")
+
+def path_segments(path: str) -> List[str]:
+    """Non-empty segments of ``path``; raises ValueError on dot segments"""
+    segments = [segment for segment in path.split("/") if segment]
+    if any(unquote(segment) in (".", "..") for segment in segments):
+        raise ValueError(f"Dot segments are not allowed in paths: {path!r}")
+    return segments
+
+class RouteMatch(NamedTuple):
+    rule: Optional[RouteRule]  # None when the path matched but the method is not allowed
+    upstream_path: str
+    allowed: FrozenSet[str]
+
+class _Node:
+    __slots__ = ("children", "rules", "allowed")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.rules: Dict[str, RouteRule] = {}
+        self.allowed: FrozenSet[str] = frozenset()
+
+class RouteTable:
+    """Longest-prefix matcher over ``RouteRule`` objects"""
+
+    def __init__(self, rules: Iterable[RouteRule]):
+        self.rules = list(rules)
+        self._root = _Node()
+        for rule in self.rules:
+            node = self._root
+            for segment in rule.segments:
+                node = node.children.setdefault(segment, _Node())
+            for method in rule.methods:
+                if method in node.rules:
+                    raise ValueError(f"Duplicate route for {method} {rule.prefix}")
+                node.rules[method] = rule
+            node.allowed = frozenset(node.rules)
+
+    def match(self, method: str, path: str) -> Optional[RouteMatch]:
+        """Resolve ``path`` to its rule and upstream path (None if no prefix matches)
+
+        Raises ValueError for paths with dot segments.
+        """
+        segments = path_segments(path)
+        node = self._root
+        best, depth = (node, 0) if node.rules else (None, 0)
+        for index, segment in enumerate(segments):
+            node = node.children.get(segment)
+            if node is None:
+                break
+            if node.rules:
+                best, depth = node, index + 1
+        if best is None:
+            return None
+        rule = best.rules.get(method)
+        base = (rule or next(iter(best.rules.values()))).upstream_prefix
+        upstream_path = base + "".join("/" + segment for segment in segments[depth:])
+        return RouteMatch(rule, upstream_path or "/", best.allowed)
+
+    def gateway_path(self, service: str, upstream_path: str) -> Optional[str]:
+        """The gateway path routed to ``upstream_path`` on ``service`` (None if no rule leads there)"""
+        best = None
+        for rule in self.rules:
+            base = rule.upstream_prefix
+            if rule.service != service or not (upstream_path == base or upstream_path.startswith(base + "/")):
+                continue
+            if best is None or len(base) > len(best.upstream_prefix):
+                best = rule
+        if best is None:
+            return None
+        return (best.prefix.rstrip("/") + upstream_path[len(best.upstream_prefix):]) or "/"
+
+    def gateway_location(self, service_urls: Dict[str, str], request_url: str, location: str) -> Optional[str]:
+        """An upstream ``Location`` as seen from the gateway; None when it cannot be mapped
+
+        ``location`` is resolved against ``request_url``, the upstream request.
+        Redirects to a service in ``service_urls`` (absolute or relative)
+        become gateway paths, so internal hosts are never exposed. Locations
+        elsewhere pass unchanged.
+        """
+        location = urljoin(request_url, location)
+        url = urlsplit(location)
+        origins = {service_url.rstrip("/"): name for name, service_url in service_urls.items()}
+        service = origins.get(f"{url.scheme}://{url.netloc}")
+        if service is None:
+            return location
+        try:
+            path_segments(url.path)
+        except ValueError:
+            return None
+        path = self.gateway_path(service, url.path or "/")
+        return None if path is None else urlunsplit(("", "", path, url.query, url.fragment))
@@ -1,22 +1,74 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+import asyncio
 import logging
+import secrets
+import time
+import uuid
 import httpx
 
+import sys
+from pathlib import Path
+
+# The shared package lives in the backend root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from shared.config import get_settings
+from shared.logging_config import setup_logging
+from shared.events import follow_user_events
+from shared.tracing import setup_tracing, traced_client
+from shared.profiling import setup_profiling
+from shared.metrics import instrument_app, track_upstream
+from shared.responses import FastJSONResponse
+from shared.conditional import is_not_modified, not_modified_response, validator_headers
+from shared.revocation import SERVICE_TOKEN_HEADER, RevocationList
+from shared.startup import StartupReport
+
+from user_cache import UserInfoCache
+
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+settings = get_settings()
+setup_logging(
+    "auth-service",
+    settings.log_level,
+    async_mode=settings.log_async,
+    queue_size=settings.log_queue_size,
+    overflow_policy=settings.log_overflow_policy,
+    sample_rates=settings.log_sample_rates,
+    json_backend=settings.log_json_backend,
+    log_format=settings.log_format
+)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup = StartupReport("auth-service")
+    if not settings.service_token:
+        logger.warning("SERVICE_TOKEN is not set; /revocations answers anyone who can reach this service")
+    # bcrypt is slow on purpose; hash the demo credentials off the startup path
+    app.state.credentials_seeded = asyncio.create_task(asyncio.to_thread(seed_credentials))
+    app.state.user_events = follow_user_events(
+        "auth-service", invalidate_user_info, settings, on_gap=clear_user_info
+    )
+    app.state.user_events.start()
+    app.state.startup = startup.ready()
+    yield
+    await app.state.user_events.stop()
+    app.state.credentials_seeded.cancel()
+
 app = FastAPI(
     title="DQA Auth Service",
     description="Authentication and Authorization Microservice",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -27,6 +79,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_app(app, "auth-service", enabled=settings.enable_metrics)
+setup_tracing(app, "auth-service", settings)
+setup_profiling(app, "auth-service", settings)
+
 # Security configuration
 SECRET_KEY = "your-secret-key-change-in-production"  # Change this in production!
 ALGORITHM = "HS256"
@@ -40,6 +96,12 @@ security = HTTPBearer()
 # User service URL
 USER_SERVICE_URL = "http://localhost:8001"
 
+# Revoked access tokens (by jti) until they expire; the gateway follows its Bloom filter
+revocations = RevocationList(settings.revocation_bloom_bits, settings.revocation_bloom_hashes)
+
+# User records fetched from the user service, kept until its change events invalidate them (bounded, with a TTL)
+user_info_cache = UserInfoCache(settings.user_info_cache_size, settings.user_info_cache_seconds)
+
 # Pydantic Models
 class LoginRequest(BaseModel):
     username: str
@@ -54,23 +116,20 @@ class TokenResponse(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
     user_id: Optional[int] = None
+    jti: Optional[str] = None
+    expires_at: Optional[float] = None
 
 class UserCredentials(BaseModel):
     username: str
     password: str
 
 # In-memory storage for demo (replace with database/Redis in production)
-user_credentials = {
-    "admin": {
-        "username": "admin",
-        "hashed_password": pwd_context.hash("admin123"),
-        "user_id": 1
-    },
-    "user1": {
-        "username": "user1", 
-        "hashed_password": pwd_context.hash("password123"),
-        "user_id": 2
-    }
+user_credentials: Dict[str, Dict[str, Any]] = {}
+
+# Demo accounts: username -> (password, user_id), hashed into user_credentials at startup
+SEED_CREDENTIALS = {
+    "admin": ("admin123", 1),
+    "user1": ("password123", 2),
 }
 
 refresh_tokens = set()  # Store valid refresh tokens
@@ -84,6 +143,21 @@ def get_password_hash(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
 
+def seed_credentials():
+    """Hash the demo accounts into user_credentials"""
+    start = time.perf_counter()
+    for username, (password, user_id) in SEED_CREDENTIALS.items():
+        user_credentials.setdefault(username, {
+            "username": username,
+            "hashed_password": get_password_hash(password),
+            "user_id": user_id
+        })
+    logger.info(f"Seeded {len(SEED_CREDENTIALS)} demo credentials in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+async def credentials_loaded():
+    """Wait for the demo credentials hashed in the background at startup"""
+    await app.state.credentials_seeded
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -92,7 +166,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     
-    to_encode.update({"exp": expire})
+    # jti identifies the token for revocation
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -119,19 +194,36 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         user_id: int = payload.get("user_id")
         if username is None or user_id is None:
             raise credentials_exception
-        token_data = TokenData(username=username, user_id=user_id)
+        jti = payload.get("jti")
+        if jti is not None and revocations.is_revoked(jti):
+            raise credentials_exception
+        token_data = TokenData(username=username, user_id=user_id, jti=jti, expires_at=payload.get("exp"))
     except JWTError:
         raise credentials_exception
     
     return token_data
 
+def invalidate_user_info(event: Dict[str, Any]):
+    """Drop cached records touched by a user change event"""
+    user_info_cache.invalidate(event["user"]["username"], event["user_id"])
+
+def clear_user_info():
+    user_info_cache.clear()
+
 async def verify_user_with_service(username: str) -> Dict[str, Any]:
     """Verify user exists in user service"""
+    cached = user_info_cache.get(username)
+    if cached is not None:
+        return cached
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{USER_SERVICE_URL}/users/by-username/{username}")
+        async with traced_client() as client:
+            with track_upstream("user", "GET") as call:
+                response = await client.get(f"{USER_SERVICE_URL}/users/by-username/{username}")
+                call.status = response.status_code
             if response.status_code == 200:
-                return response.json()
+                user_info = response.json()
+                user_info_cache.put(username, user_info)
+                return user_info
             else:
                 return None
     except Exception as e:
@@ -151,6 +243,7 @@ async def login(login_request: LoginRequest):
     """Authenticate user and return tokens"""
     username = login_request.username
     password = login_request.password
+    await credentials_loaded()
     
     # Check credentials
     if username not in user_credentials:
@@ -195,9 +288,9 @@ async def login(login_request: LoginRequest):
 
 @app.post("/logout")
 async def logout(current_user: TokenData = Depends(get_current_user)):
-    """Logout user (invalidate tokens)"""
-    # In a real implementation, you would invalidate the token
-    # For now, we'll just log the logout
+    """Logout user (revoke the access token until it expires)"""
+    if current_user.jti is not None and current_user.expires_at is not None:
+        revocations.revoke(current_user.jti, current_user.expires_at)
     logger.info(f"User {current_user.username} logged out")
     return {"message": "Logged out successfully"}
 
@@ -250,9 +343,35 @@ async def verify_token(current_user: TokenData = Depends(get_current_user)):
         "user_id": current_user.user_id
     }
 
+def require_service_token(request: Request):
+    """Internal endpoints answer other services only, once SERVICE_TOKEN is configured"""
+    token = settings.service_token
+    if token and not secrets.compare_digest(request.headers.get(SERVICE_TOKEN_HEADER, ""), token):
+        raise HTTPException(status_code=403, detail="Service token required")
+
+@app.get("/revocations/filter", dependencies=[Depends(require_service_token)])
+async def revocation_filter(request: Request):
+    """Bloom filter of revoked access tokens, for services that check tokens themselves"""
+    snapshot = revocations.snapshot()
+    etag = f'W/"{snapshot["version"]}"'
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    return FastJSONResponse(snapshot, headers=validator_headers(etag))
+
+@app.get("/revocations/stats", dependencies=[Depends(require_service_token)])
+async def revocation_stats():
+    """Denylist size and how often the prefilter let a check through"""
+    return revocations.stats()
+
+@app.get("/revocations/{jti}", dependencies=[Depends(require_service_token)])
+async def revocation_status(jti: str):
+    """Exact answer for a token that hit the filter"""
+    return {"jti": jti, "revoked": revocations.is_revoked(jti)}
+
 @app.post("/register-credentials")
 async def register_credentials(credentials: UserCredentials):
     """Register new user credentials (for demo purposes)"""
+    await credentials_loaded()
     if credentials.username in user_credentials:
         raise HTTPException(status_code=400, detail="Username already exists")
     
@@ -278,5 +397,5 @@ async def protected_route(current_user: TokenData = Depends(get_current_user)):
     }
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8002, reload=True)
\ No newline at end of file
+    from shared.server import serve
+    serve("main:app", port=8002, reload=True)
\ No newline at end of file
@@ -0,0 +1,56 @@
+"""User records fetched from the user service, kept for ``get_current_user``
+
+Entries are invalidated by the user service's change events. The cache is
+also bounded: the least recently used entries are evicted past
+``max_entries``, and an entry older than ``ttl`` seconds is fetched again,
+which caps how long a missed event can leave a stale record behind.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+class UserInfoCache:
+    """LRU of user records by username, with a TTL and invalidation by user id"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._usernames: Dict[Any, str] = {}  # user id -> username it is cached under
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, username: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(username)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._remove(username)
+            return None
+        self._entries.move_to_end(username)
+        return entry[1]
+
+    def put(self, username: str, info: Dict[str, Any]):
+        self._remove(username)
+        self._entries[username] = (time.monotonic() + self.ttl, info)
+        if info.get("id") is not None:
+            self._usernames[info["id"]] = username
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, username: Optional[str] = None, user_id: Any = None):
+        """Drop a user's record, by username and/or id (renamed users are cached under their old name)"""
+        if username is not None:
+            self._remove(username)
+        if user_id is not None and user_id in self._usernames:
+            self._remove(self._usernames[user_id])
+
+    def clear(self):
+        self._entries.clear()
+        self._usernames.clear()
+
+    def _remove(self, username: str):
+        entry = self._entries.pop(username, None)
+        if entry is not None and self._usernames.get(entry[1].get("id")) == username:
+            del self._usernames[entry[1]["id"]]
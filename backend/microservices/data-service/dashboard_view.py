@@ -0,0 +1,197 @@
+"""Incrementally maintained dashboard KPIs
+
+The dashboard metrics are kept as counters and running aggregates that are
+updated from ingested events, so serving ``/metrics`` is O(1).
+
+- ``total_users`` follows the user service's event feed. A periodic full
+  recompute against the user service corrects any drift (missed or
+  duplicated events). The recount comes with the feed offset it reflects:
+  feed events at or below it are skipped, and events above it that were
+  applied while the recount was in flight are added on top of it.
+- Sessions and transactions have no source outside this service. They are
+  kept as order-independent tallies (sessions started and ended, transactions
+  per day), so late or reordered events cannot skew them. A recompute
+  rebuilds every counter from those tallies, and an external recount, when
+  one is given, replaces them.
+"""
+import logging
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Event types understood by the view
+USER_CREATED = "user.created"
+USER_DELETED = "user.deleted"
+SESSION_STARTED = "session.started"
+SESSION_ENDED = "session.ended"
+TRANSACTION = "transaction"
+RESPONSE_TIME = "response_time"
+DOWNTIME = "downtime"
+
+EVENT_TYPES = [USER_CREATED, USER_DELETED, SESSION_STARTED, SESSION_ENDED, TRANSACTION, RESPONSE_TIME, DOWNTIME]
+USER_EVENT_DELTAS = {USER_CREATED: 1, USER_DELETED: -1}
+
+# Feed events applied since the last recount that may have to be added on top of the next one
+MAX_PENDING_USER_EVENTS = 100_000
+
+class DashboardMetricsView:
+    """Materialized view behind ``MetricsResponse``"""
+
+    def __init__(self):
+        self.total_users = 0
+        self.active_sessions = 0
+        self.daily_transactions = 0
+        self.events_applied = 0
+        self.events_skipped = 0
+        self.last_reconciled_at: Optional[datetime] = None
+        self.last_drift: Dict[str, int] = {}
+        self._day = datetime.utcnow().date()
+        self._response_time_sum = 0.0
+        self._response_time_count = 0
+        self._started = time.monotonic()
+        self._downtime_seconds = 0.0
+        self._sessions_started = 0
+        self._sessions_ended = 0
+        self._transactions_by_day: Dict[date, int] = {}
+        self._users_offset: Optional[int] = None  # feed offset the last user recount reflects
+        self._pending_user_events: Deque[Tuple[int, int]] = deque(maxlen=MAX_PENDING_USER_EVENTS)
+
+    def _roll_day(self, now: datetime):
+        # Daily aggregates restart at midnight UTC
+        if now.date() != self._day:
+            self._day = now.date()
+            self._response_time_sum = 0.0
+            self._response_time_count = 0
+            # Late transactions for yesterday still land in its tally; older days are dropped
+            for day in [day for day in self._transactions_by_day if day < self._day - timedelta(days=1)]:
+                del self._transactions_by_day[day]
+            self.daily_transactions = self._transactions_by_day.get(self._day, 0)
+
+    def apply(self, event_type: str, value: Optional[float] = None, timestamp: Optional[datetime] = None,
+              offset: Optional[int] = None):
+        """Apply a single change event to the view
+
+        ``offset`` is the position of a user event in the user service's feed.
+        An event the last recount already included is skipped.
+        """
+        timestamp = timestamp or datetime.utcnow()
+        self._roll_day(datetime.utcnow())
+        same_day = timestamp.date() == self._day
+        amount = 1 if value is None else value
+
+        if event_type in USER_EVENT_DELTAS:
+            if offset is not None:
+                if self._users_offset is not None and offset <= self._users_offset:
+                    self.events_skipped += 1
+                    return
+                self._pending_user_events.append((offset, USER_EVENT_DELTAS[event_type] * int(amount)))
+            self.total_users = max(self.total_users + USER_EVENT_DELTAS[event_type] * int(amount), 0)
+        elif event_type == SESSION_STARTED:
+            self._sessions_started += int(amount)
+            self.active_sessions = max(self._sessions_started - self._sessions_ended, 0)
+        elif event_type == SESSION_ENDED:
+            self._sessions_ended += int(amount)
+            self.active_sessions = max(self._sessions_started - self._sessions_ended, 0)
+        elif event_type == TRANSACTION:
+            day = timestamp.date()
+            if day >= self._day - timedelta(days=1):
+                self._transactions_by_day[day] = self._transactions_by_day.get(day, 0) + int(amount)
+            if same_day:
+                self.daily_transactions = self._transactions_by_day[day]
+        elif event_type == RESPONSE_TIME:
+            if value is not None and same_day:
+                self._response_time_sum += value
+                self._response_time_count += 1
+        elif event_type == DOWNTIME:
+            self._downtime_seconds += amount
+        else:
+            raise ValueError(f"Unknown event type '{event_type}'")
+
+        self.events_applied += 1
+
+    def apply_many(self, events: Iterable[Dict[str, Any]]) -> int:
+        """Apply a batch of events given as dicts with type/value/timestamp"""
+        count = 0
+        for event in events:
+            self.apply(event["type"], event.get("value"), event.get("timestamp"))
+            count += 1
+        return count
+
+    @property
+    def system_uptime(self) -> float:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return round(max(0.0, 100.0 * (elapsed - self._downtime_seconds) / elapsed), 2)
+
+    @property
+    def response_time_avg(self) -> float:
+        if not self._response_time_count:
+            return 0.0
+        return round(self._response_time_sum / self._response_time_count, 3)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current KPI values, in ``MetricsResponse`` shape"""
+        self._roll_day(datetime.utcnow())
+        return {
+            "total_users": self.total_users,
+            "active_sessions": self.active_sessions,
+            "daily_transactions": self.daily_transactions,
+            "system_uptime": self.system_uptime,
+            "response_time_avg": self.response_time_avg
+        }
+
+    def recount(self) -> Dict[str, int]:
+        """Sessions and transactions recomputed from their tallies"""
+        self._roll_day(datetime.utcnow())
+        return {
+            "active_sessions": max(self._sessions_started - self._sessions_ended, 0),
+            "daily_transactions": self._transactions_by_day.get(self._day, 0),
+        }
+
+    def reconcile(self, recomputed: Dict[str, Any], users_offset: Optional[int] = None) -> Dict[str, int]:
+        """Overwrite counters with a full recompute and return the drift found
+
+        Every counter is rebuilt: sessions and transactions from the tallies
+        (or from ``recomputed`` when it recounts them), users from
+        ``recomputed``. ``users_offset`` is the feed offset the user count
+        reflects; feed events past it that were already applied are added on
+        top, and those at or below it are skipped from now on.
+        """
+        drift = {}
+        recount = self.recount()
+        if recomputed.get("active_sessions") is not None:
+            self._sessions_started, self._sessions_ended = int(recomputed["active_sessions"]), 0
+            recount["active_sessions"] = int(recomputed["active_sessions"])
+        if recomputed.get("daily_transactions") is not None:
+            self._transactions_by_day[self._day] = int(recomputed["daily_transactions"])
+            recount["daily_transactions"] = int(recomputed["daily_transactions"])
+        if recomputed.get("total_users") is not None:
+            total_users = int(recomputed["total_users"])
+            if users_offset is not None:
+                self._pending_user_events = deque(
+                    ((offset, delta) for offset, delta in self._pending_user_events if offset > users_offset),
+                    maxlen=MAX_PENDING_USER_EVENTS
+                )
+                total_users += sum(delta for _, delta in self._pending_user_events)
+                self._users_offset = users_offset
+            recount["total_users"] = max(total_users, 0)
+        for field, value in recount.items():
+            drift[field] = value - getattr(self, field)
+            setattr(self, field, value)
+        self.last_reconciled_at = datetime.utcnow()
+        self.last_drift = drift
+        if any(drift.values()):
+            logger.warning(f"Dashboard view drift corrected: {drift}")
+        return drift
+
+    def status(self) -> Dict[str, Any]:
+        """Bookkeeping information about the view"""
+        return {
+            "events_applied": self.events_applied,
+            "events_skipped": self.events_skipped,
+            "users_offset": self._users_offset,
+            "last_reconciled_at": self.last_reconciled_at.isoformat() if self.last_reconciled_at else None,
+            "last_drift": self.last_drift
+        }
@@ -0,0 +1,302 @@
+"""Streaming export encoders for the data service
+
+Rows are produced lazily and encoded chunk by chunk, so an export of any size
+runs in constant memory. Optional formats and codecs (Parquet/Arrow through
+pyarrow, zstd through zstandard) are imported only when requested.
+"""
+import csv
+import io
+import json
+import random
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Rows are grouped into chunks before encoding; each chunk becomes one
+# CSV/NDJSON write, one Parquet row group or one Arrow record batch.
+EXPORT_CHUNK_ROWS = 10_000
+
+ANALYTICS_COLUMNS = ["metric_name", "value", "timestamp", "category"]
+
+ANALYTICS_METRICS = {
+    "user_activity": ["page_views", "user_logins", "session_duration"],
+    "system_performance": ["cpu_usage", "memory_usage", "disk_usage"],
+    "business_metrics": ["revenue", "conversion_rate", "customer_satisfaction"],
+    "security": ["failed_logins", "security_alerts", "blocked_requests"]
+}
+
+EXPORT_FORMATS = {
+    "csv": {"media_type": "text/csv", "extension": "csv"},
+    "ndjson": {"media_type": "application/x-ndjson", "extension": "ndjson"},
+    "parquet": {"media_type": "application/vnd.apache.parquet", "extension": "parquet"},
+    "arrow": {"media_type": "application/vnd.apache.arrow.stream", "extension": "arrows"},
+}
+
+EXPORT_COMPRESSIONS = {
+    "none": {"media_type": None, "extension": ""},
+    "gzip": {"media_type": "application/gzip", "extension": ".gz"},
+    "zstd": {"media_type": "application/zstd", "extension": ".zst"},
+}
+
+class ExportError(Exception):
+    """Raised when an export cannot be produced (unknown format, missing codec)"""
+
+def iter_sample_analytics(total_rows: int, snapshot: int) -> Iterator[Dict[str, Any]]:
+    """Yield deterministic sample analytics rows for an export snapshot
+
+    The same ``(total_rows, snapshot)`` pair always yields the same rows, which
+    is what makes byte-range resume of an interrupted download possible.
+    """
+    rng = random.Random(snapshot)
+    pairs = [(category, metric) for category, metrics in ANALYTICS_METRICS.items() for metric in metrics]
+    end = datetime(2000, 1, 1) + timedelta(seconds=snapshot % (30 * 365 * 86400))
+    step = timedelta(seconds=10)
+    for i in range(total_rows):
+        category, metric = pairs[i % len(pairs)]
+        yield {
+            "metric_name": metric,
+            "value": round(rng.uniform(10, 100), 2),
+            "timestamp": end - step * (total_rows - 1 - i),
+            "category": category
+        }
+
+def chunked(rows: Iterable[Dict[str, Any]], size: int = EXPORT_CHUNK_ROWS) -> Iterator[List[Dict[str, Any]]]:
+    """Group rows into lists of at most ``size`` rows"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _format_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def encode_csv(chunks: Iterable[List[Dict[str, Any]]], columns: List[str]) -> Iterator[bytes]:
+    """Encode row chunks as CSV with a single header line"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for chunk in chunks:
+        writer.writerows([_format_value(row.get(column)) for column in columns] for row in chunk)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def encode_ndjson(chunks: Iterable[List[Dict[str, Any]]], columns: List[str]) -> Iterator[bytes]:
+    """Encode row chunks as newline-delimited JSON"""
+    for chunk in chunks:
+        lines = [
+            json.dumps({column: _format_value(row.get(column)) for column in columns}, separators=(",", ":"))
+            for row in chunk
+        ]
+        lines.append("")
+        yield "\n".join(lines).encode("utf-8")
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the generator"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ExportError("Parquet/Arrow export requires the 'pyarrow' package")
+    return pyarrow
+
+def _arrow_batches(pa, chunks: Iterable[List[Dict[str, Any]]], columns: List[str]):
+    for chunk in chunks:
+        yield pa.RecordBatch.from_pydict({column: [row.get(column) for row in chunk] for column in columns})
+
+def encode_parquet(chunks: Iterable[List[Dict[str, Any]]], columns: List[str]) -> Iterator[bytes]:
+    """Encode row chunks as a Parquet file, one row group per chunk"""
+    pa = _import_pyarrow()
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = None
+    for batch in _arrow_batches(pa, chunks, columns):
+        if writer is None:
+            writer = pq.ParquetWriter(sink, batch.schema, compression="snappy")
+        writer.write_batch(batch)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+    yield sink.drain()
+
+def encode_arrow(chunks: Iterable[List[Dict[str, Any]]], columns: List[str]) -> Iterator[bytes]:
+    """Encode row chunks as an Arrow IPC stream, one record batch per chunk"""
+    pa = _import_pyarrow()
+
+    sink = _ChunkSink()
+    writer = None
+    for batch in _arrow_batches(pa, chunks, columns):
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, batch.schema)
+        writer.write_batch(batch)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+    yield sink.drain()
+
+ENCODERS: Dict[str, Callable[[Iterable[List[Dict[str, Any]]], List[str]], Iterator[bytes]]] = {
+    "csv": encode_csv,
+    "ndjson": encode_ndjson,
+    "parquet": encode_parquet,
+    "arrow": encode_arrow,
+}
+
+def _make_compressor(compression: str):
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ExportError("zstd compression requires the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    return None
+
+def compress_stream(parts: Iterable[bytes], compression: str) -> Iterator[bytes]:
+    """Compress a byte stream incrementally with gzip or zstd"""
+    compressor = _make_compressor(compression)
+    if compressor is None:
+        yield from parts
+        return
+    for part in parts:
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def build_export_stream(
+    rows_factory: Callable[[], Iterable[Dict[str, Any]]],
+    format: str,
+    columns: List[str],
+    compression: str = "none",
+) -> Callable[[], Iterator[bytes]]:
+    """Return a factory producing the encoded (and compressed) export stream
+
+    Codec availability is checked eagerly so that a missing optional package
+    turns into an error response instead of a truncated download.
+    """
+    if format not in ENCODERS:
+        raise ExportError(f"Format '{format}' not supported")
+    if compression not in EXPORT_COMPRESSIONS:
+        raise ExportError(f"Compression '{compression}' not supported")
+    if format in ("parquet", "arrow"):
+        _import_pyarrow()
+    _make_compressor(compression)
+
+    encoder = ENCODERS[format]
+
+    def stream() -> Iterator[bytes]:
+        encoded = encoder(chunked(rows_factory()), columns)
+        for part in compress_stream(encoded, compression):
+            if part:
+                yield part
+
+    return stream
+
+def stream_length(stream_factory: Callable[[], Iterator[bytes]]) -> int:
+    """Count the bytes of a stream without holding it in memory"""
+    return sum(len(part) for part in stream_factory())
+
+class ExportLengthCache:
+    """Total byte length of reproducible exports, keyed by ETag
+
+    A length is recorded whenever an export stream is read to the end, so a
+    download that completes (or is resumed to the end) is never counted
+    again. Oldest entries are evicted past ``max_entries``.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._lengths: "OrderedDict[str, int]" = OrderedDict()
+
+    def get(self, etag: str) -> Optional[int]:
+        length = self._lengths.get(etag)
+        if length is not None:
+            self._lengths.move_to_end(etag)
+        return length
+
+    def put(self, etag: str, length: int):
+        self._lengths[etag] = length
+        self._lengths.move_to_end(etag)
+        while len(self._lengths) > self.max_entries:
+            self._lengths.popitem(last=False)
+
+    def recording(self, etag: str, parts: Iterable[bytes]) -> Iterator[bytes]:
+        """Pass a full export stream through, recording its length if it is read to the end"""
+        length = 0
+        for part in parts:
+            length += len(part)
+            yield part
+        self.put(etag, length)
+
+def parse_byte_range(range_header: Optional[str]) -> Optional[Tuple[int, Optional[int]]]:
+    """Parse a single ``bytes=N-`` or ``bytes=N-M`` Range header
+
+    Multi-range and suffix (``bytes=-N``) requests are not used for resume and
+    are ignored, which makes the server fall back to a full 200 response.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec or spec.startswith("-"):
+        return None
+    start, _, end = spec.partition("-")
+    if not start.isdigit() or (end and not end.isdigit()):
+        return None
+    if end and int(end) < int(start):
+        return None
+    return int(start), int(end) if end else None
+
+def slice_bytes(parts: Iterable[bytes], start: int, end: Optional[int] = None) -> Iterator[bytes]:
+    """Yield only bytes ``start..end`` (inclusive) of a stream, used for Range resume"""
+    position = 0
+    for part in parts:
+        part_start, part_end = position, position + len(part)
+        position = part_end
+        if part_end <= start:
+            continue
+        if end is not None and part_start > end:
+            break
+        lo = max(start - part_start, 0)
+        hi = len(part) if end is None else min(end + 1 - part_start, len(part))
+        yield part[lo:hi]
+
+def export_filename(data_type: str, format: str, compression: str) -> str:
+    """Build the download filename for an export"""
+    return f"{data_type}.{EXPORT_FORMATS[format]['extension']}{EXPORT_COMPRESSIONS[compression]['extension']}"
+
+def export_media_type(format: str, compression: str) -> str:
+    """Media type of the export body (the container type when compressed)"""
+    return EXPORT_COMPRESSIONS[compression]["media_type"] or EXPORT_FORMATS[format]["media_type"]
@@ -1,20 +1,95 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager
+import asyncio
 import logging
+import math
 import random
 import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# The shared package lives in the backend root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from shared.config import get_settings
+from shared.logging_config import setup_logging
+from shared.events import follow_user_events
+from shared.tracing import setup_tracing, traced_client
+from shared.profiling import setup_profiling
+from shared.metrics import instrument_app, track_upstream
+from shared.responses import FastJSONResponse
+from shared.conditional import conditional_response
+from shared.startup import StartupReport
+
+from downsample import DOWNSAMPLING_METHODS, downsample
+from dashboard_view import EVENT_TYPES, USER_CREATED, USER_DELETED, DashboardMetricsView
+from export import (
+    ANALYTICS_COLUMNS,
+    EXPORT_CHUNK_ROWS,
+    EXPORT_FORMATS,
+    ExportError,
+    ExportLengthCache,
+    build_export_stream,
+    export_filename,
+    export_media_type,
+    iter_sample_analytics,
+    parse_byte_range,
+    slice_bytes,
+    stream_length,
+)
+from realtime import REALTIME_MODES, MetricsBroadcaster, parse_metric_keys
+from rollups import RollupStore
+from segments import SegmentStore
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+settings = get_settings()
+setup_logging(
+    "data-service",
+    settings.log_level,
+    async_mode=settings.log_async,
+    queue_size=settings.log_queue_size,
+    overflow_policy=settings.log_overflow_policy,
+    sample_rates=settings.log_sample_rates,
+    json_backend=settings.log_json_backend,
+    log_format=settings.log_format
+)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup = StartupReport("data-service")
+    with startup.phase("open_analytics_store"):
+        await asyncio.to_thread(analytics_store.open)
+    analytics_store.start()
+    app.state.dashboard_reconciler = asyncio.create_task(reconcile_dashboard_view_periodically())
+    app.state.user_events = follow_user_events(
+        "data-service", apply_user_event, settings, on_gap=reconcile_dashboard_view, user_service_url=USER_SERVICE_URL
+    )
+    app.state.user_events.start()
+    app.state.startup = startup.ready()
+    yield
+    await app.state.user_events.stop()
+    app.state.dashboard_reconciler.cancel()
+    await realtime_broadcaster.stop()
+    await analytics_store.stop()
+
 app = FastAPI(
     title="DQA Data Service",
     description="Data Processing and Analytics Microservice",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -25,10 +100,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    # FastAPI's default handler echoes the rejected input with the stdlib encoder, which
+    # raises on NaN/infinity; FastJSONResponse renders those as null instead
+    return FastJSONResponse(status_code=422, content={"detail": jsonable_encoder(exc.errors())})
+
+instrument_app(app, "data-service", enabled=settings.enable_metrics)
+setup_tracing(app, "data-service", settings)
+setup_profiling(app, "data-service", settings)
+
+USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://localhost:8001")
+
+# Dashboard KPIs are maintained incrementally and reconciled periodically
+dashboard_view = DashboardMetricsView()
+DASHBOARD_RECONCILE_SECONDS = 300
+
+# Rollup buckets with quantile/distinct-count sketches, fed by /ingest/events
+rollup_store = RollupStore(bucket_seconds=60)
+
+# Analytics points, in time-partitioned columnar segments on disk
+analytics_store = SegmentStore(
+    settings.analytics_data_dir,
+    partition_seconds=settings.analytics_partition_hours * 3600,
+    flush_rows=settings.analytics_flush_rows,
+    flush_seconds=settings.analytics_flush_seconds,
+    compact_min_segments=settings.analytics_compact_min_segments,
+    compact_target_rows=settings.analytics_compact_target_rows,
+    retention_seconds=settings.analytics_retention_days * 86400,
+    maintenance_seconds=settings.analytics_maintenance_seconds
+)
+
+# Line charts: raw series resolution and bounds on what one request may ask for
+CHART_STEP_SECONDS = 10
+MAX_CHART_SOURCE_POINTS = 200_000  # long sample ranges use a coarser step, a multiple of CHART_STEP_SECONDS
+DEFAULT_CHART_RANGE = timedelta(days=7)
+MAX_CHART_RANGE = timedelta(days=366)
+MAX_CHART_POINTS = 10_000
+
+# Byte lengths of finished analytics exports, so resumes do not re-encode just to count
+export_lengths = ExportLengthCache()
+
+# Shared realtime sampler, one per process
+realtime_broadcaster = MetricsBroadcaster(interval=1.0)
+SSE_HEARTBEAT_SECONDS = 15.0
+
 # Pydantic Models
 class AnalyticsData(BaseModel):
     metric_name: str
-    value: float
+    value: float = Field(allow_inf_nan=False)
     timestamp: datetime
     category: str
 
@@ -43,6 +163,16 @@ class ReportResponse(BaseModel):
     generated_at: datetime
     data: Dict[str, Any]
 
+class IngestEvent(BaseModel):
+    type: str
+    value: Optional[float] = Field(None, allow_inf_nan=False)
+    timestamp: Optional[datetime] = None
+    user_id: Optional[str] = None
+
+class RollupMergeRequest(BaseModel):
+    metric: str
+    buckets: List[Dict[str, Any]]
+
 class MetricsResponse(BaseModel):
     total_users: int
     active_sessions: int
@@ -74,28 +204,107 @@ def generate_sample_analytics() -> List[AnalyticsData]:
     return data
 
 def generate_dashboard_metrics() -> MetricsResponse:
-    """Generate sample dashboard metrics"""
-    return MetricsResponse(
-        total_users=random.randint(1000, 5000),
-        active_sessions=random.randint(50, 200),
-        daily_transactions=random.randint(500, 2000),
-        system_uptime=round(random.uniform(95.0, 99.9), 2),
-        response_time_avg=round(random.uniform(0.1, 2.0), 3)
+    """Read dashboard metrics from the incrementally maintained view"""
+    return MetricsResponse(**dashboard_view.snapshot())
+
+async def recompute_dashboard_metrics() -> Dict[str, Any]:
+    """Recompute dashboard counters from their sources of truth"""
+    async with traced_client(timeout=5.0) as client:
+        with track_upstream("user", "GET") as call:
+            response = await client.get(f"{USER_SERVICE_URL}/users/stats")
+            call.status = response.status_code
+        response.raise_for_status()
+        stats = response.json()
+        return {"total_users": stats["total_users"], "users_offset": stats.get("offset")}
+
+async def reconcile_dashboard_view() -> Dict[str, int]:
+    """Run a full recompute and fold it into the dashboard view"""
+    recomputed = await recompute_dashboard_metrics()
+    return dashboard_view.reconcile(recomputed, users_offset=recomputed.pop("users_offset"))
+
+def apply_user_event(event: Dict[str, Any]):
+    """Fold a user-service change event into the dashboard view"""
+    if event["type"] in (USER_CREATED, USER_DELETED):
+        dashboard_view.apply(event["type"], offset=event["offset"])
+
+async def reconcile_dashboard_view_periodically():
+    while True:
+        try:
+            await reconcile_dashboard_view()
+        except Exception as e:
+            logger.warning(f"Dashboard view reconciliation failed: {str(e)}")
+        await asyncio.sleep(DASHBOARD_RECONCILE_SECONDS)
+
+def parse_date_range(date_range: Dict[str, str]):
+    """Parse a report date_range ({"start": ..., "end": ...}) into datetimes"""
+    start = date_range.get("start") if date_range else None
+    end = date_range.get("end") if date_range else None
+    return (
+        datetime.fromisoformat(start) if start else None,
+        datetime.fromisoformat(end) if end else None
     )
 
-def generate_chart_data(chart_type: str) -> Dict[str, Any]:
-    """Generate sample chart data"""
-    if chart_type == "line":
-        return {
-            "labels": [f"Day {i+1}" for i in range(7)],
-            "datasets": [{
-                "label": "User Activity",
-                "data": [random.randint(100, 500) for _ in range(7)],
-                "borderColor": "rgb(75, 192, 192)",
-                "tension": 0.1
-            }]
+def as_utc_naive(value: datetime) -> datetime:
+    # Naive datetimes in this service are UTC (datetime.utcnow())
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def epoch_ms(value: datetime) -> int:
+    return int(value.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+def sample_activity_series(start: datetime, end: datetime, step: int = CHART_STEP_SECONDS) -> Tuple[np.ndarray, np.ndarray]:
+    """Sample user-activity series at ``step`` resolution over [start, end)
+
+    Values are a pure function of the timestamp (daily and weekly cycles
+    plus hashed noise), so overlapping ranges agree point for point.
+    """
+    start_epoch = start.replace(tzinfo=timezone.utc).timestamp()
+    end_epoch = end.replace(tzinfo=timezone.utc).timestamp()
+    first = -(-int(start_epoch) // step) * step
+    timestamps = np.arange(first, end_epoch, step, dtype=np.int64)
+    t = timestamps.astype(np.float64)
+    noise = np.modf(np.sin(t * 12.9898) * 43758.5453)[0]
+    values = 300 + 150 * np.sin(2 * np.pi * t / 86400) + 40 * np.sin(2 * np.pi * t / 604800) + 25 * noise
+    return timestamps, values
+
+def generate_line_chart(start: datetime, end: datetime, points: int, method: str,
+                        metric: Optional[str] = None, category: Optional[str] = None) -> Dict[str, Any]:
+    """Line chart over [start, end), downsampled server-side to at most ``points`` points
+
+    Charts a stored metric when ``metric`` is given, the sample activity series otherwise.
+    """
+    if metric is None:
+        span = (end - start).total_seconds()
+        step = CHART_STEP_SECONDS * max(math.ceil(span / (CHART_STEP_SECONDS * MAX_CHART_SOURCE_POINTS)), 1)
+        timestamps, values = sample_activity_series(start, end, step)
+        unit, label = "s", "User Activity"
+    else:
+        scan = analytics_store.scan(epoch_ms(start), epoch_ms(end), metric, category)
+        timestamps, values = scan.timestamps, scan.values
+        unit, label = "ms", metric
+    source_points = len(timestamps)
+    timestamps, values = downsample(timestamps, values, points, method)
+    return {
+        "labels": np.datetime_as_string(timestamps.astype(f"datetime64[{unit}]"), unit="s").tolist(),
+        "datasets": [{
+            "label": label,
+            "data": np.round(values, 2).tolist(),
+            "borderColor": "rgb(75, 192, 192)",
+            "tension": 0.1
+        }],
+        "downsampling": {
+            "method": method,
+            "source_points": source_points,
+            "points": len(timestamps),
+            "start": start.isoformat(),
+            "end": end.isoformat()
         }
-    elif chart_type == "bar":
+    }
+
+def generate_chart_data(chart_type: str) -> Dict[str, Any]:
+    """Generate sample chart data (categorical charts; see generate_line_chart)"""
+    if chart_type == "bar":
         return {
             "labels": ["Jan", "Feb", "Mar", "Apr", "May", "Jun"],
             "datasets": [{
@@ -129,6 +338,7 @@ async def health_check():
 
 @app.get("/analytics", response_model=List[AnalyticsData])
 async def get_analytics(
+    request: Request,
     category: Optional[str] = Query(None, description="Filter by category"),
     limit: int = Query(50, description="Limit number of results")
 ):
@@ -142,18 +352,144 @@ async def get_analytics(
     data.sort(key=lambda x: x.timestamp, reverse=True)
     
     logger.info(f"Retrieved {len(data[:limit])} analytics records")
-    return data[:limit]
+    return conditional_response(request, data[:limit], List[AnalyticsData])
+
+@app.post("/analytics/points")
+async def store_analytics_points(points: List[AnalyticsData]):
+    """Append analytics points to the segment store"""
+    if not points:
+        return {"accepted": 0}
+    accepted = await run_in_threadpool(
+        analytics_store.append,
+        [epoch_ms(as_utc_naive(point.timestamp)) for point in points],
+        [point.metric_name for point in points],
+        [point.category for point in points],
+        [point.value for point in points]
+    )
+    return {"accepted": accepted}
+
+@app.get("/analytics/points/summary")
+async def summarize_analytics_points(
+    metric: Optional[str] = Query(None, description="Only points of this metric"),
+    category: Optional[str] = Query(None, description="Only points of this category"),
+    start: Optional[datetime] = Query(None, description="Range start, inclusive"),
+    end: Optional[datetime] = Query(None, description="Range end, exclusive")
+):
+    """Count, sum, min, max and mean of stored points, with how many segments the scan read"""
+    start_ms = epoch_ms(as_utc_naive(start)) if start else None
+    end_ms = epoch_ms(as_utc_naive(end)) if end else None
+    if start_ms is not None and end_ms is not None and start_ms >= end_ms:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    scan = await run_in_threadpool(analytics_store.scan, start_ms, end_ms, metric, category)
+    values = scan.values
+    summary = {"count": len(values), "sum": None, "min": None, "max": None, "mean": None, "first": None, "last": None}
+    if len(values):
+        summary.update(
+            sum=float(values.sum()),
+            min=float(values.min()),
+            max=float(values.max()),
+            mean=float(values.mean()),
+            first=datetime.utcfromtimestamp(scan.timestamps[0] / 1000).isoformat(),
+            last=datetime.utcfromtimestamp(scan.timestamps[-1] / 1000).isoformat()
+        )
+    return {
+        "metric": metric,
+        "category": category,
+        **summary,
+        "segments_scanned": scan.segments_scanned,
+        "segments_skipped": scan.segments_skipped
+    }
+
+@app.get("/analytics/storage")
+async def analytics_storage_status():
+    """Partitions, segments, rows and bytes in the segment store"""
+    return analytics_store.stats()
+
+@app.get("/analytics/rollups")
+async def get_rollup_summary(
+    request: Request,
+    metric: str = Query(..., description="Metric (ingested event type) to summarise"),
+    start: Optional[datetime] = Query(None, description="Range start (inclusive)"),
+    end: Optional[datetime] = Query(None, description="Range end (exclusive)"),
+    quantiles: str = Query("0.5,0.95,0.99", description="Comma-separated quantiles")
+):
+    """Quantiles and distinct users for a metric over a time range, from rollup sketches"""
+    try:
+        qs = [float(q) for q in quantiles.split(",") if q.strip()]
+        return conditional_response(request, rollup_store.query(metric, start, end, qs))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/analytics/rollups/export")
+async def export_rollups(
+    metric: str = Query(..., description="Metric to export"),
+    start: Optional[datetime] = Query(None, description="Range start (inclusive)"),
+    end: Optional[datetime] = Query(None, description="Range end (exclusive)")
+):
+    """Serialised rollup buckets, for merging into another shard"""
+    return {"metric": metric, "bucket_seconds": rollup_store.bucket_seconds, "buckets": rollup_store.export(metric, start, end)}
+
+@app.post("/analytics/rollups/merge")
+async def merge_rollups(request: RollupMergeRequest):
+    """Merge rollup buckets exported by another shard"""
+    try:
+        merged = rollup_store.merge_serialized(request.metric, request.buckets)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rollup buckets: {str(e)}")
+    return {"metric": request.metric, "merged": merged}
 
 @app.get("/metrics", response_model=MetricsResponse)
-async def get_dashboard_metrics():
+async def get_dashboard_metrics(request: Request):
     """Get current dashboard metrics"""
-    metrics = generate_dashboard_metrics()
-    logger.info("Generated dashboard metrics")
-    return metrics
+    return conditional_response(request, generate_dashboard_metrics())
+
+@app.post("/ingest/events")
+async def ingest_events(events: List[IngestEvent]):
+    """Apply change events (users, sessions, transactions, timings) to the dashboard view"""
+    unknown = sorted({event.type for event in events} - set(EVENT_TYPES))
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown event types: {', '.join(unknown)}. Use: {', '.join(EVENT_TYPES)}"
+        )
+    
+    accepted = dashboard_view.apply_many(event.dict() for event in events)
+    for event in events:
+        if event.value is not None or event.user_id is not None:
+            rollup_store.record(event.type, event.value, event.timestamp, event.user_id)
+    return {"accepted": accepted}
+
+@app.post("/metrics/reconcile")
+async def reconcile_dashboard_metrics():
+    """Force a full recompute of the dashboard view"""
+    try:
+        drift = await reconcile_dashboard_view()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Reconciliation failed: {str(e)}")
+    return {"drift": drift, **dashboard_view.status()}
+
+@app.get("/metrics/status")
+async def dashboard_metrics_status():
+    """Bookkeeping for the dashboard view (events applied, last reconcile, user event feed)"""
+    return {**dashboard_view.status(), "user_events": app.state.user_events.status()}
 
 @app.get("/charts/{chart_type}")
-async def get_chart_data(chart_type: str):
-    """Get chart data for different visualization types"""
+async def get_chart_data(
+    chart_type: str,
+    request: Request,
+    points: int = Query(1000, ge=4, le=MAX_CHART_POINTS, description="Most points per series (line charts)"),
+    start: Optional[datetime] = Query(None, description="Range start, inclusive (default: end - 7 days)"),
+    end: Optional[datetime] = Query(None, description="Range end, exclusive (default: now)"),
+    method: str = Query("lttb", description="Downsampling method: lttb or minmax"),
+    metric: Optional[str] = Query(None, description="Stored metric to chart (line charts; default: sample activity)"),
+    category: Optional[str] = Query(None, description="Only points of this category (with metric)")
+):
+    """Get chart data for different visualization types
+    
+    Line charts are time series downsampled server-side, so the payload is
+    bounded by ``points`` whatever the range. Bar and pie charts ignore the
+    range parameters.
+    """
     supported_types = ["line", "bar", "pie"]
     
     if chart_type not in supported_types:
@@ -162,14 +498,33 @@ async def get_chart_data(chart_type: str):
             detail=f"Chart type '{chart_type}' not supported. Use: {', '.join(supported_types)}"
         )
     
-    chart_data = generate_chart_data(chart_type)
+    if chart_type == "line":
+        if method not in DOWNSAMPLING_METHODS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Downsampling method '{method}' not supported. Use: {', '.join(DOWNSAMPLING_METHODS)}"
+            )
+        end = as_utc_naive(end) if end else datetime.utcnow()
+        start = as_utc_naive(start) if start else end - DEFAULT_CHART_RANGE
+        if start >= end:
+            raise HTTPException(status_code=400, detail="start must be before end")
+        if end - start > MAX_CHART_RANGE:
+            raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_CHART_RANGE.days} days")
+        # Building and downsampling up to a few million points is CPU work: keep it off the event loop
+        chart_data = await run_in_threadpool(generate_line_chart, start, end, points, method, metric, category)
+    else:
+        chart_data = generate_chart_data(chart_type)
     logger.info(f"Generated {chart_type} chart data")
-    return chart_data
+    return conditional_response(request, chart_data)
 
 @app.post("/reports", response_model=ReportResponse)
 async def generate_report(request: ReportRequest):
     """Generate a data report based on request parameters"""
     report_id = f"report_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{random.randint(1000, 9999)}"
+    try:
+        range_start, range_end = parse_date_range(request.date_range)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date_range: {str(e)}")
     
     # Sample report data based on type
     if request.report_type == "user_activity":
@@ -188,6 +543,9 @@ async def generate_report(request: ReportRequest):
                 for i in range(7)
             ]
         }
+        # Distinct active users from the rollup HyperLogLogs, when available
+        if rollup_store.metrics():
+            report_data["summary"]["active_users"] = rollup_store.distinct_users(range_start, range_end)
     elif request.report_type == "system_performance":
         report_data = {
             "summary": {
@@ -205,6 +563,12 @@ async def generate_report(request: ReportRequest):
                 for i in range(24)
             ]
         }
+        # Real latency percentiles when response times have been ingested
+        latency = rollup_store.query("response_time", range_start, range_end)
+        if latency["count"]:
+            report_data["summary"]["avg_response_time"] = round(latency["avg"], 3)
+            report_data["summary"]["response_time_percentiles"] = latency["quantiles"]
+            report_data["summary"]["distinct_users"] = latency["distinct_users"]
     else:
         report_data = {
             "message": f"Report type '{request.report_type}' not implemented yet",
@@ -222,9 +586,9 @@ async def generate_report(request: ReportRequest):
     return report
 
 @app.get("/reports")
-async def list_reports():
+async def list_reports(request: Request):
     """List available reports"""
-    return {
+    return conditional_response(request, {
         "available_reports": [
             {
                 "type": "user_activity",
@@ -242,16 +606,20 @@ async def list_reports():
                 "parameters": ["date_range", "filters"]
             }
         ]
-    }
+    })
 
 @app.get("/export/{format}")
 async def export_data(
+    request: Request,
     format: str,
     data_type: str = Query(..., description="Type of data to export"),
-    date_range: Optional[str] = Query(None, description="Date range filter")
+    date_range: Optional[str] = Query(None, description="Date range filter"),
+    rows: int = Query(EXPORT_CHUNK_ROWS, ge=1, le=100_000_000, description="Number of analytics rows to export"),
+    compression: str = Query("none", description="Compression codec: none, gzip or zstd"),
+    snapshot: Optional[int] = Query(None, description="Export snapshot id, reuse it to resume a download")
 ):
-    """Export data in different formats (JSON, CSV, etc.)"""
-    supported_formats = ["json", "csv"]
+    """Export data in different formats (JSON, CSV, NDJSON, Parquet, Arrow)"""
+    supported_formats = ["json"] + list(EXPORT_FORMATS)
     
     if format not in supported_formats:
         raise HTTPException(
@@ -259,38 +627,113 @@ async def export_data(
             detail=f"Format '{format}' not supported. Use: {', '.join(supported_formats)}"
         )
     
-    # Generate sample export data
-    if data_type == "analytics":
-        data = generate_sample_analytics()
-        export_data = [item.dict() for item in data]
-    elif data_type == "metrics":
-        metrics = generate_dashboard_metrics()
-        export_data = metrics.dict()
-    else:
+    if data_type not in ("analytics", "metrics"):
         raise HTTPException(status_code=400, detail=f"Data type '{data_type}' not supported")
     
-    logger.info(f"Exported {data_type} data in {format} format")
-    
     if format == "json":
+        if data_type == "analytics":
+            export_data = [item.dict() for item in generate_sample_analytics()]
+        else:
+            export_data = generate_dashboard_metrics().dict()
+        logger.info(f"Exported {data_type} data in {format} format")
         return {"format": "json", "data": export_data}
-    elif format == "csv":
-        # In a real implementation, you would convert to CSV format
-        return {"format": "csv", "message": "CSV export would be implemented here", "data": export_data}
+    
+    # Streamed formats: rows are generated, encoded and compressed chunk by chunk
+    if data_type == "analytics":
+        if snapshot is None:
+            snapshot = random.randint(1, 2**31 - 1)
+        rows_factory = lambda: iter_sample_analytics(rows, snapshot)
+        columns = ANALYTICS_COLUMNS
+    else:
+        metrics = generate_dashboard_metrics().dict()
+        rows_factory = lambda: [metrics]
+        columns = list(metrics)
+    
+    try:
+        stream_factory = build_export_stream(rows_factory, format, columns, compression)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    headers = {
+        "Content-Disposition": f'attachment; filename="{export_filename(data_type, format, compression)}"'
+    }
+    media_type = export_media_type(format, compression)
+    
+    # Only snapshot-backed analytics exports are byte-for-byte reproducible, so
+    # only those advertise and honour Range requests for resuming downloads.
+    if data_type == "analytics":
+        etag = f'"{data_type}-{format}-{compression}-{rows}-{snapshot}"'
+        headers.update({"Accept-Ranges": "bytes", "ETag": etag, "X-Export-Snapshot": str(snapshot)})
+        
+        byte_range = parse_byte_range(request.headers.get("Range"))
+        if_range = request.headers.get("If-Range")
+        if byte_range and (if_range is None or if_range == etag):
+            start, end = byte_range
+            total = export_lengths.get(etag)
+            if total is None:
+                # Content-Range and 416 need the real length before any byte is sent. Counting
+                # encodes (and compresses) the whole export once more, which doubles the work
+                # of the first resume of a large export; the length is then cached per ETag,
+                # and a full download that completes records it as it streams.
+                total = await run_in_threadpool(stream_length, stream_factory)
+                export_lengths.put(etag, total)
+            if start >= total:
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{total}"})
+            end = total - 1 if end is None else min(end, total - 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+            logger.info(f"Resuming {data_type} export in {format} format at byte {start}")
+            return StreamingResponse(
+                slice_bytes(export_lengths.recording(etag, stream_factory()), start, end),
+                status_code=206,
+                media_type=media_type,
+                headers=headers
+            )
+    
+    logger.info(f"Exporting {data_type} data in {format} format ({compression} compression)")
+    parts = stream_factory()
+    if data_type == "analytics":
+        parts = export_lengths.recording(etag, parts)
+    return StreamingResponse(parts, media_type=media_type, headers=headers)
 
 @app.get("/realtime/metrics")
 async def get_realtime_metrics():
-    """Get real-time system metrics"""
-    return {
-        "timestamp": datetime.utcnow().isoformat(),
-        "metrics": {
-            "active_connections": random.randint(10, 100),
-            "requests_per_second": random.randint(50, 500),
-            "cpu_usage": round(random.uniform(20, 80), 2),
-            "memory_usage": round(random.uniform(30, 90), 2),
-            "disk_io": round(random.uniform(10, 100), 2)
-        }
-    }
+    """Get real-time system metrics (latest shared sample)"""
+    if realtime_broadcaster.latest is not None and realtime_broadcaster.subscriber_count:
+        return realtime_broadcaster.latest
+    return realtime_broadcaster.sample()
+
+@app.get("/realtime/stream")
+async def stream_realtime_metrics(
+    keys: Optional[str] = Query(None, description="Comma-separated metric keys to subscribe to"),
+    mode: str = Query("delta", description="delta (changed values only) or full (every key on each update)")
+):
+    """Push real-time system metrics as Server-Sent Events"""
+    if mode not in REALTIME_MODES:
+        raise HTTPException(status_code=400, detail=f"Mode '{mode}' not supported. Use: {', '.join(REALTIME_MODES)}")
+    try:
+        metric_keys = parse_metric_keys(keys)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def event_stream():
+        subscription = realtime_broadcaster.subscribe(metric_keys, deltas=(mode != "full"))
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                update = await subscription.next_update(timeout=SSE_HEARTBEAT_SECONDS)
+                if update is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {update['seq']}\nevent: metrics\ndata: {json.dumps(update)}\n\n"
+        finally:
+            realtime_broadcaster.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8003, reload=True)
\ No newline at end of file
+    from shared.server import serve
+    serve("main:app", port=8003, reload=True)
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""Shared realtime metrics sampler with push fan-out
+
+One sampler task per process produces a sample every ``interval`` seconds and
+hands it to every subscriber. Each subscriber holds at most one pending value
+per metric key, so a slow consumer only ever sees coalesced (latest) values
+and never causes unbounded buffering.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+REALTIME_METRIC_KEYS = ["active_connections", "requests_per_second", "cpu_usage", "memory_usage", "disk_io"]
+REALTIME_MODES = ("delta", "full")
+
+def sample_realtime_metrics() -> Dict[str, Any]:
+    """Take one sample of the realtime system metrics"""
+    return {
+        "active_connections": random.randint(10, 100),
+        "requests_per_second": random.randint(50, 500),
+        "cpu_usage": round(random.uniform(20, 80), 2),
+        "memory_usage": round(random.uniform(30, 90), 2),
+        "disk_io": round(random.uniform(10, 100), 2)
+    }
+
+class MetricsSubscription:
+    """A single subscriber's view of the metrics stream"""
+
+    def __init__(self, keys: Optional[Iterable[str]] = None, deltas: bool = True):
+        self.keys: Optional[Set[str]] = set(keys) if keys else None
+        self.deltas = deltas
+        self.coalesced = 0
+        self._pending: Dict[str, Any] = {}
+        self._last_sent: Dict[str, Any] = {}
+        self._timestamp: Optional[str] = None
+        self._seq = 0
+        self._event = asyncio.Event()
+
+    def offer(self, timestamp: str, sample: Dict[str, Any]):
+        """Merge a new sample into the pending update (overwriting unsent values)"""
+        if self._pending:
+            self.coalesced += 1
+        for key, value in sample.items():
+            if self.keys is None or key in self.keys:
+                self._pending[key] = value
+        self._timestamp = timestamp
+        self._event.set()
+
+    async def next_update(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Wait for the next update; returns None on timeout
+
+        In delta mode only values that changed since the last update sent to
+        this subscriber are included, and updates with no changes are skipped.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            self._event.clear()
+            pending, self._pending = self._pending, {}
+            kind = "delta" if self.deltas and self._last_sent else "snapshot"
+            if self.deltas:
+                pending = {k: v for k, v in pending.items() if self._last_sent.get(k) != v}
+                if not pending:
+                    continue
+            self._last_sent.update(pending)
+            self._seq += 1
+            return {
+                "seq": self._seq,
+                "timestamp": self._timestamp,
+                "type": kind,
+                "metrics": pending
+            }
+
+class MetricsBroadcaster:
+    """Runs one sampler for the process and broadcasts to all subscribers
+
+    The sampler task starts with the first subscriber and stops when the last
+    one leaves, so an idle service does no sampling work.
+    """
+
+    def __init__(self, sampler: Callable[[], Dict[str, Any]] = sample_realtime_metrics, interval: float = 1.0):
+        self.sampler = sampler
+        self.interval = interval
+        self.latest: Optional[Dict[str, Any]] = None
+        self._subscribers: Set[MetricsSubscription] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, keys: Optional[Iterable[str]] = None, deltas: bool = True) -> MetricsSubscription:
+        """Register a subscriber; it immediately receives the latest sample"""
+        subscription = MetricsSubscription(keys, deltas)
+        self._subscribers.add(subscription)
+        if self.latest is not None:
+            subscription.offer(self.latest["timestamp"], self.latest["metrics"])
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription: MetricsSubscription):
+        """Remove a subscriber"""
+        self._subscribers.discard(subscription)
+
+    def sample(self) -> Dict[str, Any]:
+        """Take a sample and publish it to every subscriber"""
+        self.latest = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "metrics": self.sampler()
+        }
+        for subscription in list(self._subscribers):
+            subscription.offer(self.latest["timestamp"], self.latest["metrics"])
+        return self.latest
+
+    async def _run(self):
+        try:
+            while self._subscribers:
+                self.sample()
+                await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Realtime metrics sampler failed: {str(e)}")
+
+    async def stop(self):
+        """Cancel the sampler task (used on shutdown)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+def parse_metric_keys(keys: Optional[str]) -> Optional[Set[str]]:
+    """Parse a comma-separated ``keys`` parameter; unknown keys are rejected"""
+    if not keys:
+        return None
+    requested = {key.strip() for key in keys.split(",") if key.strip()}
+    unknown = requested - set(REALTIME_METRIC_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown metric keys: {', '.join(sorted(unknown))}")
+    return requested
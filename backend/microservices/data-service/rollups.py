@@ -0,0 +1,143 @@
+"""Time-bucketed rollups with mergeable sketches
+
+Each bucket holds count/sum/min/max plus a DDSketch of the values and a
+HyperLogLog of the user ids seen, so quantiles and distinct-user counts over
+any range are answered by merging buckets instead of rescanning raw points.
+Buckets serialise to JSON, which lets rollups from other shards be merged in.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from sketches import DDSketch, HyperLogLog, SketchMergeError
+
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+def _epoch(timestamp: datetime) -> float:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+class RollupBucket:
+    """Aggregates for one metric over one time bucket"""
+
+    def __init__(self, start: int, relative_accuracy: float = 0.01, hll_precision: int = 12):
+        self.start = start
+        self.values = DDSketch(relative_accuracy)
+        self.users = HyperLogLog(hll_precision)
+
+    def add(self, value: Optional[float] = None, user_id: Optional[Hashable] = None):
+        if value is not None:
+            self.values.add(value)
+        if user_id is not None:
+            self.users.add(user_id)
+
+    def merge(self, other: "RollupBucket") -> "RollupBucket":
+        self.values.merge(other.values)
+        self.users.merge(other.users)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"start": self.start, "values": self.values.to_dict(), "users": self.users.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RollupBucket":
+        bucket = cls(data["start"])
+        bucket.values = DDSketch.from_dict(data["values"])
+        bucket.users = HyperLogLog.from_dict(data["users"])
+        return bucket
+
+class RollupStore:
+    """Per-metric rollup buckets with bounded retention"""
+
+    def __init__(self, bucket_seconds: int = 60, max_buckets: int = 10_080,
+                 relative_accuracy: float = 0.01, hll_precision: int = 12):
+        self.bucket_seconds = bucket_seconds
+        self.max_buckets = max_buckets
+        self.relative_accuracy = relative_accuracy
+        self.hll_precision = hll_precision
+        self._buckets: Dict[Tuple[str, int], RollupBucket] = {}
+
+    def _bucket_start(self, timestamp: datetime) -> int:
+        epoch = int(_epoch(timestamp))
+        return epoch - epoch % self.bucket_seconds
+
+    def _bucket(self, metric: str, start: int) -> RollupBucket:
+        key = (metric, start)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = RollupBucket(start, self.relative_accuracy, self.hll_precision)
+            self._buckets[key] = bucket
+            self._evict()
+        return bucket
+
+    def _evict(self):
+        # Drop the oldest buckets once over capacity
+        while len(self._buckets) > self.max_buckets:
+            del self._buckets[min(self._buckets, key=lambda k: k[1])]
+
+    def record(self, metric: str, value: Optional[float] = None, timestamp: Optional[datetime] = None,
+               user_id: Optional[Hashable] = None):
+        """Record one observation (a value, a user id, or both)"""
+        start = self._bucket_start(timestamp or datetime.utcnow())
+        self._bucket(metric, start).add(value, user_id)
+
+    def buckets(self, metric: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[RollupBucket]:
+        """Buckets of ``metric`` overlapping ``[start, end)``"""
+        lo = self._bucket_start(start) if start else None
+        hi = _epoch(end) if end else None
+        return [
+            bucket for (name, bucket_start), bucket in self._buckets.items()
+            if name == metric and (lo is None or bucket_start >= lo) and (hi is None or bucket_start < hi)
+        ]
+
+    def query(self, metric: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              quantiles: Iterable[float] = DEFAULT_QUANTILES) -> Dict[str, Any]:
+        """Summarise ``metric`` over a time range by merging its buckets"""
+        merged = RollupBucket(0, self.relative_accuracy, self.hll_precision)
+        buckets = self.buckets(metric, start, end)
+        for bucket in buckets:
+            merged.merge(bucket)
+        values = merged.values
+        return {
+            "metric": metric,
+            "buckets": len(buckets),
+            "count": values.count,
+            "avg": values.sum / values.count if values.count else None,
+            "min": values.min if values.count else None,
+            "max": values.max if values.count else None,
+            "quantiles": {f"p{round(q * 100, 1):g}": values.quantile(q) for q in quantiles},
+            "distinct_users": merged.users.count()
+        }
+
+    def distinct_users(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        """Distinct user ids across all metrics in a time range"""
+        users = HyperLogLog(self.hll_precision)
+        for metric in self.metrics():
+            for bucket in self.buckets(metric, start, end):
+                users.merge(bucket.users)
+        return users.count()
+
+    def export(self, metric: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Serialise buckets so another shard can merge them"""
+        return [bucket.to_dict() for bucket in self.buckets(metric, start, end)]
+
+    def merge_serialized(self, metric: str, buckets: Iterable[Dict[str, Any]]) -> int:
+        """Merge buckets exported by another shard; returns how many were merged
+
+        Every bucket is decoded and checked before any is merged, so an invalid
+        payload leaves the store unchanged.
+        """
+        incoming = [RollupBucket.from_dict(data) for data in buckets]
+        for bucket in incoming:
+            if bucket.start % self.bucket_seconds:
+                raise ValueError("Bucket boundaries do not match this store's bucket size")
+            if bucket.values.relative_accuracy != self.relative_accuracy:
+                raise SketchMergeError("Cannot merge DDSketches with different relative accuracy")
+            if bucket.users.precision != self.hll_precision:
+                raise SketchMergeError("Cannot merge HyperLogLogs with different precision")
+        for bucket in incoming:
+            self._bucket(metric, bucket.start).merge(bucket)
+        return len(incoming)
+
+    def metrics(self) -> List[str]:
+        return sorted({name for name, _ in self._buckets})
@@ -0,0 +1,479 @@
+"""Columnar, memory-mapped storage for analytics points
+
+Points (timestamp, metric, category, value) are buffered in memory and
+flushed into immutable segment files, one directory per time partition:
+
+    <data dir>/20261019T000000/seg-00000042.col
+
+A segment file is ``b"DQASEG01"``, a uint64 header length and a JSON
+header, followed by four columns, each aligned to 64 bytes:
+
+- ``timestamp``: rows are sorted by time and stored as the difference in
+  milliseconds from the previous row. The type is the narrowest unsigned
+  one that fits, so regular samples take 1-2 bytes.
+- ``value``: float64.
+- ``metric`` and ``category``: codes into the dictionaries in the header,
+  uint8 or uint16.
+
+That is about 12 bytes a point, against 200+ for a Python object. Each
+segment is mapped once with ``np.memmap`` when it is opened, and its
+columns are views into that map. Values, codes and deltas come straight
+from the page cache without copying, and timestamps are one ``cumsum``
+away. The header doubles as the segment's index: row count, first and last
+timestamp, value range and dictionaries. A range or metric filter skips
+segments from the index alone, without touching their pages.
+
+Maintenance runs in the background:
+
+- Flushes are small and frequent. Once a partition has
+  ``compact_min_segments`` segments below ``compact_target_rows``, they
+  are merged into one. The new segment names the ones it replaces, so a
+  crash before they are deleted is cleaned up on the next ``open()``.
+- Retention drops whole partitions older than ``retention_seconds``.
+
+Compaction and retention delete files that a running scan may still be
+reading. That is safe because the map outlives the directory entry: a
+segment's pages stay readable until the last ``Segment`` holding them is
+garbage collected.
+
+One process owns a data directory. ``open()`` takes an exclusive lock on
+it and fails fast if another process holds it, since two writers would
+reuse each other's segment numbers and compact files the other indexes.
+"""
+import asyncio
+import errno
+import itertools
+import json
+import logging
+import os
+import shutil
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no advisory locks on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"DQASEG01"
+ALIGNMENT = 64
+SEGMENT_GLOB = "seg-*.col"
+LOCK_FILE = "LOCK"
+PARTITION_FORMAT = "%Y%m%dT%H%M%S"
+
+Chunk = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]  # timestamps (ms), metrics, categories, values
+
+def _narrowest_unsigned(maximum: int) -> np.dtype:
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if maximum <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def _encode_dictionary(names: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    dictionary, codes = np.unique(names, return_inverse=True)
+    return [str(name) for name in dictionary], codes
+
+class Segment:
+    """One immutable segment file and its header"""
+
+    def __init__(self, path: Path, header: Dict[str, Any], data_offset: int):
+        self.path = path
+        self.header = header
+        self.data_offset = data_offset
+        self.rows: int = header["rows"]
+        self.min_timestamp: int = header["min_timestamp"]
+        self.max_timestamp: int = header["max_timestamp"]
+        self.metric_codes = {name: code for code, name in enumerate(header["metrics"])}
+        self.category_codes = {name: code for code, name in enumerate(header["categories"])}
+        self.size = path.stat().st_size
+        # Map the whole file now, so the columns stay readable after compaction
+        # or retention unlinks it while a scan still holds this segment
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        self._columns: Dict[str, np.ndarray] = {}
+        for name, spec in header["columns"].items():
+            dtype = np.dtype(spec["dtype"])
+            offset = data_offset + spec["offset"]
+            self._columns[name] = data[offset:offset + self.rows * dtype.itemsize].view(dtype)
+
+    @classmethod
+    def open(cls, path: Path) -> "Segment":
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a segment file")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_length))
+        return cls(path, header, _align(len(MAGIC) + 8 + header_length))
+
+    def column(self, name: str) -> np.ndarray:
+        """A column mapped read-only from the file"""
+        return self._columns[name]
+
+    def timestamps(self) -> np.ndarray:
+        return np.cumsum(self.column("timestamp"), dtype=np.int64) + self.header["base_timestamp"]
+
+    def may_contain(self, start: Optional[int], end: Optional[int], metric: Optional[str], category: Optional[str]) -> bool:
+        """Index check: can any row match? (``end`` is exclusive)"""
+        if start is not None and self.max_timestamp < start:
+            return False
+        if end is not None and self.min_timestamp >= end:
+            return False
+        if metric is not None and metric not in self.metric_codes:
+            return False
+        return category is None or category in self.category_codes
+
+def write_segment(path: Path, timestamps: np.ndarray, metrics: List[str], metric_codes: np.ndarray,
+                  categories: List[str], category_codes: np.ndarray, values: np.ndarray,
+                  replaces: Sequence[str] = ()) -> Segment:
+    """Write rows (sorted by timestamp) as a segment, atomically and durably"""
+    deltas = np.diff(timestamps, prepend=timestamps[:1])
+    columns = {
+        "timestamp": deltas.astype(_narrowest_unsigned(int(deltas.max()))),
+        "value": values.astype(np.float64, copy=False),
+        "metric": metric_codes.astype(_narrowest_unsigned(len(metrics) - 1)),
+        "category": category_codes.astype(_narrowest_unsigned(len(categories) - 1)),
+    }
+    layout, offset = {}, 0
+    for name, column in columns.items():
+        layout[name] = {"offset": offset, "dtype": column.dtype.str}
+        offset = _align(offset + column.nbytes)
+    header = json.dumps({
+        "rows": len(timestamps),
+        "base_timestamp": int(timestamps[0]),
+        "min_timestamp": int(timestamps[0]),
+        "max_timestamp": int(timestamps[-1]),
+        "min_value": float(np.min(values)),
+        "max_value": float(np.max(values)),
+        "metrics": metrics,
+        "categories": categories,
+        "replaces": list(replaces),
+        "columns": layout,
+    }).encode("utf-8")
+
+    data_offset = _align(len(MAGIC) + 8 + len(header))
+    temporary = path.with_suffix(".tmp")
+    with open(temporary, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+        for name, column in columns.items():
+            f.seek(data_offset + layout[name]["offset"])
+            f.write(column.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    return Segment.open(path)
+
+class ScanResult(NamedTuple):
+    timestamps: np.ndarray  # epoch milliseconds, ascending
+    values: np.ndarray
+    segments_scanned: int
+    segments_skipped: int
+
+class SegmentStore:
+    """Time-partitioned segments plus the in-memory write buffer"""
+
+    def __init__(self, directory: str, partition_seconds: int = 86400, flush_rows: int = 65536,
+                 flush_seconds: float = 5.0, compact_min_segments: int = 4, compact_target_rows: int = 1_000_000,
+                 retention_seconds: float = 0, maintenance_seconds: float = 60.0):
+        self.directory = Path(directory)
+        self.partition_ms = partition_seconds * 1000
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.compact_min_segments = compact_min_segments
+        self.compact_target_rows = compact_target_rows
+        self.retention_seconds = retention_seconds
+        self.maintenance_seconds = maintenance_seconds
+        self.compactions = 0
+        self.partitions_dropped = 0
+        self._partitions: Dict[int, List[Segment]] = {}
+        self._buffer: List[Chunk] = []
+        self._buffered_rows = 0
+        self._flushing: List[Chunk] = []  # still visible to scans while their segments are written
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._lock_file = None
+
+    def partition_path(self, partition: int) -> Path:
+        start = datetime.fromtimestamp(partition / 1000, tz=timezone.utc)
+        return self.directory / start.strftime(PARTITION_FORMAT)
+
+    def open(self):
+        """Lock the data directory and load segment headers, finishing any interrupted compaction"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock_directory()
+        last_sequence = 0
+        for partition_dir in sorted(self.directory.iterdir()):
+            try:
+                start = datetime.strptime(partition_dir.name, PARTITION_FORMAT).replace(tzinfo=timezone.utc)
+            except ValueError:
+                continue
+            for temporary in partition_dir.glob("*.tmp"):
+                temporary.unlink()
+            segments = []
+            for path in sorted(partition_dir.glob(SEGMENT_GLOB)):
+                try:
+                    segments.append(Segment.open(path))
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"Skipping unreadable segment {path}: {str(e)}")
+                last_sequence = max(last_sequence, int(path.stem.split("-", 1)[1]))
+            replaced = {name for segment in segments for name in segment.header["replaces"]}
+            for segment in [segment for segment in segments if segment.path.name in replaced]:
+                segment.path.unlink()
+                segments.remove(segment)
+            if segments:
+                self._partitions[int(start.timestamp() * 1000)] = segments
+        self._sequence = itertools.count(last_sequence + 1)
+        stats = self.stats()
+        logger.info(f"Analytics store opened: {stats['segments']} segments, {stats['rows']} rows "
+                    f"in {stats['partitions']} partitions")
+
+    def _lock_directory(self):
+        if fcntl is None or self._lock_file is not None:
+            return
+        lock_file = open(self.directory / LOCK_FILE, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            lock_file.close()
+            if e.errno in (errno.EAGAIN, errno.EACCES):
+                raise RuntimeError(
+                    f"Analytics data directory {self.directory} is in use by another process; "
+                    f"run a single worker (SERVER_WORKERS=1) or give each process its own directory"
+                ) from None
+            raise
+        self._lock_file = lock_file
+
+    def close(self):
+        """Release the data directory lock (buffered points are not flushed)"""
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._maintain())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await asyncio.to_thread(self.flush)
+        finally:
+            self.close()
+
+    def append(self, timestamps: Sequence[int], metrics: Sequence[str], categories: Sequence[str],
+               values: Sequence[float]) -> int:
+        """Buffer points (timestamps in epoch ms, finite values); flushes once ``flush_rows`` are waiting"""
+        chunk = (np.asarray(timestamps, dtype=np.int64), np.asarray(metrics, dtype=object),
+                 np.asarray(categories, dtype=object), np.asarray(values, dtype=np.float64))
+        if len({len(column) for column in chunk}) != 1:
+            raise ValueError("timestamps, metrics, categories and values must have the same length")
+        if not np.isfinite(chunk[3]).all():
+            raise ValueError("values must be finite (no NaN or infinity)")
+        with self._lock:
+            self._buffer.append(chunk)
+            self._buffered_rows += len(chunk[0])
+            full = self._buffered_rows >= self.flush_rows
+        if full:
+            self.flush()
+        return len(chunk[0])
+
+    def flush(self) -> int:
+        """Write buffered points as one new segment per partition they fall in
+
+        If a partition fails to write, the partitions before it are kept and
+        only its rows and those of later partitions go back to the buffer.
+        """
+        with self._flush_lock:
+            with self._lock:
+                chunks, self._buffer, self._buffered_rows = self._buffer, [], 0
+                self._flushing = chunks
+            if not chunks:
+                return 0
+            rows: Optional[Chunk] = None
+            new_segments: List[Tuple[int, Segment]] = []
+            written = 0
+            try:
+                timestamps = np.concatenate([chunk[0] for chunk in chunks])
+                order = np.argsort(timestamps, kind="stable")
+                rows = tuple(np.concatenate(column)[order] for column in zip(*chunks))
+                for partition, lo, hi in self._partition_ranges(rows[0]):
+                    new_segments.append((partition, self._write_partition(partition, *(column[lo:hi] for column in rows))))
+                    written = hi
+            finally:
+                if rows is None:
+                    unwritten = chunks
+                else:
+                    unwritten = [tuple(column[written:] for column in rows)] if written < len(rows[0]) else []
+                with self._lock:
+                    # Segments become visible in the same step the rows leave _flushing
+                    for partition, segment in new_segments:
+                        self._partitions.setdefault(partition, []).append(segment)
+                    self._buffer[:0] = unwritten
+                    self._buffered_rows += sum(len(chunk[0]) for chunk in unwritten)
+                    self._flushing = []
+            return written
+
+    def _partition_ranges(self, timestamps: np.ndarray):
+        """``(partition, lo, hi)`` for each partition in sorted ``timestamps``"""
+        partitions = timestamps // self.partition_ms * self.partition_ms
+        boundaries = np.flatnonzero(np.diff(partitions)) + 1
+        for lo, hi in zip(np.r_[0, boundaries], np.r_[boundaries, len(timestamps)]):
+            yield int(partitions[lo]), int(lo), int(hi)
+
+    def _write_partition(self, partition: int, timestamps: np.ndarray, metrics: np.ndarray,
+                         categories: np.ndarray, values: np.ndarray) -> Segment:
+        metric_names, metric_codes = _encode_dictionary(metrics)
+        category_names, category_codes = _encode_dictionary(categories)
+        directory = self.partition_path(partition)
+        directory.mkdir(parents=True, exist_ok=True)
+        return write_segment(directory / f"seg-{next(self._sequence):08d}.col", timestamps,
+                             metric_names, metric_codes, category_names, category_codes, values)
+
+    def compact(self) -> int:
+        """Merge each partition's small segments once there are enough of them"""
+        with self._lock:
+            candidates = {
+                partition: [segment for segment in segments if segment.rows < self.compact_target_rows]
+                for partition, segments in self._partitions.items()
+            }
+        merged = 0
+        for partition, small in candidates.items():
+            if len(small) < self.compact_min_segments:
+                continue
+            segment = self._merge(partition, small)
+            with self._lock:
+                remaining = [existing for existing in self._partitions.get(partition, []) if existing not in small]
+                self._partitions[partition] = remaining + [segment]
+            for old in small:
+                old.path.unlink()  # scans holding the old segment keep reading its map
+            self.compactions += 1
+            merged += len(small)
+            logger.info(f"Compacted {len(small)} segments ({segment.rows} rows) into {segment.path.name}")
+        return merged
+
+    def _merge(self, partition: int, segments: List[Segment]) -> Segment:
+        metric_names = sorted({name for segment in segments for name in segment.header["metrics"]})
+        category_names = sorted({name for segment in segments for name in segment.header["categories"]})
+        metric_index = {name: code for code, name in enumerate(metric_names)}
+        category_index = {name: code for code, name in enumerate(category_names)}
+        timestamps, metric_codes, category_codes, values = [], [], [], []
+        for segment in segments:
+            # Re-code each segment's dictionary codes into the merged dictionaries
+            metric_map = np.array([metric_index[name] for name in segment.header["metrics"]], dtype=np.int64)
+            category_map = np.array([category_index[name] for name in segment.header["categories"]], dtype=np.int64)
+            timestamps.append(segment.timestamps())
+            metric_codes.append(metric_map[segment.column("metric")])
+            category_codes.append(category_map[segment.column("category")])
+            values.append(segment.column("value"))
+        timestamps, metric_codes, category_codes, values = (
+            np.concatenate(column) for column in (timestamps, metric_codes, category_codes, values)
+        )
+        order = np.argsort(timestamps, kind="stable")
+        path = self.partition_path(partition) / f"seg-{next(self._sequence):08d}.col"
+        return write_segment(path, timestamps[order], metric_names, metric_codes[order], category_names,
+                             category_codes[order], values[order], replaces=[segment.path.name for segment in segments])
+
+    def enforce_retention(self, now: Optional[float] = None) -> int:
+        """Drop partitions that ended more than ``retention_seconds`` ago"""
+        if self.retention_seconds <= 0:
+            return 0
+        cutoff = ((time.time() if now is None else now) - self.retention_seconds) * 1000
+        with self._lock:
+            expired = [partition for partition in self._partitions if partition + self.partition_ms <= cutoff]
+            dropped = {partition: self._partitions.pop(partition) for partition in expired}
+        for partition in dropped:
+            shutil.rmtree(self.partition_path(partition), ignore_errors=True)
+            logger.info(f"Dropped analytics partition {self.partition_path(partition).name} (retention)")
+        self.partitions_dropped += len(dropped)
+        return len(dropped)
+
+    def scan(self, start: Optional[int] = None, end: Optional[int] = None, metric: Optional[str] = None,
+             category: Optional[str] = None) -> ScanResult:
+        """Points in [start, end) (epoch ms) for a metric and/or category, in time order"""
+        with self._lock:
+            segments = [segment for segments in self._partitions.values() for segment in segments]
+            chunks = self._flushing + self._buffer
+        parts: List[Tuple[np.ndarray, np.ndarray]] = []
+        scanned = skipped = 0
+        for segment in segments:
+            if not segment.may_contain(start, end, metric, category):
+                skipped += 1
+                continue
+            scanned += 1
+            timestamps = segment.timestamps()
+            lo = int(np.searchsorted(timestamps, start)) if start is not None else 0
+            hi = int(np.searchsorted(timestamps, end)) if end is not None else segment.rows
+            if lo >= hi:
+                continue
+            mask = None
+            if metric is not None:
+                mask = segment.column("metric")[lo:hi] == segment.metric_codes[metric]
+            if category is not None:
+                matches = segment.column("category")[lo:hi] == segment.category_codes[category]
+                mask = matches if mask is None else mask & matches
+            timestamps, values = timestamps[lo:hi], segment.column("value")[lo:hi]
+            parts.append((timestamps, values) if mask is None else (timestamps[mask], values[mask]))
+        for timestamps, metrics, categories, values in chunks:
+            mask = np.ones(len(timestamps), dtype=bool)
+            if start is not None:
+                mask &= timestamps >= start
+            if end is not None:
+                mask &= timestamps < end
+            if metric is not None:
+                mask &= metrics == metric
+            if category is not None:
+                mask &= categories == category
+            parts.append((timestamps[mask], values[mask]))
+
+        if not parts:
+            return ScanResult(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), scanned, skipped)
+        timestamps = np.concatenate([part[0] for part in parts])
+        values = np.concatenate([part[1] for part in parts])
+        if np.any(timestamps[1:] < timestamps[:-1]):
+            # Segments of a partition can overlap in time (late points), and buffered rows are unsorted
+            order = np.argsort(timestamps, kind="stable")
+            timestamps, values = timestamps[order], values[order]
+        return ScanResult(timestamps, values, scanned, skipped)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            segments = [segment for segments in self._partitions.values() for segment in segments]
+            partitions = len(self._partitions)
+            buffered = self._buffered_rows
+        return {
+            "partitions": partitions,
+            "segments": len(segments),
+            "rows": sum(segment.rows for segment in segments),
+            "bytes": sum(segment.size for segment in segments),
+            "buffered_rows": buffered,
+            "compactions": self.compactions,
+            "partitions_dropped": self.partitions_dropped,
+        }
+
+    async def _maintain(self):
+        last_maintenance = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await asyncio.to_thread(self.flush)
+                if time.monotonic() - last_maintenance >= self.maintenance_seconds:
+                    last_maintenance = time.monotonic()
+                    await asyncio.to_thread(self.compact)
+                    await asyncio.to_thread(self.enforce_retention)
+            except Exception as e:
+                logger.warning(f"Analytics store maintenance failed: {str(e)}")
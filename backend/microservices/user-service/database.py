@@ -0,0 +1,229 @@
+"""SQLite engine profiles and the write path for the user service
+
+With SQLite's defaults (rollback journal, ``synchronous=FULL``), every
+commit fsyncs and a writer blocks all readers. Concurrent writes then fail
+with "database is locked". The ``tuned`` profile changes three things:
+
+- Every connection gets pragmas when it opens. ``journal_mode=WAL`` lets
+  readers run alongside the writer. ``synchronous=NORMAL`` fsyncs at
+  checkpoints instead of on every commit, and WAL stays durable against
+  application crashes. The profile also sets ``mmap_size``,
+  ``cache_size`` and ``busy_timeout``.
+- Reads use their own engine, a pool of ``query_only`` connections with
+  unbounded overflow. With the default 5 + 10 ``QueuePool``, the 16th
+  concurrent request blocked the event loop in checkout until the 30 s
+  pool timeout. Opening an extra SQLite connection costs microseconds, so
+  requests never wait for one.
+- Writes go through ``WriteQueue``, one thread that owns the only write
+  connection. It drains whatever operations queued up while it was busy
+  and runs them in one ``BEGIN IMMEDIATE`` transaction, each operation
+  inside its own SAVEPOINT, then commits once. This is group commit: a
+  failing operation rolls back only its own savepoint, and N concurrent
+  writes cost one commit instead of N lock handoffs.
+
+The ``default`` profile, and any non-SQLite URL, keeps a single engine and
+commits each write inline (``InlineWriter``). Both writers have the same
+``await writer.submit(operation)`` interface. ``operation(session)`` runs
+in the write transaction and returns plain data: ORM objects must not
+escape it.
+"""
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PROFILES = ("default", "tuned")
+
+WriteOperation = Callable[[Session], Any]
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def tuned_pragmas(settings) -> Dict[str, Any]:
+    """Pragmas applied to every connection of the tuned profile, in order"""
+    return {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": settings.sqlite_busy_timeout_ms,
+        "cache_size": -settings.sqlite_cache_size_kb,  # negative = KiB rather than pages
+        "mmap_size": settings.sqlite_mmap_size,
+        "temp_store": "MEMORY",
+    }
+
+def apply_pragmas(engine: Engine, pragmas: Dict[str, Any]):
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+def begin_immediate(engine: Engine):
+    """Let SQLAlchemy drive transactions and take the write lock at BEGIN
+
+    pysqlite's own transaction handling defers BEGIN and breaks SAVEPOINT.
+    ``BEGIN IMMEDIATE`` fails fast (after ``busy_timeout``) rather than
+    deadlocking when another process upgrades to a writer first.
+    """
+    @event.listens_for(engine, "connect")
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+def create_engines(url: str, settings) -> Tuple[Engine, Engine]:
+    """Write and read engines for ``url`` (the same engine unless tuned SQLite)"""
+    if settings.sqlite_profile not in SQLITE_PROFILES:
+        raise ValueError(f"sqlite_profile must be one of {SQLITE_PROFILES}, got {settings.sqlite_profile!r}")
+    if not is_sqlite(url):
+        engine = create_engine(url, pool_pre_ping=True)
+        return engine, engine
+    connect_args = {"check_same_thread": False}
+    if settings.sqlite_profile == "default":
+        engine = create_engine(url, connect_args=connect_args)
+        return engine, engine
+
+    pragmas = tuned_pragmas(settings)
+    # The writer thread is the only user of the write connection
+    write_engine = create_engine(url, connect_args=connect_args, pool_size=1, max_overflow=0)
+    apply_pragmas(write_engine, pragmas)
+    begin_immediate(write_engine)
+    return write_engine, create_read_engine(url, settings)
+
+def create_read_engine(url: str, settings) -> Engine:
+    """Engine for reads only: the tuned primary's read pool, or a replica"""
+    if not is_sqlite(url):
+        return create_engine(url, pool_pre_ping=True)
+    read_engine = create_engine(
+        url, connect_args={"check_same_thread": False},
+        pool_size=settings.sqlite_read_pool_size, max_overflow=-1
+    )
+    apply_pragmas(read_engine, {**tuned_pragmas(settings), "query_only": "ON"})
+    return read_engine
+
+class InlineWriter:
+    """Runs each write in its own session and commits it straight away"""
+
+    def __init__(self, session_factory: Callable[[], Session]):
+        self.session_factory = session_factory
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    async def submit(self, operation: WriteOperation) -> Any:
+        session = self.session_factory()
+        try:
+            result = operation(session)
+            session.commit()
+            return result
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": "inline"}
+
+class WriteQueue:
+    """Single writer thread that group-commits queued operations"""
+
+    def __init__(self, session_factory: Callable[[], Session], max_batch: int = 64):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.batches = 0
+        self.operations = 0
+        self.largest_batch = 0
+        self._queue: "queue.Queue[Optional[Tuple[WriteOperation, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Commit what is queued, then stop the thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    async def submit(self, operation: WriteOperation) -> Any:
+        if self._thread is None:
+            raise RuntimeError("WriteQueue is not running")
+        future: Future = Future()
+        self._queue.put((operation, future))
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": "group-commit",
+            "batches": self.batches,
+            "operations": self.operations,
+            "largest_batch": self.largest_batch,
+            "queued": self._queue.qsize(),
+        }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Everything that queued up during the previous commit rides on this one
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch: List[Tuple[WriteOperation, Future]]):
+        outcomes: List[Tuple[Future, Any, Optional[BaseException]]] = []
+        session = self.session_factory()
+        try:
+            for operation, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue  # the request went away before its turn
+                try:
+                    with session.begin_nested():
+                        result = operation(session)
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    outcomes.append((future, None, e))
+            session.commit()
+        except Exception as e:
+            logger.error(f"Group commit of {len(batch)} writes failed: {str(e)}")
+            session.rollback()
+            outcomes = [(future, None, error or e) for future, _, error in outcomes]
+        finally:
+            session.close()
+
+        self.batches += 1
+        self.operations += len(outcomes)
+        self.largest_batch = max(self.largest_batch, len(outcomes))
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -1,21 +1,94 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
+from contextlib import asynccontextmanager
+import asyncio
 import logging
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, create_engine
+import os
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, func
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 
+import sys
+from pathlib import Path
+
+# The shared package lives in the backend root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from shared.config import get_settings
+from shared.logging_config import setup_logging
+from shared.tracing import setup_tracing
+from shared.profiling import setup_profiling
+from shared.metrics import instrument_app, instrument_sqlalchemy
+from shared.responses import FastJSONResponse, model_response
+from shared.conditional import is_not_modified, not_modified_response, validator_headers, weak_etag
+from shared.startup import StartupReport
+
+from database import InlineWriter, WriteQueue, create_engines
+from outbox import (
+    USER_CREATED,
+    USER_DELETED,
+    USER_UPDATED,
+    EventNotifier,
+    UserEventDB,
+    OutboxBase,
+    RedisStreamRelay,
+    format_sse,
+    offset_bounds,
+    prune_events,
+    record_event,
+    wait_for_events,
+)
+from replicas import READ_AFTER_HEADER, ReplicaSet, ReplicationBase
+
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+settings = get_settings()
+setup_logging(
+    "user-service",
+    settings.log_level,
+    async_mode=settings.log_async,
+    queue_size=settings.log_queue_size,
+    overflow_policy=settings.log_overflow_policy,
+    sample_rates=settings.log_sample_rates,
+    json_backend=settings.log_json_backend,
+    log_format=settings.log_format
+)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup = StartupReport("user-service")
+    with startup.phase("create_tables"):
+        create_tables()
+    user_writer.start()
+    replica_set.start()
+    app.state.event_pruner = asyncio.create_task(prune_events_periodically())
+    relay = None
+    if settings.user_events_backend == "redis" and settings.redis_url:
+        relay = RedisStreamRelay(ReadSession, event_notifier, settings.redis_url, settings.user_events_stream,
+                                 maxlen=settings.user_events_retention)
+        relay.start()
+    app.state.startup = startup.ready()
+    yield
+    app.state.event_pruner.cancel()
+    await replica_set.stop()
+    if relay is not None:
+        await relay.stop()
+    await asyncio.to_thread(user_writer.stop)
+    engine.dispose()
+    read_engine.dispose()
+    replica_set.dispose()
+
 app = FastAPI(
     title="DQA User Service",
     description="User Management Microservice",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -26,10 +99,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+instrument_app(app, "user-service", enabled=settings.enable_metrics)
+setup_tracing(app, "user-service", settings)
+setup_profiling(app, "user-service", settings)
+
+# User change events: other services follow /events (or the Redis stream) instead of polling
+event_notifier = EventNotifier()
+EVENT_PRUNE_SECONDS = 60
+SSE_HEARTBEAT_SECONDS = 15.0
+
 # Database setup (SQLite for demo, replace with PostgreSQL in production)
 SQLALCHEMY_DATABASE_URL = "sqlite:///./users.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# With the tuned SQLite profile writes and reads use separate engines (see database.py)
+engine, read_engine = create_engines(SQLALCHEMY_DATABASE_URL, settings)
+instrument_sqlalchemy(engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
+if read_engine is not engine:
+    instrument_sqlalchemy(read_engine)
+ReadSession = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+if engine is read_engine:
+    user_writer = InlineWriter(SessionLocal)
+else:
+    user_writer = WriteQueue(SessionLocal, max_batch=settings.sqlite_write_batch)
+# Read-only handlers are served by healthy replicas when any are configured
+replica_set = ReplicaSet(settings.user_db_replicas, settings, SQLALCHEMY_DATABASE_URL, ReadSession, user_writer)
+
+def _dispose_engines_after_fork():
+    # Prefork workers must not share the parent's pooled connections
+    engine.dispose(close=False)
+    read_engine.dispose(close=False)
+    replica_set.dispose(close=False)
+
+os.register_at_fork(after_in_child=_dispose_engines_after_fork)
 Base = declarative_base()
 
 # Database Models
@@ -44,8 +145,14 @@ class UserDB(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+def create_tables():
+    """Create missing tables (run from the lifespan, not at import)"""
+    for metadata in (Base.metadata, OutboxBase.metadata, ReplicationBase.metadata):
+        try:
+            metadata.create_all(bind=engine)
+        except OperationalError:
+            # Another worker created them between our existence check and CREATE TABLE
+            metadata.create_all(bind=engine)
 
 # Pydantic Models
 class UserBase(BaseModel):
@@ -71,14 +178,29 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
-# Database dependency
-def get_db():
-    db = SessionLocal()
+# Database dependency (reads; writes go through user_writer)
+def get_db(read_after: int = Header(0, alias=READ_AFTER_HEADER, include_in_schema=False)):
+    _, session_factory = replica_set.route(read_after)
+    db = session_factory()
     try:
         yield db
     finally:
         db.close()
 
+def user_snapshot(user: UserDB) -> Dict[str, Any]:
+    """The user as the API returns it, for event payloads"""
+    return UserResponse.model_validate(user).model_dump(mode="json")
+
+async def prune_events_periodically():
+    while True:
+        await asyncio.sleep(EVENT_PRUNE_SECONDS)
+        try:
+            pruned = await user_writer.submit(lambda db: prune_events(db, settings.user_events_retention))
+            if pruned:
+                logger.info(f"Pruned {pruned} user events from the outbox")
+        except Exception as e:
+            logger.warning(f"Pruning user events failed: {str(e)}")
+
 # In-memory storage for demo (replace with database)
 users_db = []
 user_id_counter = 1
@@ -92,38 +214,69 @@ async def health_check():
     return {"status": "healthy", "service": "user-service"}
 
 @app.post("/users", response_model=UserResponse)
-async def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, response: Response):
     """Create a new user"""
-    # Check if user already exists
-    existing_user = db.query(UserDB).filter(
-        (UserDB.username == user.username) | (UserDB.email == user.email)
-    ).first()
+    def insert(db: Session) -> Tuple[Dict[str, Any], int]:
+        # Check if user already exists
+        existing_user = db.query(UserDB).filter(
+            (UserDB.username == user.username) | (UserDB.email == user.email)
+        ).first()
+        if existing_user:
+            raise HTTPException(status_code=400, detail="Username or email already registered")
+        
+        db_user = UserDB(**user.dict())
+        db.add(db_user)
+        db.flush()  # assigns the id the event refers to
+        created = user_snapshot(db_user)
+        return created, record_event(db, USER_CREATED, db_user.id, created)
     
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Username or email already registered")
+    created, offset = await user_writer.submit(insert)
+    event_notifier.notify()
+    response.headers[READ_AFTER_HEADER] = str(offset)
     
-    # Create new user
-    db_user = UserDB(**user.dict())
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    
-    logger.info(f"Created user: {db_user.username}")
-    return db_user
+    logger.info(f"Created user: {created['username']}")
+    return created
 
 @app.get("/users", response_model=List[UserResponse])
-async def get_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def get_users(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """Get all users with pagination"""
     users = db.query(UserDB).offset(skip).limit(limit).all()
-    return users
+    
+    # The page changes whenever a row on it is added, removed or updated. No
+    # Last-Modified: a deletion or a row leaving the page does not advance
+    # max(updated_at), so If-Modified-Since would answer a stale 304.
+    etag = weak_etag("users", skip, limit, [(user.id, user.updated_at) for user in users])
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    return model_response(users, List[UserResponse], headers=validator_headers(etag))
+
+@app.get("/users/stats")
+async def get_user_stats(db: Session = Depends(get_db)):
+    """Count users (used by other services to reconcile their counters)
+
+    ``offset`` is the newest user event the counts include. It is read in the
+    same statement, so a consumer of the event feed knows which events the
+    counts already reflect.
+    """
+    last_offset = db.query(func.max(UserEventDB.offset)).scalar_subquery()
+    total_users, active_users, offset = db.query(
+        func.count(UserDB.id),
+        func.count(UserDB.id).filter(UserDB.is_active.is_(True)),
+        last_offset
+    ).one()
+    return {"total_users": total_users, "active_users": active_users, "offset": offset or 0}
 
 @app.get("/users/{user_id}", response_model=UserResponse)
-async def get_user(user_id: int, db: Session = Depends(get_db)):
+async def get_user(user_id: int, request: Request, db: Session = Depends(get_db)):
     """Get user by ID"""
     user = db.query(UserDB).filter(UserDB.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    
+    etag = weak_etag("user", user.id, user.updated_at)
+    if is_not_modified(request, etag, user.updated_at):
+        return not_modified_response(etag, user.updated_at)
+    return model_response(user, UserResponse, headers=validator_headers(etag, user.updated_at))
 
 @app.get("/users/by-username/{username}", response_model=UserResponse)
 async def get_user_by_username(username: str, db: Session = Depends(get_db)):
@@ -131,38 +284,50 @@ async def get_user_by_username(username: str, db: Session = Depends(get_db)):
     user = db.query(UserDB).filter(UserDB.username == username).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return model_response(user, UserResponse)
 
 @app.put("/users/{user_id}", response_model=UserResponse)
-async def update_user(user_id: int, user_update: UserUpdate, db: Session = Depends(get_db)):
+async def update_user(user_id: int, user_update: UserUpdate, response: Response):
     """Update user by ID"""
-    user = db.query(UserDB).filter(UserDB.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Update fields
-    update_data = user_update.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(user, field, value)
+    def update(db: Session) -> Tuple[Dict[str, Any], int]:
+        user = db.query(UserDB).filter(UserDB.id == user_id).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        # Update fields
+        update_data = user_update.dict(exclude_unset=True)
+        for field, value in update_data.items():
+            setattr(user, field, value)
+        
+        user.updated_at = datetime.utcnow()
+        db.flush()
+        updated = user_snapshot(user)
+        return updated, record_event(db, USER_UPDATED, user.id, updated)
     
-    user.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(user)
+    updated, offset = await user_writer.submit(update)
+    event_notifier.notify()
+    response.headers[READ_AFTER_HEADER] = str(offset)
     
-    logger.info(f"Updated user: {user.username}")
-    return user
+    logger.info(f"Updated user: {updated['username']}")
+    return updated
 
 @app.delete("/users/{user_id}")
-async def delete_user(user_id: int, db: Session = Depends(get_db)):
+async def delete_user(user_id: int, response: Response):
     """Delete user by ID"""
-    user = db.query(UserDB).filter(UserDB.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    def delete(db: Session) -> Tuple[str, int]:
+        user = db.query(UserDB).filter(UserDB.id == user_id).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        offset = record_event(db, USER_DELETED, user.id, user_snapshot(user))
+        db.delete(user)
+        return user.username, offset
     
-    db.delete(user)
-    db.commit()
+    username, offset = await user_writer.submit(delete)
+    event_notifier.notify()
+    response.headers[READ_AFTER_HEADER] = str(offset)
     
-    logger.info(f"Deleted user: {user.username}")
+    logger.info(f"Deleted user: {username}")
     return {"message": "User deleted successfully"}
 
 @app.get("/users/search/{query}", response_model=List[UserResponse])
@@ -173,8 +338,66 @@ async def search_users(query: str, db: Session = Depends(get_db)):
         (UserDB.email.contains(query)) |
         (UserDB.full_name.contains(query))
     ).all()
-    return users
+    return model_response(users, List[UserResponse])
+
+@app.get("/db/replicas")
+async def replica_status():
+    """Replica health, lag and replication position as of the last check"""
+    return replica_set.status()
+
+@app.get("/events")
+async def get_user_events(
+    after: Optional[int] = Query(None, description="Return events after this offset (omit to start at the head)"),
+    limit: int = Query(100, ge=1, le=1000),
+    wait: float = Query(0.0, ge=0.0, le=30.0, description="Seconds to wait for the first new event")
+):
+    """Ordered user change events from the outbox (long-poll with ``wait``)"""
+    db = ReadSession()
+    try:
+        bounds = offset_bounds(db)
+    finally:
+        db.close()
+    if after is None:
+        return {"events": [], "next_offset": bounds["last_offset"], **bounds}
+    
+    events = await wait_for_events(ReadSession, event_notifier, after, limit, wait)
+    next_offset = events[-1]["offset"] if events else after
+    return {"events": events, "next_offset": next_offset, **bounds}
+
+@app.get("/events/stream")
+async def stream_user_events(
+    request: Request,
+    after: Optional[int] = Query(None, description="Start after this offset (omit to start at the head)"),
+    last_event_id: Optional[int] = Header(None)
+):
+    """Push user change events as Server-Sent Events; reconnects resume from Last-Event-ID"""
+    if last_event_id is not None:
+        after = last_event_id
+    if after is None:
+        db = ReadSession()
+        try:
+            after = offset_bounds(db)["last_offset"]
+        finally:
+            db.close()
+    
+    async def event_stream():
+        offset = after
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            events = await wait_for_events(ReadSession, event_notifier, offset, 100, SSE_HEARTBEAT_SECONDS)
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                yield format_sse(event)
+            offset = events[-1]["offset"]
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001, reload=True)
\ No newline at end of file
+    from shared.server import serve
+    serve("main:app", port=8001, reload=True)
\ No newline at end of file
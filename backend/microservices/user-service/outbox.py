@@ -0,0 +1,190 @@
+"""Transactional outbox for user change events
+
+``create_user``/``update_user``/``delete_user`` add a ``UserEventDB`` row in
+the same transaction as the change itself, so an event exists if and only
+if the change committed. Rows are numbered by an autoincrementing offset
+that is never reused, which gives consumers a total order to resume from.
+
+Consumers follow the outbox in one of two ways:
+
+- ``GET /events`` long-polls, and ``GET /events/stream`` pushes
+  Server-Sent Events. Both start after a given offset.
+- ``RedisStreamRelay`` copies events into a Redis stream whose entry IDs
+  are the offsets (``<offset>-0``), so readers can use ``XREAD`` from any
+  offset. The relay is idempotent: several workers relaying the same rows
+  cannot create duplicates.
+
+Writers wake local long-pollers through ``EventNotifier``. Pollers in other
+worker processes fall back to re-reading the table every
+``CROSS_PROCESS_POLL_SECONDS``.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import Column, DateTime, Integer, String, Text, func
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+USER_CREATED = "user.created"
+USER_UPDATED = "user.updated"
+USER_DELETED = "user.deleted"
+
+CROSS_PROCESS_POLL_SECONDS = 0.5
+RELAY_BATCH = 500
+
+# Kept apart from the main models' metadata so the outbox can be created and pruned on its own
+OutboxBase = declarative_base()
+
+class UserEventDB(OutboxBase):
+    __tablename__ = "user_events"
+    __table_args__ = {"sqlite_autoincrement": True}  # offsets are never reused after pruning
+
+    offset = Column(Integer, primary_key=True)
+    type = Column(String, nullable=False)
+    user_id = Column(Integer, nullable=False, index=True)
+    payload = Column(Text, nullable=False)  # JSON snapshot of the user after the change
+    occurred_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+def record_event(db: Session, event_type: str, user_id: int, user: Dict[str, Any]) -> int:
+    """Add an event to the current transaction (committed with the change); returns its offset"""
+    event = UserEventDB(type=event_type, user_id=user_id, payload=json.dumps(user, default=str))
+    db.add(event)
+    db.flush()
+    return event.offset
+
+def event_dict(row: UserEventDB) -> Dict[str, Any]:
+    return {
+        "offset": row.offset,
+        "type": row.type,
+        "user_id": row.user_id,
+        "user": json.loads(row.payload),
+        "occurred_at": row.occurred_at.isoformat(),
+    }
+
+def read_events(db: Session, after: int, limit: int) -> List[Dict[str, Any]]:
+    rows = db.query(UserEventDB).filter(UserEventDB.offset > after).order_by(UserEventDB.offset).limit(limit).all()
+    return [event_dict(row) for row in rows]
+
+def offset_bounds(db: Session) -> Dict[str, int]:
+    """Oldest retained and newest offsets (0 when the outbox is empty)"""
+    first, last = db.query(func.min(UserEventDB.offset), func.max(UserEventDB.offset)).one()
+    return {"first_offset": first or 0, "last_offset": last or 0}
+
+def prune_events(db: Session, keep: int) -> int:
+    """Delete all but the newest ``keep`` events (the caller commits)"""
+    last = db.query(func.max(UserEventDB.offset)).scalar() or 0
+    return db.query(UserEventDB).filter(UserEventDB.offset <= last - keep).delete(synchronize_session=False)
+
+def format_sse(event: Dict[str, Any]) -> str:
+    return f"id: {event['offset']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+class EventNotifier:
+    """Wakes coroutines waiting for new events in this process"""
+
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def notify(self):
+        # Release current waiters and start a fresh generation for the next ones
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """True if notified within ``timeout`` seconds"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+async def wait_for_events(session_factory: Callable[[], Session], notifier: EventNotifier, after: int,
+                          limit: int, wait: float) -> List[Dict[str, Any]]:
+    """Events after ``after``, waiting up to ``wait`` seconds for the first one"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        db = session_factory()
+        try:
+            events = read_events(db, after, limit)
+        finally:
+            db.close()
+        remaining = deadline - loop.time()
+        if events or remaining <= 0:
+            return events
+        await notifier.wait(min(remaining, CROSS_PROCESS_POLL_SECONDS))
+
+class RedisStreamRelay:
+    """Copies outbox events into a Redis stream, keyed by offset"""
+
+    def __init__(self, session_factory: Callable[[], Session], notifier: EventNotifier, redis_url: str,
+                 stream: str, maxlen: Optional[int] = None):
+        self.session_factory = session_factory
+        self.notifier = notifier
+        self.redis_url = redis_url
+        self.stream = stream
+        self.maxlen = maxlen
+        self.relayed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        try:
+            import redis.asyncio as redis
+            from redis.exceptions import ResponseError
+        except ImportError:
+            logger.warning("redis is not installed; user events are only available over HTTP")
+            return
+
+        client = redis.from_url(self.redis_url, decode_responses=True)
+        try:
+            while True:
+                try:
+                    await self._relay_pending(client, ResponseError)
+                except (OSError, redis.RedisError) as e:
+                    logger.warning(f"Relaying user events to Redis failed: {str(e)}")
+                    await asyncio.sleep(1.0)
+                await self.notifier.wait(CROSS_PROCESS_POLL_SECONDS)
+        finally:
+            await client.aclose()
+
+    async def _last_relayed(self, client) -> int:
+        if not await client.exists(self.stream):
+            return 0
+        info = await client.xinfo_stream(self.stream)
+        return int(info["last-generated-id"].split("-", 1)[0])
+
+    async def _relay_pending(self, client, response_error):
+        after = await self._last_relayed(client)
+        while True:
+            db = self.session_factory()
+            try:
+                events = read_events(db, after, RELAY_BATCH)
+            finally:
+                db.close()
+            if not events:
+                return
+            for event in events:
+                try:
+                    await client.xadd(
+                        self.stream, {"event": json.dumps(event)}, id=f"{event['offset']}-0",
+                        maxlen=self.maxlen, approximate=True
+                    )
+                    self.relayed += 1
+                except response_error:
+                    pass  # another worker already relayed this offset
+                after = event["offset"]
@@ -0,0 +1,195 @@
+"""Read replicas for the user service
+
+Read-only handlers get their session from ``ReplicaSet.route``. It picks a
+healthy replica (round robin) and falls back to the primary's read pool
+when no replica qualifies.
+
+Health and lag come from a heartbeat. Every ``replica_check_seconds`` the
+primary writes the current time into ``replication_heartbeat``, and each
+replica is asked for its copy of that row and for the newest outbox offset
+it holds. The lag is how far the replica's heartbeat trails the one just
+written. A replica is used only while it answers and its lag is within
+``replica_max_lag_seconds``.
+
+Read-your-writes uses the outbox offset as the replication position.
+Every write responds with ``X-Read-After: <offset of its event>``. A client
+that sends the header back is only served by replicas known to hold that
+offset, and by the primary until one does. Clients that do not send it get
+eventual consistency, bounded by the lag limit.
+
+For local testing, replicas can be SQLite files. With
+``replica_sync_seconds`` set, the service copies the primary into them on
+that interval with SQLite's backup API, which simulates asynchronous
+replication with up to that much lag. Real replicas (e.g. Postgres
+standbys) replicate the heartbeat row like any other.
+"""
+import asyncio
+import itertools
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, Float, Integer
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session, sessionmaker
+
+from shared.metrics import count_db_read, record_replica_check
+
+from database import create_read_engine, is_sqlite
+from outbox import offset_bounds
+
+logger = logging.getLogger(__name__)
+
+READ_AFTER_HEADER = "X-Read-After"
+HEARTBEAT_ID = 1
+
+ReplicationBase = declarative_base()
+
+class ReplicationHeartbeatDB(ReplicationBase):
+    __tablename__ = "replication_heartbeat"
+
+    id = Column(Integer, primary_key=True)
+    beat_at = Column(Float, nullable=False)  # epoch seconds on the primary
+
+def write_heartbeat(db: Session) -> float:
+    """Write operation: stamp the heartbeat row and return the stamp"""
+    now = time.time()
+    row = db.get(ReplicationHeartbeatDB, HEARTBEAT_ID)
+    if row is None:
+        db.add(ReplicationHeartbeatDB(id=HEARTBEAT_ID, beat_at=now))
+    else:
+        row.beat_at = now
+    return now
+
+def sqlite_path(url: str) -> str:
+    return make_url(url).database
+
+def copy_sqlite_database(source_url: str, target_url: str):
+    """Copy one SQLite database over another with the online backup API"""
+    source = sqlite3.connect(sqlite_path(source_url))
+    target = sqlite3.connect(sqlite_path(target_url))
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+class Replica:
+    def __init__(self, name: str, url: str, settings):
+        self.name = name
+        self.url = url
+        self.engine = create_read_engine(url, settings)
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.position = 0  # newest outbox offset seen on the replica
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+
+    def check(self, primary_beat: float, max_lag: float):
+        db = self.session_factory()
+        try:
+            beat_at = db.query(ReplicationHeartbeatDB.beat_at).filter(ReplicationHeartbeatDB.id == HEARTBEAT_ID).scalar()
+            self.position = offset_bounds(db)["last_offset"]
+            self.lag = max(0.0, primary_beat - beat_at) if beat_at is not None else None
+            self.error = None if beat_at is not None else "no heartbeat replicated yet"
+        except Exception as e:
+            self.lag = None
+            self.error = str(e)
+        finally:
+            db.close()
+        healthy = self.lag is not None and self.lag <= max_lag
+        if healthy and not self.healthy:
+            logger.info(f"Replica {self.name} is in rotation (lag {self.lag:.3f}s)")
+        elif self.healthy and not healthy:
+            logger.warning(f"Replica {self.name} is out of rotation (lag {self.lag}, error {self.error})")
+        self.healthy = healthy
+        self.checked_at = time.time()
+        record_replica_check(self.name, healthy, self.lag)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "lag_seconds": round(self.lag, 3) if self.lag is not None else None,
+            "position": self.position,
+            "error": self.error,
+            "checked_at": self.checked_at,
+        }
+
+class ReplicaSet:
+    """Routes read sessions between the primary and its replicas"""
+
+    def __init__(self, urls: List[str], settings, primary_url: str, primary_reads: sessionmaker, writer):
+        self.primary_url = primary_url
+        self.primary_reads = primary_reads
+        self.writer = writer
+        self.max_lag = settings.replica_max_lag_seconds
+        self.check_seconds = settings.replica_check_seconds
+        self.sync_seconds = settings.replica_sync_seconds
+        self.replicas = [Replica(f"replica{index}", url, settings) for index, url in enumerate(urls)]
+        self._turn = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+
+    def route(self, read_after: int = 0) -> Tuple[str, sessionmaker]:
+        """(target name, session factory) for a read that must see offset ``read_after``"""
+        candidates = [replica for replica in self.replicas if replica.healthy and replica.position >= read_after]
+        if not candidates:
+            count_db_read("primary")
+            return "primary", self.primary_reads
+        replica = candidates[next(self._turn) % len(candidates)]
+        count_db_read(replica.name)
+        return replica.name, replica.session_factory
+
+    def start(self):
+        if not self.replicas:
+            return
+        self._tasks.append(asyncio.create_task(self._check_periodically()))
+        if self.sync_seconds > 0:
+            self._tasks.append(asyncio.create_task(self._sync_periodically()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def dispose(self, close: bool = True):
+        for replica in self.replicas:
+            replica.engine.dispose(close=close)
+
+    async def check(self):
+        """Write a heartbeat on the primary and re-check every replica against it"""
+        primary_beat = await self.writer.submit(write_heartbeat)
+        for replica in self.replicas:
+            await asyncio.to_thread(replica.check, primary_beat, self.max_lag)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "max_lag_seconds": self.max_lag,
+            "replicas": [replica.status() for replica in self.replicas],
+        }
+
+    async def _check_periodically(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logger.warning(f"Replica health check failed: {str(e)}")
+            await asyncio.sleep(self.check_seconds)
+
+    async def _sync_periodically(self):
+        # Stand-in replication for local SQLite replicas only
+        targets = [replica for replica in self.replicas if is_sqlite(replica.url)]
+        if not is_sqlite(self.primary_url) or not targets:
+            logger.warning("replica_sync_seconds only applies to SQLite primaries and replicas; not syncing")
+            return
+        while True:
+            for replica in targets:
+                try:
+                    await asyncio.to_thread(copy_sqlite_database, self.primary_url, replica.url)
+                except sqlite3.Error as e:
+                    logger.warning(f"Copying the primary into {replica.name} failed: {str(e)}")
+            await asyncio.sleep(self.sync_seconds)
@@ -0,0 +1,256 @@
+"""Negotiated response compression (zstd, brotli, gzip)
+
+``CompressionMiddleware`` compresses complete (non-streaming) responses whose
+content type is compressible and whose body is at least ``minimum_size``
+bytes, using the best encoding the client accepts. Levels can be tuned per
+content type. Bodies of ``offload_size`` bytes or more are compressed in the
+threadpool so the event loop keeps serving other requests.
+
+Compressed variants are kept in a small LRU keyed by the request target plus
+the response's strong ETag (or by a hash of the body) and the encoding, so a
+hot response is compressed once and reused until its content changes.
+
+``zstandard`` and ``brotli`` are optional; gzip is always available.
+"""
+import gzip
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd is optional
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+DEFAULT_LEVELS: Dict[str, Dict[str, int]] = {
+    # Per content type prefix; the longest matching prefix wins
+    "application/json": {"zstd": 3, "br": 4, "gzip": 6},
+    "text/": {"zstd": 3, "br": 5, "gzip": 6},
+}
+FALLBACK_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+
+def _gzip(body: bytes, level: int) -> bytes:
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+def _brotli(body: bytes, level: int) -> bytes:
+    return brotli.compress(body, quality=level)
+
+def _zstd(body: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+def available_encoders() -> Dict[str, Callable[[bytes, int], bytes]]:
+    """Installed encoders in server preference order"""
+    encoders: Dict[str, Callable[[bytes, int], bytes]] = {}
+    if zstandard is not None:
+        encoders["zstd"] = _zstd
+    if brotli is not None:
+        encoders["br"] = _brotli
+    encoders["gzip"] = _gzip
+    return encoders
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Map each coding in an ``Accept-Encoding`` header to its q-value"""
+    accepted: Dict[str, float] = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+def choose_encoding(header: Optional[str], encoders: List[str]) -> Optional[str]:
+    """Pick the encoding with the highest q-value, breaking ties by server preference"""
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for name in encoders:
+        q = accepted.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+class CompressedCache:
+    """Thread-safe LRU of compressed bodies, bounded by total size"""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str, int], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str, int]) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Tuple[str, str, int], value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+class CompressionMiddleware:
+    """ASGI middleware that compresses buffered responses for accepting clients
+
+    Streaming responses (more than one body message), bodies that already
+    have a ``Content-Encoding`` and ``304``/``206`` responses pass through
+    untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, offload_size: int = 256 * 1024,
+                 levels: Optional[Dict[str, Dict[str, int]]] = None, cache_bytes: int = 32 * 1024 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        self.encoders = available_encoders()
+        self.cache = CompressedCache(cache_bytes) if cache_bytes else None
+
+    def _level(self, content_type: str, encoding: str) -> int:
+        matches = [prefix for prefix in self.levels if content_type.startswith(prefix)]
+        levels = self.levels[max(matches, key=len)] if matches else FALLBACK_LEVELS
+        return levels.get(encoding, FALLBACK_LEVELS[encoding])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope["headers"])
+        encoding = choose_encoding(
+            request_headers.get(b"accept-encoding", b"").decode("latin-1"), list(self.encoders)
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = {key.lower(): value for key, value in start_message.get("headers", [])}
+            content_type = headers.get(b"content-type", b"").decode("latin-1").lower()
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or start_message["status"] in (204, 206, 304)
+                or b"content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = await self._compress(body, encoding, self._level(content_type, encoding),
+                                              self._validator(scope, headers.get(b"etag")))
+            response_headers = [
+                (key, value) for key, value in start_message.get("headers", [])
+                if key.lower() not in (b"content-length", b"etag")
+            ]
+            response_headers.append((b"content-encoding", encoding.encode()))
+            response_headers.append((b"content-length", str(len(compressed)).encode()))
+            if b"etag" in headers:
+                # The compressed variant is a different byte sequence, so the validator becomes weak
+                etag = headers[b"etag"]
+                response_headers.append((b"etag", etag if etag.startswith(b"W/") else b"W/" + etag))
+            vary = headers.get(b"vary")
+            if vary is None:
+                response_headers.append((b"vary", b"Accept-Encoding"))
+            elif b"accept-encoding" not in vary.lower():
+                response_headers = [(k, v) for k, v in response_headers if k.lower() != b"vary"]
+                response_headers.append((b"vary", vary + b", Accept-Encoding"))
+            await send({**start_message, "headers": response_headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _validator(scope, etag: Optional[bytes]) -> Optional[str]:
+        # ETags are only unique per resource, so qualify them with the request target
+        if not etag or etag.startswith(b"W/"):
+            return None
+        target = scope["path"] + "?" + scope.get("query_string", b"").decode("latin-1")
+        return f"{target} {etag.decode('latin-1')}"
+
+    async def _compress(self, body: bytes, encoding: str, level: int, validator: Optional[str]) -> bytes:
+        key = None
+        if self.cache is not None:
+            key = (validator or hashlib.blake2b(body, digest_size=16).hexdigest(), encoding, level)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        compress = self.encoders[encoding]
+        if len(body) >= self.offload_size:
+            compressed = await run_in_threadpool(compress, body, level)
+        else:
+            compressed = compress(body, level)
+
+        if key is not None:
+            self.cache.put(key, compressed)
+        return compressed
+
+def setup_compression(app, settings):
+    """Add ``CompressionMiddleware`` to ``app`` as configured in settings"""
+    if not settings.compression_enabled:
+        return
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_minimum_size,
+        offload_size=settings.compression_offload_size,
+        levels=settings.compression_levels,
+        cache_bytes=settings.compression_cache_bytes
+    )
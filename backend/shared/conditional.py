@@ -0,0 +1,101 @@
+"""HTTP validators and conditional GET (``ETag``, ``Last-Modified``, ``304``)
+
+Two kinds of validators are supported:
+
+- version validators, built from data the endpoint already has (ids and
+  ``updated_at`` columns) with ``weak_etag``; checking them happens before
+  the body is serialised, so an unchanged resource costs only headers
+- content validators, a strong ETag hashed from the encoded body with
+  ``strong_etag`` (``conditional_response``), for data without a version
+
+Responses carry ``Cache-Control: no-cache`` so browsers keep the body but
+revalidate it on every use, sending ``If-None-Match``/``If-Modified-Since``.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from shared.responses import RawJSONResponse, dumps, encode_model
+
+CACHE_CONTROL = "no-cache"
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def weak_etag(*parts: Any) -> str:
+    """Weak ETag for a resource version, e.g. ``weak_etag("user", user.id, user.updated_at)``"""
+    return f'W/"{_digest(repr(parts).encode("utf-8"))}"'
+
+def strong_etag(body: bytes) -> str:
+    """Strong ETag for an exact byte representation"""
+    return f'"{_digest(body)}"'
+
+def _as_utc(value: datetime) -> datetime:
+    # Naive datetimes in this codebase come from datetime.utcnow()
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def http_date(value: datetime) -> str:
+    """Format a datetime as an IMF-fixdate (``Last-Modified`` value)"""
+    return format_datetime(_as_utc(value), usegmt=True)
+
+def parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        return _as_utc(parsedate_to_datetime(value))
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def _opaque(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of ``etag`` against an ``If-None-Match`` header"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = _opaque(etag)
+    return any(_opaque(candidate.strip()) == opaque for candidate in if_none_match.split(","))
+
+def is_not_modified(request: Request, etag: Optional[str] = None,
+                    last_modified: Optional[datetime] = None) -> bool:
+    """Whether the client's cached copy is current (RFC 9110 precedence)"""
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return etag is not None and etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date(if_modified_since)
+        # HTTP dates have one-second resolution
+        return since is not None and _as_utc(last_modified).replace(microsecond=0) <= since
+    return False
+
+def validator_headers(etag: Optional[str] = None, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    """``ETag``/``Last-Modified``/``Cache-Control`` headers for a response"""
+    headers = {"Cache-Control": CACHE_CONTROL}
+    if etag is not None:
+        headers["ETag"] = etag
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+def not_modified_response(etag: Optional[str] = None, last_modified: Optional[datetime] = None) -> Response:
+    """Empty ``304 Not Modified`` carrying the current validators"""
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+def conditional_response(request: Request, content: Any, response_type: Any = None) -> Response:
+    """Encode ``content`` and answer with ``304`` when its hash matches ``If-None-Match``
+
+    With ``response_type`` the content is encoded like ``model_response``.
+    """
+    if response_type is not None:
+        body = encode_model(content, response_type)
+    else:
+        body = dumps(content)
+    etag = strong_etag(body)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    return RawJSONResponse(body, headers=validator_headers(etag))
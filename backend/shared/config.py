@@ -1,5 +1,6 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 import os
 
 class Settings(BaseSettings):
@@ -17,12 +18,38 @@ class Settings(BaseSettings):
     # Database
     database_url: str = "sqlite:///./app.db"
     database_echo: bool = False
+    sqlite_profile: str = "tuned"  # tuned (WAL, group-committed writes, read pool) or default (SQLite defaults)
+    sqlite_mmap_size: int = 268435456  # bytes of the database file read through mmap
+    sqlite_cache_size_kb: int = 65536  # page cache per connection
+    sqlite_busy_timeout_ms: int = 5000  # wait this long for a lock held by another process
+    sqlite_read_pool_size: int = 8  # idle read connections kept open; more are opened under load
+    sqlite_write_batch: int = 64  # most writes committed together in one transaction
+    
+    # Read replicas (user-service)
+    user_db_replicas: List[str] = []  # read-only database URLs, e.g. ["sqlite:///./users-replica.db"]
+    replica_max_lag_seconds: float = 5.0  # replicas further behind than this serve no reads
+    replica_check_seconds: float = 1.0  # heartbeat and health check interval
+    replica_sync_seconds: float = 0.0  # SQLite stand-ins only: copy the primary into them this often (0 = off)
+    
+    # Analytics point storage (data-service): columnar segment files, one directory per time partition
+    analytics_data_dir: str = "./analytics-data"
+    analytics_partition_hours: int = 24
+    analytics_flush_rows: int = 65536  # buffered points are written as a segment at this many ...
+    analytics_flush_seconds: float = 5.0  # ... or after this long
+    analytics_compact_min_segments: int = 4  # merge a partition's small segments once it has this many
+    analytics_compact_target_rows: int = 1000000  # segments this large are not compacted further
+    analytics_retention_days: float = 30.0  # partitions older than this are dropped (0 = keep everything)
+    analytics_maintenance_seconds: float = 60.0  # compaction and retention interval
     
     # Authentication
     secret_key: str = "your-secret-key-change-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     refresh_token_expire_days: int = 7
+    revocation_bloom_bits: int = 65536  # size of the revoked-token prefilter distributed to other services
+    revocation_bloom_hashes: int = 5
+    revocation_refresh_seconds: float = 2.0  # how often the gateway re-fetches the filter (revocation delay)
+    service_token: Optional[str] = None  # shared secret services send in X-Service-Token to internal endpoints
     
     # CORS
     cors_origins: List[str] = ["*"]
@@ -33,6 +60,11 @@ class Settings(BaseSettings):
     # Logging
     log_level: str = "INFO"
     log_format: str = "json"  # json or text
+    log_async: bool = False  # write logs from a background thread via a bounded queue
+    log_queue_size: int = 10000
+    log_overflow_policy: str = "drop"  # drop or block when the log queue is full
+    log_json_backend: str = "auto"  # auto, orjson, msgspec or json
+    log_sample_rates: Dict[str, float] = {}  # by event_type, logger or level, e.g. {"http_request": 0.01, "DEBUG": 0.1}
     
     # Service URLs
     user_service_url: str = "http://localhost:8001"
@@ -44,18 +76,67 @@ class Settings(BaseSettings):
     redis_url: Optional[str] = None
     redis_password: Optional[str] = None
     
+    # User change events (user-service outbox)
+    user_events_backend: str = "http"  # http (long-poll /events) or redis (stream relayed from the outbox)
+    user_events_stream: str = "user-events"  # Redis stream name
+    user_events_retention: int = 100000  # newest events kept in the outbox and stream
+    user_events_wait: float = 25.0  # seconds a consumer's long-poll waits for new events
+    user_info_cache_size: int = 10000  # user records the auth service keeps between change events
+    user_info_cache_seconds: float = 300.0  # refetch a cached user record after this long (missed events)
+    
     # Monitoring
     enable_metrics: bool = True
     metrics_port: int = 9090
     
+    # Profiling (opt-in): /debug/profile and /debug/slow-requests on every service
+    profiling_enabled: bool = False
+    profiling_admin_token: Optional[str] = None  # required in X-Admin-Token when set
+    profiling_interval_ms: float = 10.0  # sampling period
+    profiling_slow_request_ms: float = 500.0  # keep stacks of requests slower than this (0 = off)
+    profiling_slow_request_buffer: int = 50  # slow requests kept, newest replacing oldest
+    
+    # Tracing
+    tracing_enabled: bool = True
+    trace_export_path: Optional[str] = None  # JSON lines file for finished spans
+    trace_otlp_endpoint: Optional[str] = None  # e.g. http://localhost:4318/v1/traces
+    
+    # Gateway routing: extra rules appended to the built-in table, e.g.
+    # [{"prefix": "/api/reports", "service": "data", "upstream_prefix": "/reports", "methods": ["GET"]}]
+    gateway_routes: List[Dict[str, Any]] = []
+    
+    # Gateway concurrency limits, one adaptive limiter per upstream service
+    gateway_limiter_enabled: bool = True
+    gateway_limiter_algorithm: str = "gradient"  # gradient or aimd
+    gateway_limit_initial: int = 20
+    gateway_limit_min: int = 2
+    gateway_limit_max: int = 200
+    gateway_queue_size: int = 100  # requests waiting per upstream before the least important are shed
+    gateway_queue_timeout: float = 2.0  # seconds a request may wait for a slot (within its route timeout)
+    
+    # Response compression (gateway)
+    compression_enabled: bool = True
+    compression_minimum_size: int = 1024  # bytes; smaller bodies are sent as-is
+    compression_offload_size: int = 262144  # bodies this large are compressed in the threadpool
+    compression_levels: Dict[str, Dict[str, int]] = {}  # e.g. {"application/json": {"gzip": 5, "br": 4, "zstd": 3}}
+    compression_cache_bytes: int = 33554432  # compressed variants kept for reuse (0 disables)
+    
+    # Server (python -m shared.server)
+    server_reload: bool = False  # development mode: one process with auto-reload
+    server_workers: Optional[int] = None  # default: usable CPUs
+    server_backlog: int = 2048
+    server_keepalive: int = 75  # seconds; keep above the proxy's idle timeout
+    server_graceful_timeout: int = 30  # seconds to drain in-flight requests on SIGTERM
+    server_timeout: int = 60  # seconds before a silent worker is restarted
+    server_max_requests: int = 0  # recycle workers after this many requests (0 = never)
+    server_loop: str = "auto"  # auto, uvloop or asyncio
+    server_http: str = "auto"  # auto, httptools or h11
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
         case_sensitive = False
 
-# Create settings instance
-settings = Settings()
-
+@lru_cache()
 def get_settings() -> Settings:
-    """Get application settings"""
-    return settings
\ No newline at end of file
+    """Get application settings (read from the environment and .env on first use)"""
+    return Settings()
\ No newline at end of file
@@ -0,0 +1,187 @@
+"""Followers for the user service's change-event feed
+
+The user service records every create/update/delete in a transactional
+outbox and serves it as an ordered feed (see
+``microservices/user-service/outbox.py``). A consumer here keeps the offset
+of the last event it applied and asks for the next ones. The feed is read
+in one of two ways:
+
+- ``EventFeedConsumer`` long-polls ``GET /events`` over one pooled
+  connection, so a change reaches the consumer a few milliseconds after it
+  commits and an idle consumer costs one request every
+  ``user_events_wait`` seconds.
+- ``RedisStreamConsumer`` reads the Redis stream the user service relays
+  the outbox into, with ``XREAD BLOCK``.
+
+Consumers start at the head of the feed: state built before they started
+comes from the service's own full recompute. If the events after the
+consumer's offset have been pruned (it was down for longer than the
+retention), ``on_gap`` is called so the service can rebuild from scratch.
+The rebuild already reflects every event committed before it started, so
+the consumer skips those instead of applying them on top. ``on_gap`` may
+return the offset its rebuilt state reflects, when it knows a later one.
+
+    consumer = follow_user_events("data-service", handle_user_event, settings, on_gap=reconcile)
+    consumer.start()
+    ...
+    await consumer.stop()
+"""
+import asyncio
+import inspect
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from shared.tracing import traced_client
+
+logger = logging.getLogger("events")
+
+EventHandler = Callable[[Dict[str, Any]], Any]
+GapHandler = Callable[[], Awaitable[Any]]  # an int result is the offset the rebuilt state reflects
+
+MAX_BACKOFF_SECONDS = 30.0
+
+async def _call(handler: Callable, *args) -> Any:
+    result = handler(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+class _FeedConsumer(ABC):
+    """Offset bookkeeping and the retry loop shared by both transports"""
+
+    def __init__(self, name: str, handler: EventHandler, on_gap: Optional[GapHandler] = None,
+                 offset: Optional[int] = None, wait: float = 25.0, batch: int = 100):
+        self.name = name
+        self.handler = handler
+        self.on_gap = on_gap
+        self.offset = offset  # last applied offset; None starts at the head of the feed
+        self.wait = wait
+        self.batch = batch
+        self.applied = 0
+        self.gaps = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> Dict[str, Any]:
+        return {"offset": self.offset, "applied": self.applied, "gaps": self.gaps}
+
+    async def _apply(self, events: List[Dict[str, Any]]):
+        for event in events:
+            try:
+                await _call(self.handler, event)
+                self.applied += 1
+            except Exception as e:
+                # One bad event must not stall the feed; the periodic recompute repairs the state
+                logger.warning(f"{self.name}: handling {event.get('type')} event {event.get('offset')} failed: {str(e)}")
+            self.offset = event["offset"]
+
+    async def _gap(self, first_offset: int, head: int):
+        """Rebuild through ``on_gap``, then continue after what the rebuild reflects
+
+        ``head`` is the newest offset committed before the rebuild starts.
+        """
+        self.gaps += 1
+        logger.warning(f"{self.name}: user events after offset {self.offset} were pruned "
+                       f"(oldest retained is {first_offset}); rebuilding")
+        rebuilt = await _call(self.on_gap) if self.on_gap is not None else None
+        self.offset = max(head, rebuilt) if isinstance(rebuilt, int) else head
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                await self._follow()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"{self.name}: following user events failed, retrying in {backoff:.0f}s: {str(e)}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+            else:
+                return
+
+    @abstractmethod
+    async def _follow(self):
+        """Read the feed from ``self.offset`` until cancelled"""
+
+class EventFeedConsumer(_FeedConsumer):
+    """Long-polls the user service's ``/events`` endpoint"""
+
+    def __init__(self, name: str, url: str, handler: EventHandler, **kwargs):
+        super().__init__(name, handler, **kwargs)
+        self.url = url
+
+    async def _follow(self):
+        async with traced_client(timeout=self.wait + 10.0) as client:
+            while True:
+                params = {"limit": self.batch, "wait": self.wait}
+                if self.offset is not None:
+                    params["after"] = self.offset
+                response = await client.get(self.url, params=params)
+                response.raise_for_status()
+                page = response.json()
+                if self.offset is None:
+                    self.offset = page["next_offset"]
+                    continue
+                events = page["events"]
+                if page["first_offset"] > self.offset + 1:
+                    # Every event on this page was committed before the rebuild reads its state
+                    head = max([page["last_offset"]] + [event["offset"] for event in events])
+                    await self._gap(page["first_offset"], head)
+                    events = [event for event in events if event["offset"] > self.offset]
+                await self._apply(events)
+
+class RedisStreamConsumer(_FeedConsumer):
+    """Reads the outbox relayed into a Redis stream (entry IDs are ``<offset>-0``)"""
+
+    def __init__(self, name: str, redis_url: str, stream: str, handler: EventHandler, **kwargs):
+        super().__init__(name, handler, **kwargs)
+        self.redis_url = redis_url
+        self.stream = stream
+
+    async def _follow(self):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            logger.warning(f"{self.name}: redis is not installed; not following user events")
+            return
+
+        client = redis.from_url(self.redis_url, decode_responses=True)
+        try:
+            if self.offset is None:
+                info = await client.xinfo_stream(self.stream) if await client.exists(self.stream) else None
+                self.offset = int(info["last-generated-id"].split("-", 1)[0]) if info else 0
+            else:
+                first = await client.xrange(self.stream, count=1)
+                first_offset = int(first[0][0].split("-", 1)[0]) if first else 0
+                if first_offset > self.offset + 1:
+                    info = await client.xinfo_stream(self.stream)
+                    await self._gap(first_offset, int(info["last-generated-id"].split("-", 1)[0]))
+            while True:
+                reply = await client.xread({self.stream: f"{self.offset}-0"}, count=self.batch,
+                                           block=int(self.wait * 1000))
+                for _, entries in reply:
+                    await self._apply([json.loads(fields["event"]) for _, fields in entries])
+        finally:
+            await client.aclose()
+
+def follow_user_events(name: str, handler: EventHandler, settings, on_gap: Optional[GapHandler] = None,
+                       user_service_url: Optional[str] = None) -> _FeedConsumer:
+    """Consumer for the configured backend (``user_events_backend``); call ``start()`` on it"""
+    if settings.user_events_backend == "redis" and settings.redis_url:
+        return RedisStreamConsumer(name, settings.redis_url, settings.user_events_stream, handler,
+                                   on_gap=on_gap, wait=settings.user_events_wait)
+    url = f"{(user_service_url or settings.user_service_url).rstrip('/')}/events"
+    return EventFeedConsumer(name, url, handler, on_gap=on_gap, wait=settings.user_events_wait)
@@ -1,15 +1,69 @@
+import atexit
 import logging
+import os
+import queue
+import random
 import sys
-from typing import Any
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Optional, TextIO
 import json
-from datetime import datetime
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+def get_json_dumps(backend: str = "auto") -> Callable[[Dict[str, Any]], str]:
+    """Return a ``dict -> str`` JSON encoder for the requested backend
+    
+    ``auto`` prefers orjson, then msgspec, then the stdlib ``json`` module.
+    Values the encoder does not understand are rendered with ``str``.
+    """
+    if backend in ("auto", "orjson"):
+        try:
+            import orjson
+            return lambda obj: orjson.dumps(obj, default=str).decode("utf-8")
+        except ImportError:
+            if backend == "orjson":
+                raise
+    if backend in ("auto", "msgspec"):
+        try:
+            import msgspec
+            encoder = msgspec.json.Encoder(enc_hook=str)
+            return lambda obj: encoder.encode(obj).decode("utf-8")
+        except ImportError:
+            if backend == "msgspec":
+                raise
+    if backend not in ("auto", "json"):
+        raise ValueError(f"Unknown JSON backend '{backend}'")
+    return json.JSONEncoder(default=str).encode
 
 class JSONFormatter(logging.Formatter):
-    """Custom JSON formatter for structured logging"""
+    """Custom JSON formatter for structured logging
+    
+    Every ``extra`` field (user_id, request_id, service, event_type, ...) is
+    carried into the output. The timestamp is taken from the record and its
+    second-resolution prefix is cached, so only the microseconds are
+    formatted per record. ``service``, when given, is added to every record.
+    """
+    
+    def __init__(self, backend: str = "auto", service: Optional[str] = None):
+        super().__init__()
+        self._dumps = get_json_dumps(backend)
+        self.service = service
+        self._cached_second = (None, "")
+    
+    def _timestamp(self, created: float) -> str:
+        second = int(created)
+        cached_second, prefix = self._cached_second
+        if second != cached_second:
+            prefix = datetime.fromtimestamp(second, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+            self._cached_second = (second, prefix)
+        return f"{prefix}.{int((created - second) * 1_000_000):06d}"
     
     def format(self, record: logging.LogRecord) -> str:
         log_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": self._timestamp(record.created),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
@@ -17,42 +71,262 @@ class JSONFormatter(logging.Formatter):
             "function": record.funcName,
             "line": record.lineno
         }
+        if self.service:
+            log_entry["service"] = self.service
         
         # Add extra fields if present
-        if hasattr(record, 'user_id'):
-            log_entry["user_id"] = record.user_id
-        
-        if hasattr(record, 'request_id'):
-            log_entry["request_id"] = record.request_id
-            
-        if hasattr(record, 'service'):
-            log_entry["service"] = record.service
+        attrs = record.__dict__
+        for key in attrs.keys() - _RECORD_ATTRS:
+            log_entry[key] = attrs[key]
         
         # Add exception info if present
         if record.exc_info:
             log_entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_entry["exception"] = record.exc_text
         
-        return json.dumps(log_entry)
+        return self._dumps(log_entry)
 
-def setup_logging(service_name: str, log_level: str = "INFO") -> logging.Logger:
-    """Setup structured logging for a service"""
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of matching records
     
-    # Create logger
-    logger = logging.getLogger(service_name)
-    logger.setLevel(getattr(logging, log_level.upper()))
+    ``rates`` maps an ``event_type`` (e.g. ``http_request``), a logger name or
+    a level name (e.g. ``INFO``) to the fraction of records to keep, looked up
+    in that order. Records at ``always_level`` or above are never sampled out.
+    """
     
-    # Remove existing handlers
-    for handler in logger.handlers[:]:
-        logger.removeHandler(handler)
+    def __init__(self, rates: Dict[str, float], always_level: int = logging.WARNING):
+        super().__init__()
+        self.rates = dict(rates)
+        self.always_level = always_level
+        self.sampled_out = 0
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.always_level:
+            return True
+        rate = self.rates.get(getattr(record, "event_type", None))
+        if rate is None:
+            rate = self.rates.get(record.name)
+        if rate is None:
+            rate = self.rates.get(record.levelname)
+        if rate is None or rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+def _weak_callback(method: Callable[[], None]) -> Callable[[], None]:
+    """Wrap a bound method so the callback does not keep its object alive"""
+    ref = weakref.WeakMethod(method)
     
-    # Create console handler with JSON formatter
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(JSONFormatter())
+    def callback():
+        bound = ref()
+        if bound is not None:
+            bound()
     
-    logger.addHandler(handler)
-    logger.propagate = False
+    return callback
+
+def _at_fork_in_child(method: Callable[[], None]):
+    """Call ``method`` in forked children for as long as its object is alive"""
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_weak_callback(method))
+
+class BoundedQueueHandler(logging.Handler):
+    """Non-blocking handler that hands records to a background writer thread
+    
+    The calling thread (e.g. the event loop) only resolves the message and
+    enqueues the record. A writer thread formats records and writes them in
+    batches. When the queue is full the ``overflow_policy`` decides: "drop"
+    discards the record and counts it, "block" waits up to ``block_timeout``
+    seconds for space before dropping.
+    """
+    
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        queue_size: int = 10000,
+        overflow_policy: str = "drop",
+        block_timeout: float = 1.0,
+        batch_size: int = 256
+    ):
+        super().__init__()
+        if overflow_policy not in ("drop", "block"):
+            raise ValueError("overflow_policy must be 'drop' or 'block'")
+        self.stream = stream or sys.stdout
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self.queue: "queue.Queue[Optional[logging.LogRecord]]" = queue.Queue(maxsize=queue_size)
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.write_errors = 0
+        self._counter_lock = threading.Lock()
+        self._closed = False
+        self._start_writer()
+        # Threads do not survive fork(); prefork server workers need their own writer
+        _at_fork_in_child(self._after_fork)
+        # Flush at exit, without atexit keeping replaced handlers alive
+        self._exit_hook = _weak_callback(self.close)
+        atexit.register(self._exit_hook)
+    
+    def _start_writer(self):
+        self._writer = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._writer.start()
+    
+    def _after_fork(self):
+        if self._closed:
+            return
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self._counter_lock = threading.Lock()
+        self._start_writer()
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve message and traceback now; args may be mutated after we return
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def emit(self, record: logging.LogRecord):
+        try:
+            record = self.prepare(record)
+            if self.overflow_policy == "block":
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+            with self._counter_lock:
+                self.enqueued += 1
+        except queue.Full:
+            with self._counter_lock:
+                self.dropped += 1
+        except Exception:
+            self.handleError(record)
+    
+    def _format(self, record: logging.LogRecord) -> str:
+        try:
+            return self.format(record)
+        except Exception:
+            return f"{record.levelname} {record.name} {record.msg}"
+    
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            batch: List[logging.LogRecord] = []
+            stop = record is None
+            if not stop:
+                batch.append(record)
+            # Drain whatever else is already queued into the same write
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                else:
+                    batch.append(record)
+            if batch:
+                self._write(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self.queue.task_done()
+            if stop:
+                return
+    
+    def _write(self, batch: List[logging.LogRecord]):
+        try:
+            self.stream.write("".join(self._format(record) + "\n" for record in batch))
+            self.stream.flush()
+            self.written += len(batch)
+        except Exception:
+            self.write_errors += 1
+    
+    def flush(self):
+        """Block until every queued record has been written"""
+        if self._writer.is_alive():
+            self.queue.join()
+    
+    def close(self):
+        """Flush, stop the writer thread and close the handler"""
+        self._closed = True
+        atexit.unregister(self._exit_hook)
+        if self._writer.is_alive():
+            self.queue.put(None)
+            self._writer.join(timeout=5.0)
+        super().close()
+    
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring the logging pipeline"""
+        return {
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+            "queued": self.queue.qsize()
+        }
+
+def setup_logging(
+    service_name: str,
+    log_level: str = "INFO",
+    async_mode: bool = False,
+    queue_size: int = 10000,
+    overflow_policy: str = "drop",
+    sample_rates: Optional[Dict[str, float]] = None,
+    json_backend: str = "auto",
+    log_format: str = "json"
+) -> logging.Logger:
+    """Setup structured logging for a service
+    
+    Configures the root logger, so every module's ``logging.getLogger(__name__)``
+    (service code and ``shared`` alike) goes through the same handler, and
+    returns the ``service_name`` logger. With ``async_mode`` that handler is a
+    ``BoundedQueueHandler`` so request handlers never block on stdout.
+    ``sample_rates`` installs a ``SamplingFilter`` on the handler (e.g.
+    ``{"http_request": 0.01}``). ``log_format`` is ``json`` or ``text``.
+    """
+    if log_format not in ("json", "text"):
+        raise ValueError("log_format must be 'json' or 'text'")
+    
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, log_level.upper()))
+    
+    # Replace whatever was configured before (basicConfig, an earlier call)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    
+    if async_mode:
+        handler = BoundedQueueHandler(sys.stdout, queue_size=queue_size, overflow_policy=overflow_policy)
+    else:
+        handler = logging.StreamHandler(sys.stdout)
+    if log_format == "json":
+        handler.setFormatter(JSONFormatter(json_backend, service=service_name))
+    else:
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    
+    # On the handler, not the logger: logger filters do not see records propagated from child loggers
+    if sample_rates:
+        handler.addFilter(SamplingFilter(sample_rates))
+    
+    root.addHandler(handler)
+    return logging.getLogger(service_name)
+
+def get_logging_stats(logger: Optional[logging.Logger] = None) -> Dict[str, int]:
+    """Aggregate queue/drop counters of a logger's async handlers and sampling filters
     
-    return logger
+    Defaults to the root logger, which is where ``setup_logging`` installs them.
+    """
+    logger = logger or logging.getLogger()
+    totals: Dict[str, int] = {}
+    for handler in logger.handlers:
+        if isinstance(handler, BoundedQueueHandler):
+            for key, value in handler.stats().items():
+                totals[key] = totals.get(key, 0) + value
+        for log_filter in handler.filters:
+            if isinstance(log_filter, SamplingFilter):
+                totals["sampled_out"] = totals.get("sampled_out", 0) + log_filter.sampled_out
+    return totals
 
 def log_request(logger: logging.Logger, method: str, path: str, user_id: str = None, request_id: str = None):
     """Log HTTP request"""
@@ -0,0 +1,266 @@
+"""Prometheus instrumentation shared by the gateway and the microservices
+
+Exposes request latency histograms, in-flight gauges and status counters per
+route template, upstream call metrics, and database query timings. Label
+values are always drawn from bounded sets (route templates, known methods,
+status codes, upstream service names, SQL verbs, shed reasons) so series cardinality
+cannot grow with user input.
+
+``prometheus-client`` is optional: without it every helper is a no-op.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, Optional
+
+from fastapi import FastAPI, Response
+from starlette.routing import Match
+
+try:
+    import prometheus_client
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram
+except ImportError:  # pragma: no cover - metrics are optional
+    prometheus_client = None
+
+logger = logging.getLogger(__name__)
+
+METRICS_PATH = "/prometheus"
+UNMATCHED_ROUTE = "<unmatched>"
+ROUTE_LABEL_KEY = "metrics.route"
+KNOWN_METHODS = frozenset({"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"})
+SQL_OPERATIONS = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE", "BEGIN", "COMMIT", "ROLLBACK", "PRAGMA", "CREATE"})
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_service_name = "unknown"
+_metrics: Dict[str, Any] = {}
+
+def _create_metrics() -> Dict[str, Any]:
+    if prometheus_client is None:
+        return {}
+    return {
+        "requests": Counter(
+            "http_requests_total", "HTTP requests by route template and status",
+            ["service", "method", "route", "status"]
+        ),
+        "latency": Histogram(
+            "http_request_duration_seconds", "HTTP request latency by route template",
+            ["service", "method", "route"], buckets=LATENCY_BUCKETS
+        ),
+        "in_progress": Gauge(
+            "http_requests_in_progress", "HTTP requests currently being handled",
+            ["service", "method", "route"], multiprocess_mode="livesum"
+        ),
+        "upstream_requests": Counter(
+            "upstream_requests_total", "Calls to other services by outcome",
+            ["service", "upstream", "method", "status"]
+        ),
+        "upstream_latency": Histogram(
+            "upstream_request_duration_seconds", "Latency of calls to other services",
+            ["service", "upstream", "method"], buckets=LATENCY_BUCKETS
+        ),
+        "db_latency": Histogram(
+            "db_query_duration_seconds", "Database statement latency by SQL verb",
+            ["service", "operation"], buckets=LATENCY_BUCKETS
+        ),
+        "replica_lag": Gauge(
+            "db_replica_lag_seconds", "Replication lag measured through the heartbeat table",
+            ["service", "replica"], multiprocess_mode="max"
+        ),
+        "replica_healthy": Gauge(
+            "db_replica_healthy", "1 while the replica is used for reads",
+            ["service", "replica"], multiprocess_mode="min"
+        ),
+        "db_reads": Counter(
+            "db_read_sessions_total", "Read sessions by the database that served them",
+            ["service", "target"]
+        ),
+        "concurrency_limit": Gauge(
+            "gateway_concurrency_limit", "Adaptive concurrency limit per upstream service",
+            ["service", "upstream"], multiprocess_mode="livesum"
+        ),
+        "concurrency_inflight": Gauge(
+            "gateway_concurrency_inflight", "Requests holding an upstream concurrency slot",
+            ["service", "upstream"], multiprocess_mode="livesum"
+        ),
+        "concurrency_queued": Gauge(
+            "gateway_concurrency_queued", "Requests waiting for an upstream concurrency slot",
+            ["service", "upstream"], multiprocess_mode="livesum"
+        ),
+        "shed": Counter(
+            "gateway_shed_requests_total", "Requests rejected with 503 before reaching the upstream",
+            ["service", "upstream", "priority", "reason"]
+        ),
+        "startup": Gauge(
+            "service_startup_seconds", "Time from process start to ready, by phase",
+            ["service", "phase"], multiprocess_mode="max"
+        ),
+    }
+
+def _normalize_method(method: str) -> str:
+    method = method.upper()
+    return method if method in KNOWN_METHODS else "OTHER"
+
+def _status_label(status: Any) -> str:
+    if isinstance(status, int) and 100 <= status < 600:
+        return str(status)
+    return "error"
+
+class PrometheusMiddleware:
+    """ASGI middleware recording per-route request metrics"""
+
+    def __init__(self, app, fastapi_app: FastAPI, service: str):
+        self.app = app
+        self.service = service
+        self._resolve = lru_cache(maxsize=4096)(self._match_route)
+        self._routes = fastapi_app.router.routes
+
+    def _match_route(self, method: str, path: str) -> str:
+        scope = {"type": "http", "method": method, "path": path, "root_path": ""}
+        partial = None
+        for route in self._routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", UNMATCHED_ROUTE)
+            if match == Match.PARTIAL and partial is None:
+                partial = getattr(route, "path", UNMATCHED_ROUTE)
+        return partial or UNMATCHED_ROUTE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _metrics:
+            await self.app(scope, receive, send)
+            return
+
+        method = _normalize_method(scope["method"])
+        route = self._resolve(scope["method"], scope["path"])
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = _metrics["in_progress"].labels(self.service, method, route)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_progress.dec()
+            # Catch-all handlers can name a more specific (still bounded) route
+            route = scope.get(ROUTE_LABEL_KEY, route)
+            _metrics["requests"].labels(self.service, method, route, _status_label(status_code)).inc()
+            _metrics["latency"].labels(self.service, method, route).observe(elapsed)
+
+def set_route_label(scope: Dict[str, Any], route: str):
+    """Label this request's metrics with ``route`` (must come from a bounded set)"""
+    scope[ROUTE_LABEL_KEY] = route
+
+def metrics_response() -> Response:
+    """Render the registry (multiprocess-aware) in the Prometheus text format"""
+    if prometheus_client is None:
+        return Response("prometheus-client is not installed\n", status_code=503, media_type="text/plain")
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import CollectorRegistry, multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return Response(prometheus_client.generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+def instrument_app(app: FastAPI, service: str, enabled: bool = True, path: str = METRICS_PATH):
+    """Add request metrics middleware and the scrape endpoint to a service"""
+    global _service_name
+    _service_name = service
+    if not enabled:
+        return
+    if prometheus_client is None:
+        logger.warning("prometheus-client is not installed; metrics are disabled")
+        return
+    if not _metrics:
+        _metrics.update(_create_metrics())
+
+    app.add_middleware(PrometheusMiddleware, fastapi_app=app, service=service)
+
+    @app.get(path, include_in_schema=False)
+    async def prometheus_metrics():
+        return metrics_response()
+
+def record_startup(service: str, phases: Dict[str, float]):
+    """Export a startup report (phase name -> seconds)"""
+    if not _metrics:
+        return
+    for phase, seconds in phases.items():
+        _metrics["startup"].labels(service, phase).set(seconds)
+
+def record_replica_check(replica: str, healthy: bool, lag: Optional[float]):
+    """Export the outcome of a replica health check"""
+    if not _metrics:
+        return
+    _metrics["replica_healthy"].labels(_service_name, replica).set(1 if healthy else 0)
+    if lag is not None:
+        _metrics["replica_lag"].labels(_service_name, replica).set(lag)
+
+def count_db_read(target: str):
+    """Count a read session served by ``target`` (``primary`` or a replica name)"""
+    if _metrics:
+        _metrics["db_reads"].labels(_service_name, target).inc()
+
+def record_limiter(upstream: str, limit: int, inflight: int, queued: int):
+    """Export an upstream concurrency limiter's current state"""
+    if not _metrics:
+        return
+    _metrics["concurrency_limit"].labels(_service_name, upstream).set(limit)
+    _metrics["concurrency_inflight"].labels(_service_name, upstream).set(inflight)
+    _metrics["concurrency_queued"].labels(_service_name, upstream).set(queued)
+
+def count_shed(upstream: str, priority: str, reason: str):
+    """Count a request the limiter turned away (``queue_full``, ``evicted`` or ``timeout``)"""
+    if _metrics:
+        _metrics["shed"].labels(_service_name, upstream, priority, reason).inc()
+
+class UpstreamCall:
+    """Outcome holder for ``track_upstream``; set ``status`` to the HTTP status"""
+
+    def __init__(self):
+        self.status: Optional[int] = None
+
+@contextmanager
+def track_upstream(upstream: str, method: str = "GET") -> Iterator[UpstreamCall]:
+    """Time a call to another service (``upstream`` must be a service name, not a URL)"""
+    call = UpstreamCall()
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        if _metrics:
+            elapsed = time.perf_counter() - start
+            method = _normalize_method(method)
+            _metrics["upstream_requests"].labels(_service_name, upstream, method, _status_label(call.status)).inc()
+            _metrics["upstream_latency"].labels(_service_name, upstream, method).observe(elapsed)
+
+def instrument_sqlalchemy(engine):
+    """Record statement latency by SQL verb for a SQLAlchemy engine"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start_time"].pop()
+        if _metrics:
+            verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+            operation = verb if verb in SQL_OPERATIONS else "OTHER"
+            _metrics["db_latency"].labels(_service_name, operation).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        # Failed statements never reach after_cursor_execute
+        connection = context.connection
+        if connection is not None and connection.info.get("query_start_time"):
+            connection.info["query_start_time"].pop()
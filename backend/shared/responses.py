@@ -0,0 +1,86 @@
+"""Fast JSON responses shared by the gateway and the microservices
+
+- ``FastJSONResponse`` is the default response class of every service; it
+  renders with orjson (or msgspec) instead of the stdlib ``json`` module
+- ``model_response`` validates pydantic models (or ORM rows) against a type
+  and serialises them straight to JSON bytes with pydantic-core, skipping
+  the ``jsonable_encoder`` dict round trip FastAPI does for ``response_model``
+- ``RawJSONResponse`` sends already-encoded JSON bytes, so the gateway can
+  forward an upstream body without decoding and re-encoding it
+
+orjson and msgspec are optional; without either the stdlib encoder is used.
+"""
+import json
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, TypeAdapter
+
+def _default(obj: Any) -> Any:
+    # Types the fast encoders do not know natively (Decimal, sets, nested models, ...)
+    return jsonable_encoder(obj)
+
+def get_json_encoder(backend: str = "auto") -> Callable[[Any], bytes]:
+    """Return a ``dumps(obj) -> bytes`` function for the requested backend
+
+    ``auto`` prefers orjson, then msgspec, then the stdlib ``json`` module.
+    All backends produce compact JSON (no whitespace) in UTF-8.
+    """
+    if backend in ("auto", "orjson"):
+        try:
+            import orjson
+            options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            return lambda obj: orjson.dumps(obj, default=_default, option=options)
+        except ImportError:
+            if backend == "orjson":
+                raise
+    if backend in ("auto", "msgspec"):
+        try:
+            import msgspec
+            return msgspec.json.Encoder(enc_hook=_default).encode
+        except ImportError:
+            if backend == "msgspec":
+                raise
+    encoder = json.JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default)
+    return lambda obj: encoder.encode(obj).encode("utf-8")
+
+_dumps = get_json_encoder()
+
+def dumps(obj: Any) -> bytes:
+    """Encode ``obj`` as compact JSON bytes with the fastest available backend"""
+    if isinstance(obj, BaseModel):
+        return obj.__pydantic_serializer__.to_json(obj)
+    return _dumps(obj)
+
+class FastJSONResponse(JSONResponse):
+    """``JSONResponse`` rendered with orjson/msgspec (pydantic models via pydantic-core)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+class RawJSONResponse(Response):
+    """Response whose content is already-encoded JSON bytes"""
+
+    media_type = "application/json"
+
+@lru_cache(maxsize=None)
+def type_adapter(response_type: Any) -> TypeAdapter:
+    """Cached ``TypeAdapter`` (building one compiles a validator and serializer)"""
+    return TypeAdapter(response_type)
+
+def encode_model(content: Any, response_type: Any) -> bytes:
+    """Validate ``content`` as ``response_type`` and dump it to JSON bytes"""
+    adapter = type_adapter(response_type)
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+
+def model_response(content: Any, response_type: Any, status_code: int = 200,
+                   headers: Optional[Dict[str, str]] = None) -> RawJSONResponse:
+    """Validate ``content`` as ``response_type`` and serialise it straight to bytes
+
+    ``content`` may hold model instances or ORM objects (validated with
+    ``from_attributes``), e.g. ``model_response(rows, List[UserResponse])``.
+    Keep ``response_model=`` on the route so the OpenAPI schema is unchanged.
+    """
+    return RawJSONResponse(encode_model(content, response_type), status_code=status_code, headers=headers)
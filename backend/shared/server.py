@@ -0,0 +1,226 @@
+"""Production and development server entry point shared by every service
+
+Production (the Docker images)::
+
+    python -m shared.server main:app --port 8000
+
+runs a gunicorn master that imports the app once and forks uvicorn workers
+from it (sized from the CPU quota, ``SERVER_WORKERS`` to override). Workers
+use uvloop/httptools when installed, listen with a tuned backlog and
+keep-alive, and on SIGTERM stop accepting connections, finish in-flight
+requests (up to ``SERVER_GRACEFUL_TIMEOUT`` seconds) and run the app's
+shutdown handlers so pools are closed cleanly. With several workers,
+Prometheus metrics are aggregated through a multiprocess directory.
+
+Services that keep their state in process memory (the auth and data
+services) pass ``--stateful``: they always run exactly one worker, since
+requests answered by different workers would see different state.
+
+Development::
+
+    python main.py                      # or: python -m shared.server main:app --reload
+
+runs a single uvicorn process with the file-watching reloader.
+"""
+import argparse
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("server")
+
+def available_cpus() -> int:
+    """CPUs this process may use, honouring affinity and a cgroup v2/v1 quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - not available on macOS
+        cpus = os.cpu_count() or 1
+    quota = None
+    try:
+        max_quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if max_quota != "max":
+            quota = int(max_quota) / int(period)
+    except (OSError, ValueError):
+        try:
+            max_quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+            period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+            if max_quota > 0:
+                quota = max_quota / period
+        except (OSError, ValueError):
+            pass
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+def default_workers() -> int:
+    """One async worker per usable CPU"""
+    return available_cpus()
+
+def select_loop(preference: str = "auto") -> str:
+    if preference != "auto":
+        return preference
+    try:
+        import uvloop  # noqa: F401
+        return "uvloop"
+    except ImportError:
+        return "asyncio"
+
+def select_http(preference: str = "auto") -> str:
+    if preference != "auto":
+        return preference
+    try:
+        import httptools  # noqa: F401
+        return "httptools"
+    except ImportError:
+        return "h11"
+
+try:
+    from uvicorn.workers import UvicornWorker
+except ImportError:  # gunicorn not installed
+    UvicornWorker = None
+
+if UvicornWorker is not None:
+    class TunedUvicornWorker(UvicornWorker):
+        """UvicornWorker using the loop, protocol and drain timeout chosen by the master
+
+        gunicorn loads worker classes by import path, so the master passes
+        its choices down through the (inherited) environment.
+        """
+
+        def __init__(self, *args, **kwargs):
+            self.CONFIG_KWARGS = {
+                "loop": os.environ.get("SERVER_LOOP", "auto"),
+                "http": os.environ.get("SERVER_HTTP", "auto"),
+                "lifespan": "on",
+                "timeout_graceful_shutdown": int(os.environ.get("SERVER_GRACEFUL_TIMEOUT", "30")),
+            }
+            super().__init__(*args, **kwargs)
+
+def _child_exit(server, worker):
+    # Drop the exited worker's live gauges from the aggregated metrics
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+def run_production(app: str, host: str, port: int, workers: Optional[int] = None, backlog: int = 2048,
+                   keepalive: int = 75, graceful_timeout: int = 30, timeout: int = 60,
+                   max_requests: int = 0, loop: str = "auto", http: str = "auto", stateful: bool = False):
+    """Serve ``app`` (an import string) with preforked uvicorn workers
+
+    A ``stateful`` app keeps its state per process and is never given more
+    than one worker.
+    """
+    if stateful:
+        if workers and workers > 1:
+            logger.warning(f"{app} keeps its state in process memory; running 1 worker instead of {workers}")
+        workers = 1
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        logger.warning("gunicorn is not installed; falling back to uvicorn workers without preloading")
+        import uvicorn
+        uvicorn.run(app, host=host, port=port, workers=workers or default_workers(), backlog=backlog,
+                    timeout_keep_alive=keepalive, timeout_graceful_shutdown=graceful_timeout,
+                    loop=select_loop(loop), http=select_http(http))
+        return
+
+    workers = workers or default_workers()
+    loop, http = select_loop(loop), select_http(http)
+    os.environ.update({"SERVER_LOOP": loop, "SERVER_HTTP": http, "SERVER_GRACEFUL_TIMEOUT": str(graceful_timeout)})
+    multiproc_dir = None
+    if workers > 1 and not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Must be set before prometheus_client is imported, i.e. before the app is preloaded
+        multiproc_dir = tempfile.mkdtemp(prefix="prometheus-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = multiproc_dir
+
+    options: Dict[str, Any] = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": "shared.server.TunedUvicornWorker",
+        "preload_app": True,
+        "backlog": backlog,
+        # Longer than the proxy's idle timeout, so the proxy closes idle connections first
+        "keepalive": keepalive,
+        "graceful_timeout": graceful_timeout,
+        "timeout": timeout,
+        "max_requests": max_requests,
+        "max_requests_jitter": max_requests // 10 if max_requests else 0,
+        "child_exit": _child_exit,
+        "accesslog": "-",
+        "errorlog": "-",
+    }
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from uvicorn.importer import import_from_string
+            return import_from_string(app)
+
+    logger.info(f"Starting {app} on {host}:{port} with {workers} worker(s), loop={loop}, http={http}")
+    try:
+        Application().run()
+    finally:
+        if multiproc_dir:
+            shutil.rmtree(multiproc_dir, ignore_errors=True)
+
+def run_development(app: str, host: str, port: int):
+    """Single uvicorn process with the file-watching reloader"""
+    import uvicorn
+    uvicorn.run(app, host=host, port=port, reload=True)
+
+def serve(app: str, port: int, host: str = "0.0.0.0", reload: Optional[bool] = None, stateful: bool = False,
+          **overrides):
+    """Run ``app`` in development (reload) or production (prefork) mode
+
+    ``reload`` defaults to ``SERVER_RELOAD``; production options default to
+    the ``SERVER_*`` settings and can be overridden by keyword. ``stateful``
+    apps run a single worker (see ``run_production``).
+    """
+    from shared.config import get_settings
+
+    settings = get_settings()
+    if reload is None:
+        reload = settings.server_reload
+    if reload:
+        run_development(app, host, port)
+        return
+    options = {
+        "workers": settings.server_workers,
+        "backlog": settings.server_backlog,
+        "keepalive": settings.server_keepalive,
+        "graceful_timeout": settings.server_graceful_timeout,
+        "timeout": settings.server_timeout,
+        "max_requests": settings.server_max_requests,
+        "loop": settings.server_loop,
+        "http": settings.server_http,
+    }
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    run_production(app, host, port, stateful=stateful, **options)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a DQA service")
+    parser.add_argument("app", help="import string, e.g. main:app")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--workers", type=int, help="worker processes (default: usable CPUs)")
+    parser.add_argument("--reload", action="store_true", default=None, help="development mode with auto-reload")
+    parser.add_argument("--stateful", action="store_true",
+                        help="the app keeps state in process memory: never run more than one worker")
+    args = parser.parse_args()
+    # Until the app is imported and configures logging itself
+    logging.basicConfig(level=logging.INFO)
+
+    # Service modules import ``main`` from the working directory
+    sys.path.insert(0, os.getcwd())
+    serve(args.app, port=args.port, host=args.host, reload=args.reload, stateful=args.stateful, workers=args.workers)
+
+if __name__ == "__main__":
+    main()
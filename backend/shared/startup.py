@@ -0,0 +1,70 @@
+"""Startup timing for the services
+
+Each service builds a ``StartupReport`` at the top of its lifespan, wraps
+its initialisation steps in ``report.phase(...)`` and calls ``ready()``
+before yielding. The report splits the time since the process started into
+module imports (everything before the lifespan ran) and the named phases,
+logs a one-line summary, exports it as the ``service_startup_seconds``
+gauge and keeps it on ``app.state.startup`` for inspection.
+
+In a preforked worker the process starts at fork time, after the master
+has already imported the app, so the import phase is close to zero.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from shared.metrics import record_startup
+
+logger = logging.getLogger("startup")
+
+def process_start_time() -> Optional[float]:
+    """Wall-clock time this process started, from /proc (None elsewhere)"""
+    try:
+        # Field 22 of /proc/self/stat, counted after the parenthesised command name
+        start_ticks = int(Path("/proc/self/stat").read_text().rsplit(")", 1)[1].split()[19])
+        uptime = float(Path("/proc/uptime").read_text().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+# Fallback when /proc is unavailable: imports are then measured from here
+_IMPORTED_AT = time.time()
+
+class StartupReport:
+    """Time from process start to ready, broken down by phase"""
+
+    def __init__(self, service: str):
+        self.service = service
+        self.lifespan_started = time.time()
+        process_started = process_start_time()
+        if process_started is None or process_started > _IMPORTED_AT:
+            process_started = _IMPORTED_AT
+        self.phases: Dict[str, float] = {"imports": max(0.0, self.lifespan_started - process_started)}
+        self.total: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def ready(self) -> Dict[str, float]:
+        """Log and export the report; returns phase durations in seconds"""
+        self.total = self.phases["imports"] + (time.time() - self.lifespan_started)
+        breakdown = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases.items())
+        logger.info(f"{self.service} ready in {self.total * 1000:.0f} ms ({breakdown})")
+        record_startup(self.service, {**self.phases, "total": self.total})
+        return self.as_dict()
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "service": self.service,
+            "total_ms": round((self.total or 0.0) * 1000, 1),
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+        }
@@ -0,0 +1,386 @@
+"""Lightweight distributed tracing for the gateway and microservices
+
+Implements W3C ``traceparent`` propagation plus an ``X-Request-ID`` header:
+
+- ``TracingMiddleware`` accepts (or starts) a trace for every request and
+  records a server span
+- ``traced_client()`` returns an httpx client whose transport records a
+  client span and injects the trace headers on every outgoing call
+- finished spans are logged with their duration at DEBUG (so per-hop
+  latency is visible with ``LOG_LEVEL=DEBUG`` without adding log lines to
+  every request otherwise) and handed to an exporter that writes JSON lines
+  to a file or posts OTLP/HTTP JSON batches to a collector
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from shared.utils import generate_request_id
+
+logger = logging.getLogger("tracing")
+
+TRACEPARENT_HEADER = "traceparent"
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+# URL prefix -> transport overrides for traced clients (e.g. in-process ASGI apps)
+_transport_mounts: Dict[str, httpx.AsyncBaseTransport] = {}
+
+class Span:
+    """A timed unit of work within a trace"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], request_id: str,
+                 kind: str = "internal", service: str = "unknown", attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.request_id = request_id
+        self.kind = kind
+        self.service = service
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "ok"
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._start
+        if error is not None:
+            self.status = "error"
+            self.attributes["error"] = f"{type(error).__name__}: {error}"
+        _tracer.finish(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "request_id": self.request_id,
+            "name": self.name,
+            "kind": self.kind,
+            "service": self.service,
+            "start_time": self.start_time,
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+def parse_traceparent(value: Optional[str]):
+    """Return ``(trace_id, parent_span_id)`` from a traceparent header, or None"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    trace_id, span_id = parts[1].lower(), parts[2].lower()
+    try:
+        int(trace_id, 16), int(span_id, 16)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id
+
+class SpanExporter:
+    """Batches finished spans on a background thread
+
+    Spans are written as JSON lines to ``path`` and/or posted as OTLP/HTTP
+    JSON to ``endpoint``. The queue is bounded; spans are dropped (and
+    counted) rather than slowing down requests.
+    """
+
+    def __init__(self, path: Optional[str] = None, endpoint: Optional[str] = None,
+                 queue_size: int = 10000, batch_size: int = 512, flush_interval: float = 1.0):
+        self.path = path
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=queue_size)
+        self._start()
+        atexit.register(self.close)
+        if hasattr(os, "register_at_fork"):
+            # The exporter thread does not survive fork(); restart it in prefork workers
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start(self):
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def _after_fork(self):
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._start()
+
+    def close(self, timeout: float = 5.0):
+        """Stop the exporter thread after it has written every queued span"""
+        self._closed = True
+        self._thread.join(timeout)
+
+    def export(self, span: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch: List[Dict[str, Any]] = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                self._write(batch)
+            elif self._closed:
+                return
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        if self.path:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(span) + "\n" for span in batch))
+            except OSError as e:
+                logger.warning(f"Could not write spans to {self.path}: {e}")
+        if self.endpoint:
+            try:
+                request = urllib.request.Request(
+                    self.endpoint,
+                    data=json.dumps(to_otlp(batch)).encode("utf-8"),
+                    headers={"Content-Type": "application/json"},
+                    method="POST"
+                )
+                urllib.request.urlopen(request, timeout=5).close()
+            except Exception as e:
+                logger.warning(f"Could not post spans to {self.endpoint}: {e}")
+
+def to_otlp(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Convert span dicts into an OTLP/HTTP JSON ``ExportTraceServiceRequest``"""
+    by_service: Dict[str, List[Dict[str, Any]]] = {}
+    kinds = {"internal": 1, "server": 2, "client": 3}
+    for span in spans:
+        start_ns = int(span["start_time"] * 1e9)
+        by_service.setdefault(span["service"], []).append({
+            "traceId": span["trace_id"],
+            "spanId": span["span_id"],
+            "parentSpanId": span["parent_span_id"] or "",
+            "name": span["name"],
+            "kind": kinds.get(span["kind"], 1),
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(span["duration_ms"] * 1e6)),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in {**span["attributes"], "request_id": span["request_id"]}.items()
+            ],
+            "status": {"code": 2 if span["status"] == "error" else 1}
+        })
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+                "scopeSpans": [{"scope": {"name": "dqa.shared.tracing"}, "spans": service_spans}]
+            }
+            for service, service_spans in by_service.items()
+        ]
+    }
+
+class Tracer:
+    """Process-wide tracing configuration"""
+
+    def __init__(self):
+        self.service = "unknown"
+        self.enabled = True
+        self.log_spans = True
+        self.exporter: Optional[SpanExporter] = None
+
+    def configure(self, service: str, enabled: bool = True, export_path: Optional[str] = None,
+                  otlp_endpoint: Optional[str] = None, log_spans: bool = True):
+        self.service = service
+        self.enabled = enabled
+        self.log_spans = log_spans
+        if enabled and (export_path or otlp_endpoint):
+            self.exporter = SpanExporter(export_path, otlp_endpoint)
+
+    def finish(self, span: Span):
+        if self.log_spans and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"{span.kind} span '{span.name}' took {span.duration * 1000:.2f} ms "
+                f"[request_id={span.request_id} trace_id={span.trace_id}]",
+                extra={
+                    "event_type": "span",
+                    "service": span.service,
+                    "request_id": span.request_id,
+                    "trace_id": span.trace_id,
+                    "span_id": span.span_id,
+                    "parent_span_id": span.parent_id,
+                    "duration_ms": round(span.duration * 1000, 3),
+                    "span_kind": span.kind
+                }
+            )
+        if self.exporter is not None:
+            self.exporter.export(span.to_dict())
+
+_tracer = Tracer()
+
+def configure_tracing(service: str, enabled: bool = True, export_path: Optional[str] = None,
+                      otlp_endpoint: Optional[str] = None, log_spans: bool = True):
+    """Configure tracing for this process (service name and span export)"""
+    _tracer.configure(service, enabled, export_path, otlp_endpoint, log_spans)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+def current_request_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.request_id if span else None
+
+@contextmanager
+def start_span(name: str, kind: str = "internal", attributes: Optional[Dict[str, Any]] = None,
+               trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+               request_id: Optional[str] = None) -> Iterator[Span]:
+    """Start a span as a child of the current one (or of an explicit parent)"""
+    parent = _current_span.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        parent_id = parent.span_id if parent else None
+    if request_id is None:
+        request_id = parent.request_id if parent else generate_request_id()
+    span = Span(name, trace_id, parent_id, request_id, kind, _tracer.service, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.end(error=e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+def inject_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Add trace propagation headers for the current span to ``headers``"""
+    headers = dict(headers or {})
+    span = _current_span.get()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.traceparent
+        headers[REQUEST_ID_HEADER] = span.request_id
+    return headers
+
+class TracingMiddleware:
+    """ASGI middleware that joins or starts a trace for every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        parent = parse_traceparent(headers.get(TRACEPARENT_HEADER))
+        request_id = headers.get(REQUEST_ID_HEADER.lower()) or generate_request_id()
+        trace_id, parent_id = parent if parent else (None, None)
+        if trace_id is None:
+            trace_id = secrets.token_hex(16)
+
+        with start_span(f"{scope['method']} {scope['path']}", kind="server", trace_id=trace_id,
+                        parent_id=parent_id, request_id=request_id[:128]) as span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    response_headers = list(message.get("headers", []))
+                    response_headers.append((REQUEST_ID_HEADER.lower().encode(), span.request_id.encode("latin-1")))
+                    response_headers.append((TRACEPARENT_HEADER.encode(), span.traceparent.encode()))
+                    message = {**message, "headers": response_headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None and getattr(route, "path", None):
+                    span.name = f"{scope['method']} {route.path}"
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """httpx transport that records a client span and propagates the trace"""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not _tracer.enabled or _current_span.get() is None:
+            return await self._transport.handle_async_request(request)
+        with start_span(f"{request.method} {request.url.host}:{request.url.port}{request.url.path}", kind="client",
+                        attributes={"http.method": request.method, "http.url": str(request.url)}) as span:
+            request.headers.update(inject_headers())
+            response = await self._transport.handle_async_request(request)
+            span.set_attribute("http.status_code", response.status_code)
+            return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+def mount_transport(url: str, transport: Optional[httpx.AsyncBaseTransport]):
+    """Send traced clients' requests for ``url`` (e.g. ``http://localhost:8001``) through ``transport``
+
+    Used to run several services in one process, with ``httpx.ASGITransport``.
+    Pass ``None`` to remove the mount.
+    """
+    if transport is None:
+        _transport_mounts.pop(url, None)
+    else:
+        _transport_mounts[url] = transport
+
+# AsyncClient options that configure its default transport (kept for the client's proxy mounts too)
+_CLIENT_TRANSPORT_OPTIONS = ("verify", "cert", "http1", "http2", "limits", "trust_env")
+# Options only AsyncHTTPTransport accepts
+_TRANSPORT_OPTIONS = ("retries", "uds", "local_address", "socket_options")
+
+def traced_client(**kwargs) -> httpx.AsyncClient:
+    """Create an httpx.AsyncClient whose requests are traced
+
+    Transport options (``limits``, ``http2``, ``verify``, ``retries``, ...)
+    configure the wrapped transport as they would the client's own. An
+    explicit ``transport`` is wrapped as is.
+    """
+    transport = kwargs.pop("transport", None)
+    options = {name: kwargs[name] for name in _CLIENT_TRANSPORT_OPTIONS if name in kwargs}
+    options.update({name: kwargs.pop(name) for name in _TRANSPORT_OPTIONS if name in kwargs})
+    if transport is None:
+        transport = httpx.AsyncHTTPTransport(**options)
+    mounts = {url: TracingTransport(mounted) for url, mounted in _transport_mounts.items()}
+    return httpx.AsyncClient(transport=TracingTransport(transport), mounts=mounts or None, **kwargs)
+
+def setup_tracing(app, service: str, settings):
+    """Configure tracing from settings and add the middleware to ``app``"""
+    configure_tracing(
+        service,
+        enabled=settings.tracing_enabled,
+        export_path=settings.trace_export_path,
+        otlp_endpoint=settings.trace_otlp_endpoint
+    )
+    app.add_middleware(TracingMiddleware)
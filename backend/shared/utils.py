@@ -6,6 +6,8 @@ import asyncio
 import time
 import uuid
 
+from shared.metrics import track_upstream
+
 async def proxy_to_service(
     service_url: str,
     path: str,
@@ -18,8 +20,10 @@ async def proxy_to_service(
     
     full_url = f"{service_url.rstrip('/')}{path}"
     
+    from shared.tracing import traced_client
+    
     try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
+        async with traced_client(timeout=timeout) as client:
             if method.upper() == "GET":
                 response = await client.get(full_url, headers=headers)
             elif method.upper() == "POST":
@@ -120,13 +124,16 @@ async def resilient_service_call(
             detail=f"Service {service_name} is temporarily unavailable (circuit breaker open)"
         )
     
-    try:
-        result = await proxy_to_service(service_url, path, method, **kwargs)
-        circuit_breaker.on_success()
-        return result
-    except Exception as e:
-        circuit_breaker.on_failure()
-        raise e
+    with track_upstream(service_name, method) as call:
+        try:
+            result = await proxy_to_service(service_url, path, method, **kwargs)
+            call.status = 200
+            circuit_breaker.on_success()
+            return result
+        except Exception as e:
+            call.status = getattr(e, "status_code", None)
+            circuit_breaker.on_failure()
+            raise e
 
 def generate_request_id() -> str:
     """Generate unique request ID"""
@@ -0,0 +1,17 @@
+"""Import paths for the test suite
+
+Services import their helper modules by bare name (``from sketches import
+...``) from their own directory, and ``shared`` from the backend root, so
+tests put both on ``sys.path`` the same way.
+"""
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+SERVICE_DIRS = [BACKEND_DIR / "main-api"] + sorted((BACKEND_DIR / "microservices").glob("*-service"))
+
+# Service-local module names (other than main) do not clash, so every service directory can be on the path at once
+for path in [BACKEND_DIR] + SERVICE_DIRS:
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
@@ -0,0 +1,61 @@
+"""Dashboard view: order-independent tallies and reconciling against an offset"""
+from datetime import datetime, timedelta
+
+from dashboard_view import (SESSION_ENDED, SESSION_STARTED, TRANSACTION, USER_CREATED, USER_DELETED,
+                            DashboardMetricsView)
+
+def test_recount_in_flight_keeps_feed_events_exactly_once():
+    view = DashboardMetricsView()
+    for offset in (1, 2, 3):
+        view.apply(USER_CREATED, offset=offset)
+    # The recount is taken at offset 4 (one more user). Before its answer arrives,
+    # the feed delivers 5 (created) and 6 (deleted) and 7 (created)...
+    view.apply(USER_CREATED, offset=5)
+    view.apply(USER_DELETED, offset=6)
+    view.apply(USER_CREATED, offset=7)
+
+    drift = view.reconcile({"total_users": 4}, users_offset=4)
+    assert view.total_users == 5  # 4 counted, plus 5, 6 and 7 applied on top
+    assert drift["total_users"] == 1  # event 4, not seen yet
+
+    # ...and only then 4 itself, which the recount already included
+    view.apply(USER_CREATED, offset=4)
+    assert view.total_users == 5
+    view.apply(USER_CREATED, offset=8)
+    assert view.total_users == 6
+    assert view.status()["events_skipped"] == 1
+
+def test_recount_replaces_drifted_user_count():
+    view = DashboardMetricsView()
+    view.apply(USER_CREATED, offset=1)
+    drift = view.reconcile({"total_users": 10}, users_offset=9)
+    assert (view.total_users, drift["total_users"]) == (10, 9)
+    view.apply(USER_CREATED, offset=10)
+    assert view.reconcile({"total_users": 11}, users_offset=10)["total_users"] == 0
+
+def test_session_tally_does_not_depend_on_event_order():
+    view = DashboardMetricsView()
+    view.apply(SESSION_ENDED)  # arrives before its start
+    assert view.active_sessions == 0
+    view.apply(SESSION_STARTED)
+    view.apply(SESSION_STARTED)
+    assert view.active_sessions == 1
+    assert view.reconcile({})["active_sessions"] == 0
+
+def test_transactions_are_tallied_per_day():
+    view = DashboardMetricsView()
+    now = datetime.utcnow()
+    view.apply(TRANSACTION, value=3, timestamp=now)
+    view.apply(TRANSACTION, value=2, timestamp=now - timedelta(days=1))  # late, for yesterday
+    view.apply(TRANSACTION, value=5, timestamp=now - timedelta(days=3))  # too old to keep
+    assert view.daily_transactions == 3
+
+    view.daily_transactions = 42  # drifted
+    assert view.reconcile({})["daily_transactions"] == -39
+    assert view.snapshot()["daily_transactions"] == 3
+
+    view.reconcile({"daily_transactions": 7, "active_sessions": 2})
+    assert (view.daily_transactions, view.active_sessions) == (7, 2)
+    view.apply(TRANSACTION, timestamp=now)
+    view.apply(SESSION_ENDED)
+    assert (view.daily_transactions, view.active_sessions) == (8, 1)
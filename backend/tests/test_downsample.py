@@ -0,0 +1,29 @@
+"""Server-side downsampling of chart series"""
+import numpy as np
+import pytest
+
+from downsample import DOWNSAMPLING_METHODS, downsample
+
+@pytest.mark.parametrize("method", DOWNSAMPLING_METHODS)
+def test_non_finite_values_are_left_out(method):
+    x = np.arange(10_000, dtype=np.int64)
+    y = np.sin(x / 100.0)
+    y[::97] = np.nan
+    y[5] = np.inf
+    sampled_x, sampled_y = downsample(x, y, 100, method)
+    assert len(sampled_x) <= 100
+    assert np.isfinite(sampled_y).all()
+    assert np.array_equal(sampled_y, y[sampled_x])
+
+@pytest.mark.parametrize("method", DOWNSAMPLING_METHODS)
+def test_all_non_finite_series_is_empty(method):
+    x = np.arange(50, dtype=np.int64)
+    sampled_x, sampled_y = downsample(x, np.full(50, np.nan), 10, method)
+    assert len(sampled_x) == len(sampled_y) == 0
+
+def test_minmax_keeps_extremes_and_endpoints():
+    x = np.arange(1_000, dtype=np.int64)
+    y = np.zeros(1_000)
+    y[333], y[777] = 50.0, -50.0
+    sampled_x, sampled_y = downsample(x, y, 20, "minmax")
+    assert {0, 333, 777, 999} <= set(sampled_x.tolist())
@@ -0,0 +1,62 @@
+"""User event consumers: gap rebuilds are not double-applied"""
+import asyncio
+
+import httpx
+import pytest
+
+from shared import events
+from shared.events import EventFeedConsumer, _FeedConsumer
+
+class FeedEnd(Exception):
+    pass
+
+def event(offset: int):
+    return {"offset": offset, "type": "user.created", "user_id": offset, "user": {"username": f"u{offset}"}}
+
+def follow(monkeypatch, pages, on_gap):
+    """Run an EventFeedConsumer at offset 5 over ``pages``; returns it and the offsets it applied"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(dict(request.url.params))
+        if not pages:
+            raise FeedEnd()
+        return httpx.Response(200, json=pages.pop(0))
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(events, "traced_client", lambda **kwargs: httpx.AsyncClient(transport=transport, **kwargs))
+    applied = []
+    consumer = EventFeedConsumer("test", "http://users/events", lambda e: applied.append(e["offset"]),
+                                 on_gap=on_gap, offset=5)
+    with pytest.raises(FeedEnd):
+        asyncio.run(consumer._follow())
+    return consumer, applied, requests
+
+def test_gap_rebuild_skips_the_events_it_reflects(monkeypatch):
+    rebuilds = []
+    pages = [
+        {"events": [event(10), event(11), event(12)], "next_offset": 12, "first_offset": 10, "last_offset": 11},
+        {"events": [event(13)], "next_offset": 13, "first_offset": 10, "last_offset": 13},
+    ]
+    consumer, applied, requests = follow(monkeypatch, pages, lambda: rebuilds.append(True))
+    assert rebuilds == [True]
+    assert applied == [13]
+    assert consumer.offset == 13 and consumer.gaps == 1
+    assert [params["after"] for params in requests] == ["5", "12", "13"]
+
+def test_gap_handler_can_report_a_later_offset(monkeypatch):
+    pages = [
+        {"events": [event(10), event(11)], "next_offset": 11, "first_offset": 10, "last_offset": 11},
+        {"events": [event(14)], "next_offset": 14, "first_offset": 10, "last_offset": 14},
+    ]
+
+    async def rebuild():
+        return 13  # committed after the page was read, but already in the rebuilt state
+
+    consumer, applied, requests = follow(monkeypatch, pages, rebuild)
+    assert applied == [14]
+    assert [params["after"] for params in requests] == ["5", "13", "14"]
+
+def test_feed_consumer_needs_a_transport():
+    with pytest.raises(TypeError):
+        _FeedConsumer("test", print)
@@ -0,0 +1,67 @@
+"""Export Range support: header parsing, byte slicing and the length cache"""
+import pytest
+
+from export import (ANALYTICS_COLUMNS, ExportLengthCache, build_export_stream, iter_sample_analytics,
+                    parse_byte_range, slice_bytes, stream_length)
+
+PARTS = [b"abcd", b"", b"efg", b"hijklm"]
+BODY = b"".join(PARTS)
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-", (0, None)),
+    ("bytes=5-", (5, None)),
+    ("bytes=2-9", (2, 9)),
+    ("bytes=4-4", (4, 4)),
+    (" bytes=1-2", None),
+    ("bytes=-5", None),         # suffix ranges are not used for resume
+    ("bytes=0-1,4-5", None),    # nor are multi-ranges
+    ("bytes=9-2", None),
+    ("bytes=a-", None),
+    ("bytes=1-b", None),
+    ("items=0-5", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_byte_range(header, expected):
+    assert parse_byte_range(header) == expected
+
+@pytest.mark.parametrize("start, end", [(0, None), (3, None), (4, None), (5, 8), (0, 0), (6, 6), (12, None), (2, 100)])
+def test_slice_bytes_matches_slicing_the_body(start, end):
+    expected = BODY[start:] if end is None else BODY[start:end + 1]
+    assert b"".join(slice_bytes(iter(PARTS), start, end)) == expected
+
+def test_slice_bytes_past_the_end_is_empty():
+    assert b"".join(slice_bytes(iter(PARTS), len(BODY))) == b""
+
+def test_slice_bytes_stops_reading_after_the_range():
+    read = []
+
+    def parts():
+        for part in PARTS:
+            read.append(part)
+            yield part
+
+    assert b"".join(slice_bytes(parts(), 0, 2)) == b"abc"
+    assert read == [b"abcd", b""]
+
+def test_length_cache_records_only_complete_streams():
+    cache = ExportLengthCache(max_entries=2)
+    assert b"".join(cache.recording('"a"', iter(PARTS))) == BODY
+    assert cache.get('"a"') == len(BODY)
+
+    partial = cache.recording('"b"', iter(PARTS))
+    next(partial)
+    partial.close()
+    assert cache.get('"b"') is None
+
+    cache.put('"b"', 1)
+    cache.put('"c"', 2)
+    assert cache.get('"a"') is None  # least recently used is evicted
+    assert (cache.get('"b"'), cache.get('"c"')) == (1, 2)
+
+@pytest.mark.parametrize("format, compression", [("csv", "none"), ("ndjson", "gzip")])
+def test_export_streams_are_reproducible(format, compression):
+    factory = build_export_stream(lambda: iter_sample_analytics(500, 7), format, ANALYTICS_COLUMNS, compression)
+    body = b"".join(factory())
+    assert stream_length(factory) == len(body)
+    assert b"".join(slice_bytes(factory(), 100, 199)) == body[100:200]
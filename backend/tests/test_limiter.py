@@ -0,0 +1,163 @@
+"""Gateway concurrency limiter: limit adjustment, priority queueing, eviction and abandoned waits"""
+import asyncio
+
+import pytest
+
+from limiter import AIMDLimit, ConcurrencyLimiter, GradientLimit, Overloaded, create_limit
+
+class FixedLimit:
+    """A limit that never moves, so queueing can be tested on its own"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.updates = []
+
+    def update(self, rtt: float, inflight: int, dropped: bool):
+        self.updates.append((inflight, dropped))
+
+def test_aimd_grows_by_one_while_used_and_backs_off_on_drops():
+    limit = AIMDLimit(10, min_limit=2, max_limit=12, backoff=0.5)
+    limit.update(0.01, inflight=4, dropped=False)
+    assert limit.limit == 10  # less than half in use: no evidence the limit is too low
+    limit.update(0.01, inflight=5, dropped=False)
+    limit.update(0.01, inflight=9, dropped=False)
+    limit.update(0.01, inflight=9, dropped=False)
+    assert limit.limit == 12  # capped at max_limit
+    limit.update(0.01, inflight=12, dropped=True)
+    assert limit.limit == 6
+    for _ in range(5):
+        limit.update(0.01, inflight=1, dropped=True)
+    assert limit.limit == 2
+
+def test_gradient_grows_while_latency_holds_and_shrinks_when_it_rises():
+    limit = GradientLimit(20, min_limit=1, max_limit=200)
+    for _ in range(50):
+        limit.update(0.010, inflight=int(limit.limit), dropped=False)
+    grown = limit.limit
+    assert grown > 40
+
+    limit.update(0.010, inflight=1, dropped=False)
+    assert limit.limit == grown  # idle: the last good limit is kept
+
+    limit.update(0.100, inflight=int(grown), dropped=False)
+    assert grown * 0.85 < limit.limit < grown  # shrinks in proportion, by at most half a step
+    for _ in range(30):
+        limit.update(0.100, inflight=int(limit.limit), dropped=False)
+    assert limit.limit < grown / 2
+
+def test_gradient_drop_cuts_the_limit_whatever_the_latency():
+    limit = GradientLimit(100, min_limit=5, max_limit=200)
+    limit.update(0.010, inflight=10, dropped=True)
+    assert limit.limit == pytest.approx(100 * 0.8 + (50 + 10) * 0.2)
+    for _ in range(100):
+        limit.update(0.010, inflight=1, dropped=True)
+    assert limit.limit == 5
+
+def test_create_limit_rejects_unknown_algorithms():
+    assert isinstance(create_limit("aimd", 10, 1, 100), AIMDLimit)
+    with pytest.raises(ValueError):
+        create_limit("vegas", 10, 1, 100)
+
+async def queued(limiter: ConcurrencyLimiter, priority: str, timeout: float = 5.0) -> asyncio.Task:
+    """Start an acquire and let it reach the queue"""
+    task = asyncio.ensure_future(limiter.acquire(priority, timeout))
+    await asyncio.sleep(0)
+    return task
+
+def test_slots_go_to_the_most_important_waiter_first():
+    async def run():
+        limiter = ConcurrencyLimiter("data", FixedLimit(2), queue_size=10)
+        held = [await limiter.acquire(), await limiter.acquire()]
+        waiters = {}
+        for name, priority in [("bulk", "bulk"), ("normal1", "normal"), ("critical", "critical"), ("normal2", "normal")]:
+            waiters[await queued(limiter, priority)] = name
+        assert limiter.status()["waiting"] == 4
+
+        order = []
+        while waiters:
+            held.pop(0).release()
+            done, _ = await asyncio.wait(waiters, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+            assert len(done) == 1  # one freed slot, one waiter admitted
+            task = done.pop()
+            order.append(waiters.pop(task))
+            held.append(task.result())
+        for permit in held:
+            permit.release()
+        return order, limiter
+
+    order, limiter = asyncio.run(run())
+    assert order == ["critical", "normal1", "normal2", "bulk"]
+    assert (limiter.status()["inflight"], limiter.status()["waiting"]) == (0, 0)
+
+def test_full_queue_evicts_less_important_waiters_only():
+    async def run():
+        limiter = ConcurrencyLimiter("data", FixedLimit(1), queue_size=2)
+        permit = await limiter.acquire()
+        bulk = await queued(limiter, "bulk")
+        normal = await queued(limiter, "normal")
+
+        with pytest.raises(Overloaded) as rejected:
+            await limiter.acquire("bulk")  # nothing less important to evict
+        assert rejected.value.reason == "queue full"
+
+        critical = await queued(limiter, "critical")
+        with pytest.raises(Overloaded) as evicted:
+            await bulk
+        assert evicted.value.reason == "evicted for critical traffic"
+        assert evicted.value.retry_after >= 1
+        assert limiter.status()["waiting"] == 2
+
+        permit.release()
+        (await critical).release()
+        (await normal).release()
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert (limiter.status()["inflight"], limiter.status()["waiting"]) == (0, 0)
+
+def test_queue_timeout_sheds_and_leaves_the_queue():
+    async def run():
+        limiter = ConcurrencyLimiter("user", FixedLimit(1))
+        permit = await limiter.acquire()
+        with pytest.raises(Overloaded) as timed_out:
+            await limiter.acquire("normal", timeout=0.01)
+        assert timed_out.value.reason == "queue timeout"
+        assert limiter.status()["waiting"] == 0
+        permit.release()
+        (await limiter.acquire(timeout=0.01)).release()
+        return limiter
+
+    assert asyncio.run(run()).status()["inflight"] == 0
+
+def test_abandoned_waits_free_their_place_and_pass_on_granted_slots():
+    async def run():
+        limiter = ConcurrencyLimiter("user", FixedLimit(1))
+        permit = await limiter.acquire()
+        gone = await queued(limiter, "critical")
+        gone.cancel()  # the client disconnected while queued
+        await asyncio.sleep(0)
+        assert limiter.status()["waiting"] == 0
+
+        granted_too_late = await queued(limiter, "critical")
+        next_in_line = await queued(limiter, "normal")
+        permit.release()  # grants the slot to the critical waiter...
+        granted_too_late.cancel()  # ...which is cancelled before it can take it
+        with pytest.raises(asyncio.CancelledError):
+            await granted_too_late
+        (await asyncio.wait_for(next_in_line, 1)).release()
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert (limiter.status()["inflight"], limiter.status()["waiting"]) == (0, 0)
+
+def test_drops_reach_the_limit_algorithm():
+    async def run():
+        algorithm = FixedLimit(4)
+        limiter = ConcurrencyLimiter("auth", algorithm)
+        first, second = await limiter.acquire(), await limiter.acquire()
+        second.dropped = True  # e.g. an upstream 503
+        first.release()
+        second.release()
+        return algorithm.updates
+
+    assert asyncio.run(run()) == [(2, False), (1, True)]
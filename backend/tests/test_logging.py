@@ -0,0 +1,114 @@
+"""Logging pipeline: queue overflow policies and sampling"""
+import gc
+import io
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+
+from shared.logging_config import BoundedQueueHandler, JSONFormatter, get_logging_stats, setup_logging
+
+class BlockingStream:
+    """A stream whose writes wait until ``release`` is set (a stalled log collector)"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.lines = []
+
+    def write(self, text: str):
+        self.release.wait()
+        self.lines.extend(text.splitlines())
+
+    def flush(self):
+        pass
+
+def make_record(index: int) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, __file__, 0, "record %d", (index,), None)
+
+def test_drop_policy_discards_records_when_queue_is_full():
+    stream = BlockingStream()
+    handler = BoundedQueueHandler(stream, queue_size=4, overflow_policy="drop")
+    started = time.perf_counter()
+    for index in range(50):
+        handler.emit(make_record(index))
+    assert time.perf_counter() - started < 0.5  # never waits for the stalled stream
+    stream.release.set()
+    handler.flush()
+    handler.close()
+
+    stats = handler.stats()
+    assert stats["dropped"] > 0
+    assert stats["enqueued"] + stats["dropped"] == 50
+    assert stats["written"] == stats["enqueued"] == len(stream.lines)
+
+def test_block_policy_waits_for_space_instead_of_dropping():
+    stream = BlockingStream()
+    handler = BoundedQueueHandler(stream, queue_size=4, overflow_policy="block", block_timeout=5.0)
+    threading.Timer(0.2, stream.release.set).start()
+    started = time.perf_counter()
+    for index in range(50):
+        handler.emit(make_record(index))
+    assert time.perf_counter() - started >= 0.15  # emit blocked until the stream drained
+    handler.flush()
+    handler.close()
+
+    stats = handler.stats()
+    assert stats["dropped"] == 0
+    assert stats["written"] == 50
+    assert stream.lines == [f"record {index}" for index in range(50)]
+
+def test_block_policy_drops_after_timeout():
+    stream = BlockingStream()
+    handler = BoundedQueueHandler(stream, queue_size=2, overflow_policy="block", block_timeout=0.05)
+    for index in range(6):
+        handler.emit(make_record(index))
+    assert handler.stats()["dropped"] > 0
+    stream.release.set()
+    handler.close()
+
+def test_level_sample_rate_keeps_that_fraction():
+    random.seed(31)
+    stream = io.StringIO()
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    setup_logging("sampling-test", "DEBUG", sample_rates={"DEBUG": 0.1}, json_backend="json")
+    root.handlers[0].stream = stream
+    try:
+        logger = logging.getLogger("sampling-test.worker")
+        for index in range(5000):
+            logger.debug("debug %d", index)
+            logger.info("info %d", index)
+        levels = [json.loads(line)["level"] for line in stream.getvalue().splitlines()]
+        assert levels.count("INFO") == 5000
+        assert 400 <= levels.count("DEBUG") <= 600
+        assert get_logging_stats()["sampled_out"] == 5000 - levels.count("DEBUG")
+    finally:
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
+
+def test_replaced_async_handlers_are_released():
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    try:
+        setup_logging("replace-test", async_mode=True)
+        first = weakref.ref(root.handlers[0])
+        setup_logging("replace-test", async_mode=True)  # closes and replaces the first handler
+        current = root.handlers[0]
+        gc.collect()
+        assert first() is None  # neither atexit nor the fork hook holds it
+        assert current._writer.is_alive()
+        current._after_fork()
+        current.close()
+        current._after_fork()  # a closed handler does not restart its writer in a child
+        assert not current._writer.is_alive()
+    finally:
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
+
+def test_json_timestamps_are_utc():
+    formatter = JSONFormatter("json")
+    record = make_record(0)
+    record.created = 86400.25
+    assert json.loads(formatter.format(record))["timestamp"] == "1970-01-02T00:00:00.250000"
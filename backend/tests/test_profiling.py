@@ -0,0 +1,49 @@
+"""Slow-request capture: only slow, non-streamed requests are sampled and kept"""
+import asyncio
+from collections import deque
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from shared.profiling import AWAITING_FRAME, Sampler, SlowRequestMiddleware
+
+def make_app(sampler: Sampler, buffer: deque) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(SlowRequestMiddleware, sampler=sampler, threshold=0.05, buffer=buffer)
+
+    @app.get("/fast")
+    async def fast():
+        assert not sampler._watched  # not handed to the sampler before the threshold
+        return {"ok": True}
+
+    @app.get("/slow")
+    async def slow():
+        await asyncio.sleep(0.2)
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            for _ in range(3):
+                await asyncio.sleep(0.05)
+                yield b"data: {}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def test_only_slow_complete_responses_are_recorded():
+    sampler, buffer = Sampler(0.005), deque(maxlen=10)
+    app = make_app(sampler, buffer)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            for path in ("/fast", "/slow", "/stream"):
+                assert (await client.get(path)).status_code == 200
+
+    asyncio.run(run())
+    assert [entry["path"] for entry in buffer] == ["/slow"]
+    entry = buffer[0]
+    assert entry["duration_ms"] >= 200 and entry["samples"] > 0
+    assert all(stack.endswith(AWAITING_FRAME) for stack in entry["stacks"])
+    assert not sampler._watched
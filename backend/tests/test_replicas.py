@@ -0,0 +1,119 @@
+"""User-service read replicas: heartbeat lag, rotation and read-your-writes by outbox offset"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from database import WriteQueue, create_engines
+from outbox import USER_CREATED, OutboxBase, read_events, record_event
+from replicas import ReplicaSet, ReplicationBase, copy_sqlite_database
+
+SETTINGS = SimpleNamespace(sqlite_profile="tuned", sqlite_busy_timeout_ms=5000, sqlite_cache_size_kb=2048,
+                           sqlite_mmap_size=0, sqlite_read_pool_size=2, replica_max_lag_seconds=5.0,
+                           replica_check_seconds=1.0, replica_sync_seconds=0.0)
+
+@pytest.fixture
+def primary(tmp_path):
+    """(url, read sessions, running writer) for a scratch primary with the outbox and heartbeat tables"""
+    url = f"sqlite:///{tmp_path / 'users.db'}"
+    write_engine, read_engine = create_engines(url, SETTINGS)
+    for metadata in (OutboxBase.metadata, ReplicationBase.metadata):
+        metadata.create_all(write_engine)
+    writer = WriteQueue(sessionmaker(bind=write_engine, expire_on_commit=False))
+    writer.start()
+    yield url, sessionmaker(bind=read_engine), writer
+    writer.stop()
+    write_engine.dispose()
+    read_engine.dispose()
+
+def replica_set(tmp_path, primary, count: int = 1, **settings) -> ReplicaSet:
+    url, primary_reads, writer = primary
+    urls = [f"sqlite:///{tmp_path / f'replica{index}.db'}" for index in range(count)]
+    return ReplicaSet(urls, SimpleNamespace(**{**vars(SETTINGS), **settings}), url, primary_reads, writer)
+
+def replicate(replicas: ReplicaSet, *names: str):
+    """Copy the primary into the named replicas (all of them by default)"""
+    for replica in replicas.replicas:
+        if not names or replica.name in names:
+            copy_sqlite_database(replicas.primary_url, replica.url)
+
+def create_user_event(user_id: int):
+    def operation(db):
+        return record_event(db, USER_CREATED, user_id, {"id": user_id})
+    return operation
+
+def test_reads_after_a_write_wait_for_a_replica_holding_it(tmp_path, primary):
+    replicas = replica_set(tmp_path, primary)
+
+    async def run():
+        await replicas.check()
+        assert replicas.route()[0] == "primary"  # nothing replicated yet
+        assert replicas.status()["replicas"][0]["error"] is not None
+
+        replicate(replicas)
+        await replicas.check()
+        assert replicas.route()[0] == "replica0"
+
+        offset = await replicas.writer.submit(create_user_event(1))
+        assert replicas.route(offset)[0] == "primary"  # the replica has not seen the write
+        assert replicas.route()[0] == "replica0"       # reads without the header may be stale
+
+        replicate(replicas)
+        await replicas.check()
+        target, session_factory = replicas.route(offset)
+        assert target == "replica0"
+        db = session_factory()
+        try:
+            assert [event["offset"] for event in read_events(db, offset - 1, 10)] == [offset]
+        finally:
+            db.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        replicas.dispose()
+
+def test_lagging_replica_leaves_rotation(tmp_path, primary):
+    replicas = replica_set(tmp_path, primary, replica_max_lag_seconds=0.05)
+
+    async def run():
+        await replicas.check()
+        replicate(replicas)
+        await replicas.check()
+        assert replicas.route()[0] == "replica0"
+
+        await asyncio.sleep(0.1)  # no replication for longer than the lag limit
+        await replicas.check()
+        status = replicas.status()["replicas"][0]
+        assert not status["healthy"] and status["lag_seconds"] >= 0.05
+        assert replicas.route()[0] == "primary"
+
+        replicate(replicas)
+        await replicas.check()
+        assert replicas.route()[0] == "replica0"
+
+    try:
+        asyncio.run(run())
+    finally:
+        replicas.dispose()
+
+def test_reads_rotate_over_replicas_that_are_caught_up(tmp_path, primary):
+    replicas = replica_set(tmp_path, primary, count=2)
+
+    async def run():
+        await replicas.check()
+        replicate(replicas)
+        await replicas.check()
+        assert {replicas.route()[0] for _ in range(4)} == {"replica0", "replica1"}
+
+        offset = await replicas.writer.submit(create_user_event(1))
+        replicate(replicas, "replica1")
+        await replicas.check()
+        assert {replicas.route(offset)[0] for _ in range(4)} == {"replica1"}
+        assert [replica["position"] for replica in replicas.status()["replicas"]] == [0, offset]
+
+    try:
+        asyncio.run(run())
+    finally:
+        replicas.dispose()
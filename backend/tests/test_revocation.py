@@ -0,0 +1,110 @@
+"""Token revocation: Bloom prefilter, expiry, and the follower's confirmed lookups"""
+import asyncio
+import base64
+import json
+import time
+import uuid
+
+import httpx
+import pytest
+
+from shared import revocation
+from shared.revocation import SERVICE_TOKEN_HEADER, BloomFilter, RevocationFollower, RevocationList, bearer_jti
+
+def colliding_jti(bloom: BloomFilter, revoked: str) -> str:
+    """A jti that was never added but still passes the filter"""
+    while True:
+        jti = uuid.uuid4().hex
+        if jti != revoked and jti in bloom:
+            return jti
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(bits=4096, hashes=3)
+    keys = [uuid.uuid4().hex for _ in range(200)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    copy = BloomFilter.from_dict(bloom.to_dict())
+    assert all(key in copy for key in keys)
+
+def test_false_positive_is_settled_by_the_exact_set():
+    revocations = RevocationList(bits=16, hashes=1)
+    revoked = uuid.uuid4().hex
+    revocations.revoke(revoked, time.time() + 60)
+    innocent = colliding_jti(revocations.bloom, revoked)
+
+    assert revocations.is_revoked(revoked)
+    assert not revocations.is_revoked(innocent)
+    assert revocations.prefilter_hits == 2
+
+def test_revocations_expire_and_the_filter_is_rebuilt():
+    revocations = RevocationList()
+    now = time.time()
+    short, long = uuid.uuid4().hex, uuid.uuid4().hex
+    revocations.revoke(short, now + 10)
+    revocations.revoke(long, now + 1000)
+    revocations.revoke(uuid.uuid4().hex, now - 1)  # already expired: ignored
+    assert revocations.stats()["revoked"] == 2
+    version = revocations.version
+
+    revocations.prune(now + 11)
+    assert not revocations.is_revoked(short)
+    assert revocations.is_revoked(long)
+    assert short not in revocations.bloom  # half the filter was stale, so it was rebuilt
+    assert revocations.version != version
+
+def token(claims) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).rstrip(b"=").decode()
+    return f"Bearer header.{payload}.signature"
+
+def test_bearer_jti_accepts_only_issued_jtis():
+    jti = uuid.uuid4().hex
+    assert bearer_jti(token({"jti": jti})) == jti
+    assert bearer_jti(token({"jti": "../filter"})) is None
+    assert bearer_jti(token({"jti": jti.upper()})) is None
+    assert bearer_jti(token({"sub": "alice"})) is None
+    assert bearer_jti("Basic abc") is None
+    assert bearer_jti(None) is None
+
+@pytest.fixture
+def auth_service(monkeypatch):
+    """A fake auth service serving one RevocationList, recording the requests it gets"""
+    revocations = RevocationList(bits=16, hashes=1)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        path = request.url.raw_path.decode("ascii")
+        if path == "/revocations/filter":
+            return httpx.Response(200, json=revocations.snapshot(), headers={"ETag": f'W/"{revocations.version}"'})
+        jti = path.split("/revocations/", 1)[1]
+        return httpx.Response(200, json={"jti": jti, "revoked": revocations.is_revoked(jti)})
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(revocation, "traced_client", lambda **kwargs: httpx.AsyncClient(transport=transport, **kwargs))
+    return revocations, requests
+
+def test_follower_confirms_filter_hits(auth_service):
+    revocations, requests = auth_service
+    revoked = uuid.uuid4().hex
+    revocations.revoke(revoked, time.time() + 60)
+    innocent = colliding_jti(revocations.bloom, revoked)
+
+    async def run():
+        follower = RevocationFollower("http://auth", service_token="s3cret")
+        follower.start()
+        try:
+            await follower.refresh()
+            assert await follower.is_revoked(revoked)
+            assert not await follower.is_revoked(innocent)
+            assert not await follower.is_revoked(innocent)  # cached until the next filter
+            # A jti the filter lets through is escaped, so it cannot reach another endpoint
+            follower.bloom.add("../filter?x")
+            await follower.is_revoked("../filter?x")
+        finally:
+            await follower.stop()
+
+    asyncio.run(run())
+    lookups = [request.url.raw_path.decode() for request in requests if request.url.raw_path != b"/revocations/filter"]
+    assert lookups == [f"/revocations/{revoked}", f"/revocations/{innocent}", "/revocations/..%2Ffilter%3Fx"]
+    assert all(request.headers[SERVICE_TOKEN_HEADER] == "s3cret" for request in requests)
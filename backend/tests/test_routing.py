@@ -0,0 +1,91 @@
+"""Gateway routing: longest-prefix matching, path normalisation and redirect mapping"""
+import pytest
+
+from routing import RouteRule, RouteTable, path_segments
+
+SERVICE_URLS = {"user": "http://user-service:8001", "data": "http://data-service:8003/"}
+
+TABLE = RouteTable([
+    RouteRule("/api/users", "user", "/users", methods={"GET", "POST"}),
+    RouteRule("/api/users/me", "user", "/profile"),
+    RouteRule("/api/data", "data"),
+    RouteRule("/api/data/export", "data", "/export", stream=True),
+])
+
+@pytest.mark.parametrize("method, path, prefix, upstream_path", [
+    ("GET", "/api/users", "/api/users", "/users"),
+    ("POST", "/api/users/7", "/api/users", "/users/7"),
+    ("GET", "/api/users/me", "/api/users/me", "/profile"),        # the longest prefix wins
+    ("GET", "/api/users/me/settings", "/api/users/me", "/profile/settings"),
+    ("GET", "/api/users/meX", "/api/users", "/users/meX"),        # prefixes match whole segments
+    ("GET", "/api/data", "/api/data", "/"),
+    ("GET", "/api/data/export/csv", "/api/data/export", "/export/csv"),
+])
+def test_longest_prefix_match(method, path, prefix, upstream_path):
+    match = TABLE.match(method, path)
+    assert (match.rule.prefix, match.upstream_path) == (prefix, upstream_path)
+
+@pytest.mark.parametrize("path", ["/api/usersX", "/api", "/", "/other/users"])
+def test_unmatched_paths(path):
+    assert TABLE.match("GET", path) is None
+
+def test_disallowed_method_reports_what_is_allowed():
+    match = TABLE.match("DELETE", "/api/users/7")
+    assert match.rule is None
+    assert match.allowed == {"GET", "POST"}
+    assert match.upstream_path == "/users/7"
+    assert TABLE.match("POST", "/api/users/me").allowed == {"GET"}  # the longest prefix decides, not a shorter one
+
+@pytest.mark.parametrize("path, upstream_path", [
+    ("/api/users/", "/users"),
+    ("//api//users//7/", "/users/7"),
+    ("/api/users/a%2Fb", "/users/a%2Fb"),  # escapes pass through untouched
+])
+def test_paths_are_normalised(path, upstream_path):
+    assert TABLE.match("GET", path).upstream_path == upstream_path
+
+@pytest.mark.parametrize("path", ["/api/data/../users", "/api/users/./7", "/api/data/%2e%2e/users", "/api/data/.%2E"])
+def test_dot_segments_are_rejected(path):
+    with pytest.raises(ValueError):
+        TABLE.match("GET", path)
+
+def test_path_segments_keeps_dots_inside_names():
+    assert path_segments("/files/v1.2/..x/") == ["files", "v1.2", "..x"]
+
+def test_rules_are_validated():
+    with pytest.raises(ValueError):
+        RouteRule("api/users", "user")
+    with pytest.raises(ValueError):
+        RouteRule("/api/users", "user", cache="forever")
+    with pytest.raises(ValueError):
+        RouteTable([RouteRule("/api/a", "user"), RouteRule("/api/a/", "data")])
+    rule = RouteRule.from_dict({"prefix": "/api/reports/", "service": "data", "methods": ["get", "post"]})
+    assert (rule.prefix, rule.methods) == ("/api/reports", {"GET", "POST"})
+
+@pytest.mark.parametrize("service, upstream_path, gateway_path", [
+    ("user", "/users/7", "/api/users/7"),
+    ("user", "/profile", "/api/users/me"),
+    ("data", "/export/csv", "/api/data/export/csv"),   # the longest upstream prefix wins
+    ("data", "/realtime", "/api/data/realtime"),
+    ("user", "/usersX", None),
+    ("auth", "/login", None),
+])
+def test_gateway_path_inverts_the_upstream_mapping(service, upstream_path, gateway_path):
+    assert TABLE.gateway_path(service, upstream_path) == gateway_path
+    if gateway_path is not None:
+        match = TABLE.match("GET", gateway_path)
+        assert (match.rule.service, match.upstream_path) == (service, upstream_path)
+
+@pytest.mark.parametrize("location, expected", [
+    ("http://user-service:8001/users/7?tab=1#top", "/api/users/7?tab=1#top"),
+    ("/users/8", "/api/users/8"),                    # relative to the upstream request
+    ("9", "/api/users/9"),
+    ("http://data-service:8003/export/x", "/api/data/export/x"),
+    ("http://user-service:8001/internal", None),     # a service path no route leads to
+    ("/users/../../internal", None),
+    ("/users/%2e%2e/admin", None),
+    ("https://example.com/login", "https://example.com/login"),
+])
+def test_gateway_location_maps_service_redirects(location, expected):
+    request_url = "http://user-service:8001/users/6"
+    assert TABLE.gateway_location(SERVICE_URLS, request_url, location) == expected
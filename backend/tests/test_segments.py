@@ -0,0 +1,173 @@
+"""Segment store: flush, compaction, crash recovery, index skipping and concurrency"""
+import math
+import threading
+
+import numpy as np
+import pytest
+
+from segments import SegmentStore
+
+DAY_MS = 86_400_000
+BASE = 1_760_000_000_000 - 1_760_000_000_000 % DAY_MS  # start of a partition
+
+def append_batch(store: SegmentStore, start: int, rows: int, metric: str = "cpu", category: str = "web"):
+    timestamps = start + np.arange(rows, dtype=np.int64) * 1000
+    store.append(timestamps, [metric] * rows, [category] * rows, np.arange(rows, dtype=np.float64))
+    return timestamps
+
+def test_flush_compact_reopen_round_trip(tmp_path):
+    store = SegmentStore(tmp_path, compact_min_segments=3)
+    store.open()
+    written = [append_batch(store, BASE + batch * 100_000, 100, metric=f"m{batch % 2}") for batch in range(4)]
+    store.flush()
+    assert store.stats()["segments"] == 1  # one flush, one partition
+
+    for batch in range(4, 8):
+        written.append(append_batch(store, BASE + batch * 100_000, 100, metric=f"m{batch % 2}"))
+        store.flush()
+    before = store.scan()
+    assert store.stats()["segments"] == 5
+
+    assert store.compact() == 5
+    assert store.stats()["segments"] == 1
+    compacted = store.scan()
+    np.testing.assert_array_equal(compacted.timestamps, before.timestamps)
+    np.testing.assert_array_equal(compacted.values, before.values)
+    np.testing.assert_array_equal(compacted.timestamps, np.concatenate(written))
+
+    store.close()
+    reopened = SegmentStore(tmp_path)
+    reopened.open()
+    assert reopened.stats()["rows"] == 800
+    np.testing.assert_array_equal(reopened.scan(metric="m1").timestamps,
+                                  np.concatenate(written[1::2]))
+
+def test_reopen_finishes_interrupted_compaction(tmp_path):
+    store = SegmentStore(tmp_path, compact_min_segments=3)
+    store.open()
+    for batch in range(3):
+        append_batch(store, BASE + batch * 100_000, 50)
+        store.flush()
+    expected = store.scan()
+    partition, segments = next(iter(store._partitions.items()))
+    # Crash after the merged segment is written, before the old ones are swapped out and deleted
+    merged = store._merge(partition, segments)
+    (merged.path.parent / "seg-99999999.tmp").write_bytes(b"half-written")
+    assert len(list(merged.path.parent.iterdir())) == 5
+    store.close()
+
+    reopened = SegmentStore(tmp_path)
+    reopened.open()
+    assert sorted(path.name for path in merged.path.parent.iterdir()) == [merged.path.name]
+    assert reopened.stats()["segments"] == 1
+    result = reopened.scan()
+    np.testing.assert_array_equal(result.timestamps, expected.timestamps)
+    np.testing.assert_array_equal(result.values, expected.values)
+
+def test_scan_skips_segments_by_index(tmp_path):
+    store = SegmentStore(tmp_path)
+    store.open()
+    for day in range(3):
+        append_batch(store, BASE + day * DAY_MS, 100, metric="cpu")
+        append_batch(store, BASE + day * DAY_MS + 500_000, 100, metric="memory", category="db")
+        store.flush()
+    assert store.stats()["partitions"] == 3
+
+    second_day = store.scan(BASE + DAY_MS, BASE + 2 * DAY_MS)
+    assert (second_day.segments_scanned, second_day.segments_skipped) == (1, 2)
+    assert len(second_day.timestamps) == 200
+
+    missing = store.scan(metric="disk")
+    assert (missing.segments_scanned, missing.segments_skipped) == (0, 3)
+
+    by_category = store.scan(BASE, BASE + DAY_MS, category="db")
+    assert (by_category.segments_scanned, by_category.segments_skipped) == (1, 2)
+    assert len(by_category.timestamps) == 100
+
+@pytest.mark.parametrize("value", [math.nan, math.inf])
+def test_non_finite_values_are_rejected(tmp_path, value):
+    store = SegmentStore(tmp_path)
+    store.open()
+    with pytest.raises(ValueError):
+        store.append([BASE], ["cpu"], ["web"], [value])
+    assert store.stats()["buffered_rows"] == 0
+
+def test_scan_reads_segments_removed_by_compaction(tmp_path):
+    store = SegmentStore(tmp_path, compact_min_segments=2)
+    store.open()
+    for batch in range(2):
+        append_batch(store, BASE + batch * 100_000, 50)
+        store.flush()
+    old = [segment for segments in store._partitions.values() for segment in segments]
+    expected = np.concatenate([segment.column("value") for segment in old])
+
+    store.compact()
+    assert not any(segment.path.exists() for segment in old)
+    # A scan that took its snapshot before the compaction still reads the unlinked files
+    np.testing.assert_array_equal(np.concatenate([segment.column("value") for segment in old]), expected)
+
+def test_scan_while_compacting(tmp_path):
+    store = SegmentStore(tmp_path, compact_min_segments=2)
+    store.open()
+    append_batch(store, BASE, 100)
+    store.flush()
+    done = threading.Event()
+    errors = []
+
+    def maintain():
+        try:
+            for batch in range(1, 60):
+                append_batch(store, BASE + batch * 100_000, 100)
+                store.flush()
+                store.compact()
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=maintain)
+    thread.start()
+    counts = []
+    while not done.is_set():
+        result = store.scan()
+        assert np.all(np.diff(result.timestamps) > 0)  # no row seen twice
+        counts.append(len(result.timestamps))
+    thread.join()
+    assert not errors
+    assert counts == sorted(counts)
+    assert len(store.scan().timestamps) == 6000
+
+def test_failed_partition_write_requeues_only_its_rows(tmp_path, monkeypatch):
+    import segments
+
+    store = SegmentStore(tmp_path)
+    store.open()
+    append_batch(store, BASE, 100)
+    append_batch(store, BASE + DAY_MS, 100)
+    write_segment = segments.write_segment
+    calls = []
+
+    def fail_second(path, *args, **kwargs):
+        calls.append(path)
+        if len(calls) == 2:
+            raise OSError("disk full")
+        return write_segment(path, *args, **kwargs)
+
+    monkeypatch.setattr(segments, "write_segment", fail_second)
+    with pytest.raises(OSError):
+        store.flush()
+    assert store.stats()["segments"] == 1
+    assert store.stats()["buffered_rows"] == 100
+    assert len(store.scan().timestamps) == 200
+
+    assert store.flush() == 100
+    assert store.stats()["segments"] == 2
+    assert len(store.scan().timestamps) == 200
+
+def test_data_directory_has_one_owner(tmp_path):
+    store = SegmentStore(tmp_path)
+    store.open()
+    with pytest.raises(RuntimeError):
+        SegmentStore(tmp_path).open()
+    store.close()
+    SegmentStore(tmp_path).open()
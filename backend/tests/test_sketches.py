@@ -0,0 +1,74 @@
+"""Error bounds and merge behaviour of the rollup sketches"""
+import math
+import random
+
+import pytest
+
+from rollups import RollupStore
+from sketches import DDSketch, HyperLogLog
+
+def test_ddsketch_quantiles_within_relative_accuracy():
+    rng = random.Random(29)
+    values = [rng.lognormvariate(3, 1.5) for _ in range(20_000)] + [-rng.expovariate(0.1) for _ in range(5_000)]
+    sketch = DDSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    ordered = sorted(values)
+    for q in (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 0.999):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= sketch.relative_accuracy * abs(exact) + 1e-12
+
+def test_hyperloglog_error_within_three_standard_errors():
+    precision = 12
+    bound = 3 * 1.04 / math.sqrt(2 ** precision)
+    for distinct in (1_000, 10_000, 100_000):
+        hll = HyperLogLog(precision)
+        hll.update(f"user-{i}" for i in range(distinct))
+        assert abs(hll.count() - distinct) / distinct <= bound
+
+def test_merge_matches_single_sketch():
+    rng = random.Random(7)
+    values = [rng.gauss(100, 30) for _ in range(10_000)]
+    whole, left, right = DDSketch(), DDSketch(), DDSketch()
+    for index, value in enumerate(values):
+        whole.add(value)
+        (left if index % 3 else right).add(value)
+    merged = left.merge(right)
+    assert merged.count == whole.count
+    assert merged.min == whole.min and merged.max == whole.max
+    assert [merged.quantile(q) for q in (0.1, 0.5, 0.9, 0.99)] == [whole.quantile(q) for q in (0.1, 0.5, 0.9, 0.99)]
+
+    users, first, second = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    for i in range(50_000):
+        users.add(i)
+        (first if i < 30_000 else second).add(i)
+    assert first.merge(second).count() == users.count()
+
+@pytest.mark.parametrize("value", [math.nan, math.inf, -math.inf])
+def test_ddsketch_rejects_non_finite_values(value):
+    sketch = DDSketch()
+    with pytest.raises(ValueError):
+        sketch.add(value)
+    assert sketch.count == 0
+
+def test_collapse_bounds_bins_when_most_are_negative():
+    values = [-(1.05 ** exponent) for exponent in range(400)] + [1.05 ** exponent for exponent in range(10)]
+    sketch = DDSketch(relative_accuracy=0.01, max_bins=64)
+    for value in values:
+        sketch.add(value)
+    assert len(sketch._positive) + len(sketch._negative) <= 64
+    assert sketch.count == len(values)
+    # Collapsing starts from the most negative values, so the top of the distribution stays exact to alpha
+    exact = sorted(values)[int(0.99 * (len(values) - 1))]
+    assert sketch.quantile(0.99) == pytest.approx(exact, rel=sketch.relative_accuracy)
+
+def test_merge_serialized_is_all_or_nothing():
+    source, target = RollupStore(bucket_seconds=60), RollupStore(bucket_seconds=60)
+    source.record("latency", 12.5, user_id="a")
+    buckets = source.export("latency")
+    with pytest.raises(ValueError):
+        target.merge_serialized("latency", buckets + [{**buckets[0], "start": 61}])
+    assert target.metrics() == []
+    assert target.merge_serialized("latency", buckets) == 1
+    assert target.query("latency")["count"] == 1
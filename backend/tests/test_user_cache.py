@@ -0,0 +1,36 @@
+"""Auth service user cache: LRU bound, TTL and invalidation by id"""
+import time
+
+from user_cache import UserInfoCache
+
+def user(user_id: int, username: str):
+    return {"id": user_id, "username": username}
+
+def test_least_recently_used_entries_are_evicted():
+    cache = UserInfoCache(max_entries=2)
+    cache.put("alice", user(1, "alice"))
+    cache.put("bob", user(2, "bob"))
+    assert cache.get("alice") is not None  # alice is now the most recent
+    cache.put("carol", user(3, "carol"))
+    assert len(cache) == 2
+    assert cache.get("bob") is None
+    assert cache.get("alice") and cache.get("carol")
+
+def test_entries_expire(monkeypatch):
+    cache = UserInfoCache(ttl=60)
+    cache.put("alice", user(1, "alice"))
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert cache.get("alice") is None
+    assert len(cache) == 0
+
+def test_invalidate_by_id_finds_renamed_users():
+    cache = UserInfoCache()
+    cache.put("alice", user(1, "alice"))
+    cache.put("bob", user(2, "bob"))
+    # The event carries the user after the change: renamed from alice to alicia
+    cache.invalidate("alicia", 1)
+    assert cache.get("alice") is None
+    assert cache.get("bob") is not None
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,148 @@
+"""User-service write path: group commit, per-write savepoints and the inline writer"""
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from database import InlineWriter, WriteQueue, create_engines
+
+metadata = MetaData()
+items = Table("items", metadata, Column("id", Integer, primary_key=True), Column("name", String, unique=True))
+
+def sqlite_settings(profile: str) -> SimpleNamespace:
+    return SimpleNamespace(sqlite_profile=profile, sqlite_busy_timeout_ms=5000, sqlite_cache_size_kb=2048,
+                           sqlite_mmap_size=0, sqlite_read_pool_size=2)
+
+@pytest.fixture
+def sessions(tmp_path):
+    write_engine, read_engine = create_engines(f"sqlite:///{tmp_path / 'users.db'}", sqlite_settings("tuned"))
+    metadata.create_all(write_engine)
+    yield sessionmaker(bind=write_engine, expire_on_commit=False), read_engine
+    write_engine.dispose()
+    read_engine.dispose()
+
+def add(name: str):
+    def operation(session):
+        session.execute(insert(items).values(name=name))
+        return name
+    return operation
+
+def stored_names(read_engine):
+    with read_engine.connect() as conn:
+        return sorted(conn.execute(select(items.c.name)).scalars())
+
+async def submit_while_blocked(writer: WriteQueue, operations):
+    """Hold the writer in a first write until ``operations`` have queued, so they form one batch"""
+    running, release = threading.Event(), threading.Event()
+
+    def blocker(session):
+        running.set()
+        release.wait(5)
+        return "blocker"
+
+    first = asyncio.ensure_future(writer.submit(blocker))
+    while not running.is_set():
+        await asyncio.sleep(0.001)
+    rest = [asyncio.ensure_future(writer.submit(operation)) for operation in operations]
+    await asyncio.sleep(0)
+    while writer.stats()["queued"] < len(operations):
+        await asyncio.sleep(0.001)
+    release.set()
+    return await asyncio.gather(first, *rest, return_exceptions=True)
+
+def test_queued_writes_share_one_commit(sessions):
+    session_factory, read_engine = sessions
+    writer = WriteQueue(session_factory, max_batch=64)
+    writer.start()
+    try:
+        results = asyncio.run(submit_while_blocked(writer, [add(f"user{index}") for index in range(20)]))
+    finally:
+        writer.stop()
+
+    assert results == ["blocker"] + [f"user{index}" for index in range(20)]
+    assert stored_names(read_engine) == sorted(f"user{index}" for index in range(20))
+    stats = writer.stats()
+    assert (stats["batches"], stats["operations"], stats["largest_batch"]) == (2, 21, 20)
+
+def test_batches_are_capped_at_max_batch(sessions):
+    session_factory, read_engine = sessions
+    writer = WriteQueue(session_factory, max_batch=8)
+    writer.start()
+    try:
+        asyncio.run(submit_while_blocked(writer, [add(f"user{index}") for index in range(20)]))
+    finally:
+        writer.stop()
+    assert writer.stats()["largest_batch"] == 8
+    assert len(stored_names(read_engine)) == 20
+
+def test_failed_write_rolls_back_only_its_savepoint(sessions):
+    session_factory, read_engine = sessions
+
+    def add_then_fail(session):
+        session.execute(insert(items).values(name="half-done"))
+        raise ValueError("rejected")
+
+    writer = WriteQueue(session_factory)
+    writer.start()
+    try:
+        results = asyncio.run(submit_while_blocked(writer, [add("a"), add_then_fail, add("b"), add("a"), add("c")]))
+    finally:
+        writer.stop()
+
+    assert isinstance(results[2], ValueError)
+    assert isinstance(results[4], Exception)  # duplicate name: an IntegrityError for that write alone
+    assert [results[1], results[3], results[5]] == ["a", "b", "c"]
+    assert stored_names(read_engine) == ["a", "b", "c"]
+    assert writer.stats()["batches"] == 2
+
+def test_failed_commit_fails_every_write_in_the_batch(sessions, monkeypatch):
+    session_factory, read_engine = sessions
+
+    def failing_factory():
+        session = session_factory()
+        monkeypatch.setattr(session, "commit", lambda: (_ for _ in ()).throw(RuntimeError("disk full")))
+        return session
+
+    writer = WriteQueue(failing_factory)
+    writer.start()
+    try:
+        results = asyncio.run(submit_while_blocked(writer, [add("a"), add("b")]))
+    finally:
+        writer.stop()
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert stored_names(read_engine) == []
+
+def test_stop_commits_what_is_queued(sessions):
+    session_factory, read_engine = sessions
+    writer = WriteQueue(session_factory)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await writer.submit(add("early"))
+        writer.start()
+        pending = [asyncio.ensure_future(writer.submit(add(f"user{index}"))) for index in range(5)]
+        await asyncio.sleep(0)
+        await asyncio.get_running_loop().run_in_executor(None, writer.stop)
+        return await asyncio.gather(*pending)
+
+    assert asyncio.run(run()) == [f"user{index}" for index in range(5)]
+    assert len(stored_names(read_engine)) == 5
+
+def test_inline_writer_commits_each_write(tmp_path):
+    engine, read_engine = create_engines(f"sqlite:///{tmp_path / 'users.db'}", sqlite_settings("default"))
+    assert engine is read_engine
+    metadata.create_all(engine)
+    writer = InlineWriter(sessionmaker(bind=engine))
+
+    async def run():
+        assert await writer.submit(add("a")) == "a"
+        with pytest.raises(Exception):
+            await writer.submit(add("a"))
+        return await writer.submit(add("b"))
+
+    assert asyncio.run(run()) == "b"
+    assert stored_names(engine) == ["a", "b"]
+    engine.dispose()